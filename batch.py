@@ -0,0 +1,131 @@
+# Ricky Galliani
+# Hanna
+# batch.py
+
+from src.deposit import Deposit
+from src.portfolio import Portfolio
+from src.util import difference_in_millis, latency_str
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import argparse
+import json
+import logging
+import os
+
+log = logging.getLogger(__name__)
+
+
+def load_accounts(accounts_file: str) -> List[Dict[str, Any]]:
+    """
+    Loads the accounts to plan from the given file, a JSON list with the
+    "name", "config" (path of the account's portfolio.json) and "data" (the
+    account's snapshot directory) of each account, plus an optional "amount"
+    to deposit (all of the account's cash by default).
+    """
+    with open(accounts_file, "r") as f:
+        accounts: List[Dict[str, Any]] = json.load(f)
+    for a in accounts:
+        # Sanity check for accounts file format
+        assert "name" in a
+        assert "config" in a
+        assert "data" in a
+    return accounts
+
+
+def plan_account(
+    name: str,
+    config_file: str,
+    data_dir: str,
+    amount: Optional[float] = None,
+    fractional: bool = False,
+) -> Tuple[str, Deposit, float]:
+    """
+    Loads the account's portfolio configuration and latest snapshots and
+    plans its deposit of amount (or all of its cash). Returns the account
+    name, the deposit and how long planning took in milliseconds.
+    """
+    s: datetime = datetime.now()
+    portfolio: Portfolio = Portfolio()
+    with open(config_file, "r") as f:
+        portfolio.load_configuration(json.load(f))
+    portfolio.refresh(False, False, data_dir)
+    deposit: Deposit = portfolio.plan_deposit(
+        portfolio.get_cash() if amount is None else amount,
+        fractional=fractional,
+    )
+    e: datetime = datetime.now()
+    return (name, deposit, difference_in_millis(s, e))
+
+
+def plan_accounts(
+    accounts: List[Dict[str, Any]],
+    max_workers: Optional[int] = None,
+    fractional: bool = False,
+) -> Tuple[Dict[str, Deposit], Dict[str, float]]:
+    """
+    Plans the deposit of every account (see load_accounts()) in a pool of
+    max_workers processes (one per CPU by default). Planning is CPU bound
+    pure Python, so the accounts are planned in separate processes rather
+    than threads. Returns the deposit and planning latency in milliseconds of
+    each account by name.
+    """
+    s: datetime = datetime.now()
+    deposits: Dict[str, Deposit] = {}
+    latencies: Dict[str, float] = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = [
+            pool.submit(
+                plan_account,
+                a["name"],
+                a["config"],
+                a["data"],
+                a.get("amount"),
+                fractional,
+            )
+            for a in accounts
+        ]
+        for future in futures:
+            (name, deposit, latency) = future.result()
+            deposits[name] = deposit
+            latencies[name] = latency
+    e: datetime = datetime.now()
+    log.info(
+        "Planned deposits for {} accounts. ({}, {:.0f} ms summed across "
+        "accounts)".format(
+            len(accounts), latency_str(s, e), sum(latencies.values())
+        )
+    )
+    return (deposits, latencies)
+
+
+if __name__ == "__main__":
+
+    logging.basicConfig(
+        format="%(asctime)-15s %(levelname)s: %(message)s", level=logging.INFO
+    )
+
+    parser = argparse.ArgumentParser(description="Hanna batch planner.")
+    parser.add_argument(
+        "--accounts",
+        required=False,
+        default=os.path.join(os.getcwd(), "config", "accounts.json"),
+    )
+    parser.add_argument("--workers", required=False, default=None, type=int)
+    parser.add_argument(
+        "--fractional", required=False, default=False, action="store_true"
+    )
+
+    args = parser.parse_args()
+
+    (deposits, latencies) = plan_accounts(
+        load_accounts(args.accounts), args.workers, args.fractional
+    )
+    for (name, deposit) in deposits.items():
+        log.info(
+            "Deposit for {} ({:.0f} ms):{}".format(
+                name, latencies[name], deposit.for_display()
+            )
+        )
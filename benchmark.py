@@ -0,0 +1,547 @@
+# Ricky Galliani
+# Hanna
+# benchmark.py
+
+from fake_broker import make_dividend
+from src.api import load_dividends, load_holdings
+from src.asset_class import AssetClass
+from src.cassette import Cassette
+from src.deposit import Deposit
+from src.knapsack import LARGE_BUDGET
+from src.portfolio import Portfolio
+from src.purchase import Purchase
+from src.security import Security
+from src.session import API_URL, configure_replay
+from src.snapshot_store import (
+    SNAPSHOT_CODECS,
+    SNAPSHOT_DB,
+    TREE_FILE_FORMAT,
+    save_snapshot,
+)
+from src.util import difference_in_millis
+
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import argparse
+import json
+import logging
+import os
+import random
+import robin_stocks.helper
+import tempfile
+import tracemalloc
+import uuid
+
+log = logging.getLogger(__name__)
+
+# Solvers benchmarked, i.e. the plan_purchases() engines plus fractional mode
+SOLVERS: List[str] = ["dp", "numpy", "bitset", "bnb", "auto", "fractional"]
+
+# Security counts, budgets (in dollars) and price ranges (in dollars)
+# benchmarked by default
+SECURITY_COUNTS: List[int] = [1, 5, 20, 50]
+BUDGETS: List[float] = [10.0, 1000.0, 100000.0, 1000000.0]
+PRICE_SPREADS: Dict[str, Tuple[float, float]] = {
+    "cheap": (1.0, 50.0),
+    "expensive": (200.0, 5000.0),
+}
+
+# Largest budget (in cents) each table solver is run with, so the suite
+# finishes in minutes instead of hours (see too_large())
+MAX_TABLE_BUDGET: Dict[str, int] = {
+    "dp": 1000000,
+    "numpy": 10000000,
+    "bitset": 10000000,
+}
+
+# Number of asset classes in the benchmarked portfolios
+NUM_ASSET_CLASSES: int = 4
+
+# Snapshot layouts compared by benchmark_snapshots(): the pretty-printed JSON
+# files of the old directory tree, then the store with each codec
+SNAPSHOT_LAYOUTS: List[str] = ["tree"] + SNAPSHOT_CODECS
+
+
+def make_securities(
+    num_securities: int, spread: Tuple[float, float], seed: int
+) -> List[Security]:
+    """
+    Returns num_securities securities with random whole cent prices in the
+    given range (in dollars). The same seed always gives the same prices.
+    """
+    rng: random.Random = random.Random(seed)
+    (low, high) = spread
+    return [
+        Security(
+            "sec{}".format(i),
+            "SEC{}".format(i),
+            "sec{}_name".format(i),
+            rng.randint(int(low * 100), int(high * 100)) / 100.0,
+            False,
+        )
+        for i in range(num_securities)
+    ]
+
+
+def make_asset_class(
+    num_securities: int, spread: Tuple[float, float], seed: int
+) -> AssetClass:
+    """
+    Returns an asset class of num_securities synthetic securities (see
+    make_securities()).
+    """
+    ac: AssetClass = AssetClass("ac", 1.0)
+    for sec in make_securities(num_securities, spread, seed):
+        ac.add_security(sec)
+    return ac
+
+
+def make_portfolio(
+    num_securities: int, spread: Tuple[float, float], seed: int, cash: float
+) -> Portfolio:
+    """
+    Returns a portfolio with cash and NUM_ASSET_CLASSES equally weighted
+    asset classes of num_securities synthetic securities each.
+    """
+    p: Portfolio = Portfolio()
+    for i in range(NUM_ASSET_CLASSES):
+        ac: AssetClass = AssetClass("ac{}".format(i), 1.0 / NUM_ASSET_CLASSES)
+        for sec in make_securities(num_securities, spread, seed + i):
+            ac.add_security(
+                Security(
+                    "{}_{}".format(ac.get_name(), sec.get_id()),
+                    sec.get_symbol(),
+                    sec.get_name(),
+                    sec.get_price(),
+                    False,
+                )
+            )
+        p.add_asset_class(ac)
+    p.set_cash(cash)
+    return p
+
+
+def measure(run: Callable[[], float]) -> Tuple[float, float, float]:
+    """
+    Calls run() (which returns the cash it left unspent) once to time it and
+    once more under tracemalloc to find its peak memory. Returns the wall time
+    in milliseconds, the peak memory in bytes and the leftover cash.
+    """
+    s: datetime = datetime.now()
+    leftover: float = run()
+    e: datetime = datetime.now()
+    tracemalloc.start()
+    run()
+    (_, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (difference_in_millis(s, e), peak, leftover)
+
+
+def benchmark_asset_class(
+    num_securities: int,
+    budget: float,
+    spread: Tuple[float, float],
+    solver: str,
+    seed: int = 0,
+) -> Tuple[float, float, float]:
+    """
+    Benchmarks AssetClass.plan_purchases() (or plan_fractional_purchases())
+    on a fresh synthetic asset class, so no cached plan is reused.
+    """
+
+    def run() -> float:
+        ac: AssetClass = make_asset_class(num_securities, spread, seed)
+        purchases: Dict[str, Purchase] = (
+            ac.plan_fractional_purchases(budget)
+            if solver == "fractional"
+            else ac.plan_purchases(budget, solver)
+        )
+        return budget - sum([p.get_cost() for p in purchases.values()])
+
+    return measure(run)
+
+
+def benchmark_portfolio(
+    num_securities: int,
+    budget: float,
+    spread: Tuple[float, float],
+    solver: str,
+    seed: int = 0,
+) -> Tuple[float, float, float]:
+    """
+    Benchmarks Portfolio.plan_deposit() of the budget on a fresh synthetic
+    portfolio (see make_portfolio()).
+    """
+
+    def run() -> float:
+        p: Portfolio = make_portfolio(num_securities, spread, seed, budget)
+        deposit: Deposit = (
+            p.plan_deposit(budget, fractional=True)
+            if solver == "fractional"
+            else p.plan_deposit(budget, solver)
+        )
+        return budget - deposit.get_total()
+
+    return measure(run)
+
+
+def too_large(solver: str, budget: float) -> bool:
+    """
+    Returns whether the budget (in dollars) is too large to benchmark the
+    solver with, resolving "auto" to the engine it would use.
+    """
+    budget_cents: float = budget * 100
+    if solver == "auto":
+        solver = "bnb" if budget_cents > LARGE_BUDGET else "dp"
+    max_budget: Optional[int] = MAX_TABLE_BUDGET.get(solver)
+    return max_budget is not None and budget_cents > max_budget
+
+
+def run_suite(
+    security_counts: List[int] = SECURITY_COUNTS,
+    budgets: List[float] = BUDGETS,
+    spreads: Optional[List[str]] = None,
+    solvers: List[str] = SOLVERS,
+    seed: int = 0,
+) -> List[Dict[str, Any]]:
+    """
+    Runs every combination of benchmark ("asset_class" or "portfolio"),
+    security count, budget, price spread and solver. Returns one result per
+    combination with its wall time, peak memory and leftover cash, or with
+    skipped set if the budget is too large for a table solver (see
+    MAX_TABLE_BUDGET).
+    """
+    if spreads is None:
+        spreads = list(PRICE_SPREADS.keys())
+    benchmarks: Dict[str, Callable[..., Tuple[float, float, float]]] = {
+        "asset_class": benchmark_asset_class,
+        "portfolio": benchmark_portfolio,
+    }
+    results: List[Dict[str, Any]] = []
+    for (name, benchmark) in benchmarks.items():
+        for num_securities in security_counts:
+            for budget in budgets:
+                for spread in spreads:
+                    for solver in solvers:
+                        result: Dict[str, Any] = {
+                            "benchmark": name,
+                            "securities": num_securities,
+                            "budget": budget,
+                            "spread": spread,
+                            "solver": solver,
+                            "skipped": False,
+                        }
+                        if too_large(solver, budget):
+                            result["skipped"] = True
+                            results.append(result)
+                            continue
+                        (millis, peak, leftover) = benchmark(
+                            num_securities,
+                            budget,
+                            PRICE_SPREADS[spread],
+                            solver,
+                            seed,
+                        )
+                        result["millis"] = millis
+                        result["peak_bytes"] = peak
+                        result["leftover"] = round(leftover, 6)
+                        log.info(
+                            "{} {} securities, ${:,.0f} budget, {} prices, "
+                            "{}: {:.3g} ms, {:,} bytes, ${:,.2f} left".format(
+                                name,
+                                num_securities,
+                                budget,
+                                spread,
+                                solver,
+                                millis,
+                                peak,
+                                leftover,
+                            )
+                        )
+                        results.append(result)
+    return results
+
+
+def compare_results(
+    baseline: List[Dict[str, Any]],
+    results: List[Dict[str, Any]],
+    tolerance: float = 1.5,
+    min_millis: float = 1.0,
+) -> List[Dict[str, Any]]:
+    """
+    Returns the results that are more than tolerance times slower, or that
+    leave more cash unspent, than the matching baseline result (as written
+    by an earlier run_suite()). Baseline times under min_millis are treated
+    as min_millis, since timings that short are mostly noise.
+    """
+    keys: List[str] = ["benchmark", "securities", "budget", "spread", "solver"]
+    base: Dict[Tuple[Any, ...], Dict[str, Any]] = dict(
+        [(tuple([b[k] for k in keys]), b) for b in baseline]
+    )
+    regressions: List[Dict[str, Any]] = []
+    for result in results:
+        old: Optional[Dict[str, Any]] = base.get(
+            tuple([result[k] for k in keys])
+        )
+        if old is None or old["skipped"] or result["skipped"]:
+            continue
+        if (
+            result["millis"] > max(old["millis"], min_millis) * tolerance
+            or result["leftover"] > old["leftover"] + 0.005
+        ):
+            regressions.append(result)
+    return regressions
+
+
+def benchmark_refresh(
+    cassette: Cassette,
+    config: List[Dict[str, Any]],
+    speed: float = 1.0,
+    from_positions: bool = False,
+) -> Dict[str, Any]:
+    """
+    Times Portfolio.refresh() of the configured portfolio with every broker
+    request answered from the cassette (see configure_replay()) at speed
+    times its recorded pace. Nothing is cached between runs, so every run
+    makes the same requests. Returns the wall time and each stage's time in
+    milliseconds, the refresh's critical path and the responses played.
+    """
+    configure_replay(cassette, speed=speed)
+    cassette.rewind()
+    robin_stocks.helper.set_login_state(True)
+    p: Portfolio = Portfolio()
+    p.load_configuration(config)
+    with tempfile.TemporaryDirectory() as data_dir:
+        s: datetime = datetime.now()
+        p.refresh(True, False, data_dir, False, from_positions)
+        e: datetime = datetime.now()
+    return {
+        "benchmark": "refresh",
+        "speed": speed,
+        "millis": difference_in_millis(s, e),
+        "stages": dict(
+            [
+                (stage, round(end - start, 3))
+                for (stage, (start, end)) in p.get_refresh_timings().items()
+            ]
+        ),
+        "critical_path": p.get_refresh_critical_path(),
+        "responses": cassette.get_played(),
+    }
+
+
+def make_history(
+    num_positions: int, num_dividends: int, seed: int = 0
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Returns holdings and dividends snapshots of a synthetic account with
+    num_positions holdings and a history of num_dividends dividends, with
+    the fields the broker returns, the same for the same seed.
+    """
+    rng: random.Random = random.Random(seed)
+    sec_ids: List[str] = [
+        str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(num_positions)
+    ]
+    holdings: List[Dict[str, Any]] = []
+    for (i, sec_id) in enumerate(sec_ids):
+        price: float = rng.randint(500, 50000) / 100.0
+        quantity: float = float(rng.randint(1, 100))
+        holdings.append(
+            {
+                "price": "{:.6f}".format(price),
+                "quantity": "{:.8f}".format(quantity),
+                "average_buy_price": "{:.4f}".format(price * 0.9),
+                "equity": "{:.2f}".format(price * quantity),
+                "percent_change": "11.11",
+                "equity_change": "{:.6f}".format(price * quantity * 0.1),
+                "type": "etp",
+                "name": "Fake {}".format(i),
+                "id": sec_id,
+                "pe_ratio": None,
+                "percentage": "{:.2f}".format(100.0 / num_positions),
+                "symbol": "FAKE{}".format(i),
+            }
+        )
+    dividends: List[Dict[str, Any]] = []
+    for i in range(num_dividends):
+        sec_id = rng.choice(sec_ids)
+        paid_at: datetime = datetime(2010, 1, 1) + timedelta(days=i // 8)
+        dividend_id: str = str(uuid.UUID(int=rng.getrandbits(128)))
+        dividends.append(
+            dict(
+                make_dividend(sec_id, rng.randint(1, 5000) / 100.0),
+                id=dividend_id,
+                url="{}/dividends/{}/".format(API_URL, dividend_id),
+                position="{:.8f}".format(float(rng.randint(1, 100))),
+                rate="{:.8f}".format(rng.randint(1, 200) / 100.0),
+                withholding="0.00",
+                record_date=paid_at.strftime("%Y-%m-%d"),
+                payable_date=paid_at.strftime("%Y-%m-%d"),
+                paid_at=paid_at.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                drip_enabled=False,
+            )
+        )
+    return (holdings, dividends)
+
+
+def measure_load(load: Callable[[], Any], runs: int = 5) -> Tuple[float, int]:
+    """
+    Calls load() runs times to time it and once more under tracemalloc to
+    find its peak memory. Returns the fastest wall time in milliseconds and
+    the peak memory in bytes.
+    """
+    millis: List[float] = []
+    for _ in range(runs):
+        s: datetime = datetime.now()
+        load()
+        millis.append(difference_in_millis(s, datetime.now()))
+    tracemalloc.start()
+    load()
+    (_, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (min(millis), peak)
+
+
+def benchmark_snapshots(
+    num_positions: int = 500, num_dividends: int = 20000, seed: int = 0
+) -> List[Dict[str, Any]]:
+    """
+    Writes the holdings and dividends snapshots of a synthetic account (see
+    make_history()) in each of SNAPSHOT_LAYOUTS and times loading them
+    offline with load_holdings() and load_dividends(). Returns the size on
+    disk in bytes of each layout along with each load's wall time in
+    milliseconds and peak memory in bytes.
+    """
+    (holdings, dividends) = make_history(num_positions, num_dividends, seed)
+    t: datetime = datetime(2019, 1, 1)
+    results: List[Dict[str, Any]] = []
+    for layout in SNAPSHOT_LAYOUTS:
+        with tempfile.TemporaryDirectory() as data_dir:
+            size: int = 0
+            for (kind, resp) in [
+                ("holdings", holdings),
+                ("dividends", dividends),
+            ]:
+                if layout == "tree":
+                    # As the loaders wrote snapshots before the store
+                    tree_dir: str = os.path.join(
+                        data_dir, kind, t.strftime("%Y/%m/%d/%H/%M/%S")
+                    )
+                    os.makedirs(tree_dir)
+                    path: str = os.path.join(
+                        tree_dir, t.strftime(TREE_FILE_FORMAT)
+                    )
+                    with open(path, "w") as f:
+                        f.write(json.dumps(resp, indent=4))
+                    size += os.path.getsize(path)
+                else:
+                    save_snapshot(data_dir, kind, t, resp, layout)
+            if layout != "tree":
+                size = os.path.getsize(os.path.join(data_dir, SNAPSHOT_DB))
+            (holdings_millis, holdings_peak) = measure_load(
+                lambda: load_holdings(t, False, False, data_dir)
+            )
+            (dividends_millis, dividends_peak) = measure_load(
+                lambda: load_dividends([], t, False, False, data_dir)
+            )
+        results.append(
+            {
+                "benchmark": "snapshots",
+                "layout": layout,
+                "bytes": size,
+                "holdings_millis": round(holdings_millis, 3),
+                "holdings_peak": holdings_peak,
+                "dividends_millis": round(dividends_millis, 3),
+                "dividends_peak": dividends_peak,
+            }
+        )
+    return results
+
+
+if __name__ == "__main__":
+
+    logging.basicConfig(
+        format="%(asctime)-15s %(levelname)s: %(message)s", level=logging.INFO
+    )
+    # Keep the planners' own log lines out of the report
+    logging.getLogger("src").setLevel(logging.WARNING)
+
+    parser = argparse.ArgumentParser(description="Hanna planner benchmarks.")
+    parser.add_argument("--output", required=False, default=None)
+    parser.add_argument("--baseline", required=False, default=None)
+    parser.add_argument(
+        "--securities", required=False, type=int, nargs="+"
+    )
+    parser.add_argument("--budgets", required=False, type=float, nargs="+")
+    parser.add_argument(
+        "--spreads", required=False, nargs="+", choices=PRICE_SPREADS.keys()
+    )
+    parser.add_argument(
+        "--solvers", required=False, nargs="+", choices=SOLVERS
+    )
+    parser.add_argument("--seed", required=False, default=0, type=int)
+    parser.add_argument(
+        "--cassette",
+        required=False,
+        default=None,
+        help="benchmark refresh() replaying this cassette instead",
+    )
+    parser.add_argument(
+        "--config",
+        required=False,
+        default=os.path.join(os.getcwd(), "config", "portfolio.json"),
+    )
+    parser.add_argument(
+        "--replay-speed", required=False, default=1.0, type=float
+    )
+    parser.add_argument(
+        "--from-positions", required=False, default=False, action="store_true"
+    )
+    parser.add_argument(
+        "--snapshots",
+        required=False,
+        default=False,
+        action="store_true",
+        help="benchmark the snapshot layouts instead",
+    )
+
+    args = parser.parse_args()
+
+    results: List[Dict[str, Any]] = []
+    if args.cassette is not None:
+        with open(args.config, "r") as f:
+            results = [
+                benchmark_refresh(
+                    Cassette(args.cassette),
+                    json.load(f),
+                    args.replay_speed,
+                    args.from_positions,
+                )
+            ]
+        log.info("Refresh: {}".format(json.dumps(results[0])))
+    elif args.snapshots:
+        results = benchmark_snapshots(seed=args.seed)
+        for result in results:
+            log.info("Snapshots: {}".format(json.dumps(result)))
+    else:
+        results = run_suite(
+            args.securities or SECURITY_COUNTS,
+            args.budgets or BUDGETS,
+            args.spreads,
+            args.solvers or SOLVERS,
+            args.seed,
+        )
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            f.write(json.dumps(results, indent=4))
+    if (
+        args.baseline is not None
+        and args.cassette is None
+        and not args.snapshots
+    ):
+        with open(args.baseline, "r") as f:
+            regressions = compare_results(json.load(f), results)
+        for r in regressions:
+            log.warning("Regression: {}".format(json.dumps(r)))
+        log.info("{} regressions found.".format(len(regressions)))
@@ -0,0 +1,503 @@
+# Ricky Galliani
+# Hanna
+# fake_broker.py
+
+from src.session import API_URL
+from src.snapshot_store import load_snapshot
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import argparse
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+
+log = logging.getLogger(__name__)
+
+# Results per page of the paginated endpoints (positions and dividends)
+PAGE_SIZE: int = 100
+
+# Positions in a synthetic account by default
+NUM_POSITIONS: int = 20
+
+# Cash in a synthetic account by default
+CASH: float = 1000.0
+
+
+def make_account(
+    num_positions: int = NUM_POSITIONS,
+    seed: int = 0,
+    security_ids: Optional[List[str]] = None,
+    cash: float = CASH,
+) -> Dict[str, Any]:
+    """
+    Returns a synthetic account of num_positions positions with random
+    prices, quantities and dividends, the same for the same seed. The
+    positions are in the given securities (e.g. the ones in a portfolio
+    configuration) first, then in made up ones.
+    """
+    rng: random.Random = random.Random(seed)
+    sec_ids: List[str] = list(security_ids or [])[:num_positions]
+    while len(sec_ids) < num_positions:
+        sec_ids.append(str(uuid.UUID(int=rng.getrandbits(128))))
+    account: Dict[str, Any] = {
+        "profile": make_profile(cash),
+        "instruments": {},
+        "quotes": {},
+        "positions": [],
+        "dividends": [],
+    }
+    for (i, sec_id) in enumerate(sec_ids):
+        symbol: str = "FAKE{}".format(i)
+        price: float = rng.randint(500, 50000) / 100.0
+        add_security(account, sec_id, symbol, "Fake {}".format(i), price)
+        account["positions"].append(
+            make_position(
+                sec_id,
+                float(rng.randint(1, 100)),
+                round(price * rng.uniform(0.7, 1.3), 4),
+            )
+        )
+        for _ in range(rng.randint(0, 3)):
+            account["dividends"].append(
+                make_dividend(sec_id, rng.randint(1, 5000) / 100.0)
+            )
+    return account
+
+
+def load_recorded(data_dir: str = "data") -> Dict[str, Any]:
+    """
+    Returns an account built from the latest account profile, holdings,
+    securities and dividends snapshots in data_dir (see src/api.py).
+    """
+    profile: Dict[str, Any] = load_snapshot(data_dir, "account_profile")
+    account: Dict[str, Any] = {
+        "profile": make_profile(
+            float(profile["margin_balances"]["unallocated_margin_cash"])
+        ),
+        "instruments": {},
+        "quotes": {},
+        "positions": [],
+        "dividends": load_snapshot(data_dir, "dividends"),
+    }
+    account["profile"].update(profile)
+    securities: Dict[str, Any] = load_snapshot(data_dir, "securities")
+    for (sec_id, info) in securities.items():
+        if len(info["price"]) > 0:
+            add_security(
+                account,
+                sec_id,
+                info["symbol"],
+                info["name"],
+                float(info["price"][0]),
+            )
+    for holding in load_snapshot(data_dir, "holdings"):
+        sec_id = holding["id"]
+        if sec_id not in account["instruments"]:
+            add_security(
+                account,
+                sec_id,
+                holding.get("symbol", sec_id.upper()),
+                holding["name"],
+                float(holding["price"]),
+            )
+        account["positions"].append(
+            make_position(
+                sec_id,
+                float(holding["quantity"]),
+                float(holding["average_buy_price"]),
+            )
+        )
+    return account
+
+
+def make_profile(cash: float) -> Dict[str, Any]:
+    return {
+        "url": "{}/accounts/FAKE/".format(API_URL),
+        "account_number": "FAKE",
+        "cash": "{:.4f}".format(cash),
+        "uncleared_deposits": "0.0000",
+        "margin_balances": {"unallocated_margin_cash": "{:.4f}".format(cash)},
+    }
+
+
+def add_security(
+    account: Dict[str, Any], sec_id: str, symbol: str, name: str, price: float
+) -> None:
+    account["instruments"][sec_id] = {
+        "id": sec_id,
+        "url": instrument_url(sec_id),
+        "symbol": symbol,
+        "name": name,
+        "simple_name": name,
+        "type": "etp",
+        "tradeable": True,
+    }
+    account["quotes"][symbol] = {
+        "symbol": symbol,
+        "instrument": instrument_url(sec_id),
+        "last_trade_price": "{:.6f}".format(price),
+        "last_extended_hours_trade_price": None,
+    }
+
+
+def make_position(
+    sec_id: str, quantity: float, average_buy_price: float
+) -> Dict[str, Any]:
+    return {
+        "account": "{}/accounts/FAKE/".format(API_URL),
+        "instrument": instrument_url(sec_id),
+        "quantity": "{:.8f}".format(quantity),
+        "average_buy_price": "{:.4f}".format(average_buy_price),
+    }
+
+
+def make_dividend(sec_id: str, amount: float) -> Dict[str, Any]:
+    return {
+        "account": "{}/accounts/FAKE/".format(API_URL),
+        "instrument": instrument_url(sec_id),
+        "amount": "{:.2f}".format(amount),
+        "state": "paid",
+    }
+
+
+def instrument_url(sec_id: str) -> str:
+    return "{}/instruments/{}/".format(API_URL, sec_id)
+
+
+class FakeBroker:
+    def __init__(
+        self,
+        account: Dict[str, Any],
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        page_size: int = PAGE_SIZE,
+        seed: int = 0,
+    ) -> None:
+        """
+        A stand-in for the broker's API serving the account (see
+        make_account() and load_recorded()) to robin_stocks: logins, the
+        account and portfolio profiles, positions, instruments, quotes,
+        fundamentals, dividends and orders. Every response is delayed by
+        latency plus up to jitter seconds, and error_rate of the requests
+        fail with error_status. Delays and failures are drawn from seed, so
+        the same sequence of requests sees the same ones.
+        """
+        self.__account: Dict[str, Any] = account
+        self.__latency: float = latency
+        self.__jitter: float = jitter
+        self.__error_rate: float = error_rate
+        self.__error_status: int = error_status
+        self.__page_size: int = page_size
+        self.__rng: random.Random = random.Random(seed)
+        self.__lock: threading.Lock = threading.Lock()
+        self.__requests: Dict[str, int] = {}
+        self.__orders: List[Dict[str, Any]] = []
+        self.__server: Optional[ThreadingHTTPServer] = None
+        self.__host: str = ""
+
+    def get_account(self) -> Dict[str, Any]:
+        return self.__account
+
+    def get_requests(self) -> Dict[str, int]:
+        """
+        Returns the number of requests served per endpoint.
+        """
+        return self.__requests
+
+    def get_orders(self) -> List[Dict[str, Any]]:
+        return self.__orders
+
+    def get_url(self) -> str:
+        if self.__server is None:
+            raise Exception("get_url(): broker isn't started")
+        return "http://{}:{}".format(self.__host, self.__server.server_port)
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """
+        Serves the API on a background thread at the given address (any
+        free port by default). Returns the base URL to send requests to.
+        """
+        self.__host = host
+        self.__server = ThreadingHTTPServer((host, port), FakeBrokerHandler)
+        self.__server.daemon_threads = True
+        setattr(self.__server, "broker", self)
+        threading.Thread(
+            target=self.__server.serve_forever, args=(0.05,), daemon=True
+        ).start()
+        log.info("Fake broker serving at {}.".format(self.get_url()))
+        return self.get_url()
+
+    def stop(self) -> None:
+        if self.__server is not None:
+            self.__server.shutdown()
+            self.__server.server_close()
+            self.__server = None
+
+    def handle(
+        self, method: str, url: str, body: Dict[str, Any]
+    ) -> Tuple[int, Any]:
+        """
+        Returns the status and JSON payload of the response to the request,
+        after the configured latency.
+        """
+        parts = urlsplit(url)
+        query: Dict[str, List[str]] = parse_qs(parts.query)
+        path: List[str] = [p for p in parts.path.split("/") if p != ""]
+        endpoint: str = "{} {}".format(method, "/".join(path[:1]))
+        with self.__lock:
+            self.__requests[endpoint] = self.__requests.get(endpoint, 0) + 1
+            delay: float = self.__latency + self.__rng.uniform(
+                0, self.__jitter
+            )
+            failed: bool = self.__rng.random() < self.__error_rate
+        time.sleep(delay)
+        if failed:
+            return (self.__error_status, {"detail": "Injected failure."})
+        if method == "POST" and path == ["oauth2", "token"]:
+            return (200, make_token())
+        if method == "POST" and path == ["orders"]:
+            return (201, self.__place_order(body))
+        if method != "GET" or len(path) == 0:
+            return (404, {"detail": "Not found."})
+        account: Dict[str, Any] = self.get_account()
+        if path == ["accounts"]:
+            return (200, page([account["profile"]]))
+        if path == ["portfolios"]:
+            return (200, page([self.__portfolio()]))
+        if path == ["positions"]:
+            return (200, self.__page(url, account["positions"], query))
+        if path == ["dividends"]:
+            return (200, self.__page(url, account["dividends"], query))
+        if path == ["quotes"]:
+            return (200, page(self.__by_symbols("quotes", query)))
+        if path == ["fundamentals"]:
+            return (200, page(self.__by_symbols("fundamentals", query)))
+        if path == ["instruments"] and "symbol" in query:
+            return (
+                200,
+                page(
+                    [
+                        i
+                        for i in account["instruments"].values()
+                        if i["symbol"] == query["symbol"][0].upper()
+                    ]
+                ),
+            )
+        if path[0] == "instruments" and len(path) == 2:
+            instrument: Optional[Dict[str, Any]] = account["instruments"].get(
+                path[1]
+            )
+            if instrument is not None:
+                return (200, instrument)
+        return (404, {"detail": "Not found."})
+
+    def __page(
+        self, url: str, results: List[Any], query: Dict[str, List[str]]
+    ) -> Dict[str, Any]:
+        start: int = int(query.get("cursor", ["0"])[0])
+        end: int = start + self.__page_size
+        next_url: Optional[str] = None
+        if end < len(results):
+            next_url = "{}{}?cursor={}".format(
+                API_URL, urlsplit(url).path, end
+            )
+        return {"results": results[start:end], "next": next_url}
+
+    def __by_symbols(
+        self, kind: str, query: Dict[str, List[str]]
+    ) -> List[Optional[Dict[str, Any]]]:
+        symbols: List[str] = query.get("symbols", [""])[0].split(",")
+        quotes: Dict[str, Any] = self.get_account()["quotes"]
+        if kind == "quotes":
+            return [quotes.get(sym.upper()) for sym in symbols]
+        return [
+            (
+                {"symbol": sym.upper(), "pe_ratio": None}
+                if sym.upper() in quotes
+                else None
+            )
+            for sym in symbols
+        ]
+
+    def __portfolio(self) -> Dict[str, Any]:
+        account: Dict[str, Any] = self.get_account()
+        prices: Dict[str, float] = dict(
+            [
+                (q["instrument"], float(q["last_trade_price"]))
+                for q in account["quotes"].values()
+            ]
+        )
+        equity: float = float(account["profile"]["cash"]) + sum(
+            [
+                float(p["quantity"]) * prices.get(p["instrument"], 0.0)
+                for p in account["positions"]
+            ]
+        )
+        return {
+            "equity": "{:.4f}".format(equity),
+            "extended_hours_equity": None,
+        }
+
+    def __place_order(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Records the order and fills it at once, adding it to the positions.
+        """
+        quantity: float = float(body["quantity"])
+        price: float = float(body["price"])
+        with self.__lock:
+            order: Dict[str, Any] = dict(
+                body, id=str(uuid.uuid4()), state="confirmed"
+            )
+            self.__orders.append(order)
+            for p in self.get_account()["positions"]:
+                if p["instrument"] == body["instrument"]:
+                    old_quantity: float = float(p["quantity"])
+                    p["average_buy_price"] = "{:.4f}".format(
+                        (
+                            old_quantity * float(p["average_buy_price"])
+                            + quantity * price
+                        )
+                        / (old_quantity + quantity)
+                    )
+                    p["quantity"] = "{:.8f}".format(old_quantity + quantity)
+                    break
+            else:
+                self.get_account()["positions"].append(
+                    make_position(
+                        os.path.basename(body["instrument"].rstrip("/")),
+                        quantity,
+                        price,
+                    )
+                )
+        return order
+
+
+def page(results: List[Any]) -> Dict[str, Any]:
+    return {"results": results, "next": None}
+
+
+def make_token() -> Dict[str, Any]:
+    return {
+        "access_token": "fake",
+        "refresh_token": "fake",
+        "token_type": "Bearer",
+        "expires_in": 86400,
+        "scope": "internal",
+    }
+
+
+class FakeBrokerHandler(BaseHTTPRequestHandler):
+    # Keep connections open between requests, like the real API, without
+    # holding back small responses for acks
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self) -> None:
+        self.__respond("GET", {})
+
+    def do_POST(self) -> None:
+        length: int = int(self.headers.get("Content-Length", 0))
+        raw: str = self.rfile.read(length).decode()
+        body: Dict[str, Any] = {}
+        if raw.startswith("{"):
+            body = json.loads(raw)
+        else:
+            body = dict([(k, v[0]) for (k, v) in parse_qs(raw).items()])
+        self.__respond("POST", body)
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+    def __respond(self, method: str, body: Dict[str, Any]) -> None:
+        broker: FakeBroker = getattr(self.server, "broker")
+        (status, payload) = broker.handle(method, self.path, body)
+        data: bytes = json.dumps(payload).encode()
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            if status == 429:
+                self.send_header("Retry-After", "0")
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up waiting for the response
+            pass
+
+
+if __name__ == "__main__":
+
+    logging.basicConfig(
+        format="%(asctime)-15s %(levelname)s: %(message)s", level=logging.INFO
+    )
+
+    parser = argparse.ArgumentParser(description="Hanna fake broker.")
+    parser.add_argument("--port", required=False, default=8000, type=int)
+    parser.add_argument(
+        "--positions", required=False, default=NUM_POSITIONS, type=int
+    )
+    parser.add_argument("--cash", required=False, default=CASH, type=float)
+    parser.add_argument("--seed", required=False, default=0, type=int)
+    parser.add_argument(
+        "--config",
+        required=False,
+        default=None,
+        help="portfolio.json whose securities the synthetic positions hold",
+    )
+    parser.add_argument(
+        "--recorded",
+        required=False,
+        default=None,
+        help="snapshot directory to serve instead of a synthetic account",
+    )
+    parser.add_argument("--latency", required=False, default=0.0, type=float)
+    parser.add_argument("--jitter", required=False, default=0.0, type=float)
+    parser.add_argument(
+        "--error-rate", required=False, default=0.0, type=float
+    )
+    parser.add_argument(
+        "--error-status", required=False, default=503, type=int
+    )
+    parser.add_argument(
+        "--page-size", required=False, default=PAGE_SIZE, type=int
+    )
+
+    args = parser.parse_args()
+
+    account: Dict[str, Any] = {}
+    if args.recorded is not None:
+        account = load_recorded(args.recorded)
+    else:
+        security_ids: List[str] = []
+        if args.config is not None:
+            with open(args.config, "r") as f:
+                for ac in json.load(f):
+                    security_ids += ac["securities"]
+        account = make_account(
+            args.positions, args.seed, security_ids, args.cash
+        )
+    broker: FakeBroker = FakeBroker(
+        account,
+        args.latency,
+        args.jitter,
+        args.error_rate,
+        args.error_status,
+        args.page_size,
+        args.seed,
+    )
+    broker.start(port=args.port)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        broker.stop()
+        log.info("Served {}.".format(json.dumps(broker.get_requests())))
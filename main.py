@@ -4,6 +4,19 @@
 
 from src.portfolio import Portfolio
 from src.api import Credentials, load_credentials
+from src.cassette import Cassette
+from src.instrument_cache import InstrumentCache
+from src.scheduler import RATE, RequestScheduler, log_scheduler_stats
+from src.session import (
+    POOL_MAXSIZE,
+    PooledAdapter,
+    configure_replay,
+    configure_session,
+    log_session_stats,
+)
+
+from datetime import datetime
+from typing import Optional
 
 import argparse
 import json
@@ -26,21 +39,117 @@ if __name__ == "__main__":
     parser.add_argument(
         "--logging", required=False, default=False, action="store_true"
     )
+    parser.add_argument(
+        "--from-holdings", required=False, default=False, action="store_true"
+    )
+    parser.add_argument(
+        "--from-positions", required=False, default=False, action="store_true"
+    )
+    parser.add_argument(
+        "--pool-size", required=False, default=POOL_MAXSIZE, type=int
+    )
+    parser.add_argument("--rate", required=False, default=RATE, type=float)
+    parser.add_argument(
+        "--broker-url",
+        required=False,
+        default=None,
+        help="send API requests here instead, e.g. to fake_broker.py",
+    )
+    parser.add_argument(
+        "--data-dir",
+        required=False,
+        default=None,
+        help="snapshot directory (data, or data_fake if not the real API)",
+    )
+    parser.add_argument(
+        "--record",
+        required=False,
+        default=None,
+        help="cassette to record every API request and response to",
+    )
+    parser.add_argument(
+        "--replay",
+        required=False,
+        default=None,
+        help="cassette to answer API requests from instead of the API",
+    )
+    parser.add_argument(
+        "--replay-speed",
+        required=False,
+        default=1.0,
+        type=float,
+        help="how many times faster than recorded to replay (0: at once)",
+    )
+    parser.add_argument(
+        "--as-of",
+        required=False,
+        default=None,
+        type=datetime.fromisoformat,
+        help="load the portfolio offline as of this time, e.g. 2019-01-01",
+    )
 
     args = parser.parse_args()
+    if args.as_of is not None and (args.online or args.replay is not None):
+        parser.error("--as-of loads snapshots, so it can't be used online")
+
+    # Keep snapshots and instruments from a fake broker or a replay away
+    # from the real ones
+    real: bool = args.broker_url is None and args.replay is None
+    data_dir: str = args.data_dir or ("data" if real else "data_fake")
+    online: bool = args.online or args.replay is not None
 
     portfolio = Portfolio()
     config = os.path.join(os.getcwd(), "config", "portfolio.json")
     portfolio.load_configuration(json.load(open(config, "r")))
 
-    if args.online:
-        c: Credentials = load_credentials()
-        client = r.login(c.get_username(), c.get_password())
+    if args.replay is not None:
+        replayed: Cassette = Cassette(args.replay)
+        configure_replay(replayed, speed=args.replay_speed)
+    elif args.online:
+        scheduler: RequestScheduler = RequestScheduler(args.rate)
+        cassette: Optional[Cassette] = None
+        if args.record is not None:
+            cassette = Cassette(args.record, fresh=True)
+            # A replay starts from its own instrument cache, so every
+            # instrument is fetched (and recorded) rather than read from this
+            # one, which the refresh fills again
+            instruments: InstrumentCache = InstrumentCache(
+                os.path.join(data_dir, "instruments.json")
+            )
+            instruments.invalidate()
+            instruments.save()
+        adapter: PooledAdapter = configure_session(
+            pool_maxsize=args.pool_size,
+            scheduler=scheduler,
+            base_url=args.broker_url,
+            cassette=cassette,
+        )
+    if online:
+        if real:
+            c: Credentials = load_credentials()
+            client = r.login(c.get_username(), c.get_password())
+        else:
+            # Any credentials will do for a fake broker or a replay
+            client = r.login("fake", "fake")
 
-    portfolio.refresh(args.online, args.logging)
+    portfolio.refresh(
+        online,
+        args.logging,
+        data_dir,
+        args.from_holdings,
+        args.from_positions,
+        args.as_of,
+    )
     # deposit = portfolio.plan_deposit(portfolio.get_cash())
     # portfolio.make_deposit(deposit, args.online)
     # portfolio.refresh(args.online, args.logging)
 
-    if args.online:
+    if args.replay is not None:
+        log.info("Replayed {} responses.".format(replayed.get_played()))
+    elif args.online:
+        log_session_stats(adapter)
+        log_scheduler_stats(scheduler)
+        if cassette is not None:
+            cassette.save()
+    if online:
         r.logout()
@@ -0,0 +1,75 @@
+# Ricky Galliani
+# Hanna
+# migrate_snapshots.py
+
+from src.snapshot_store import (
+    SNAPSHOT_CODEC,
+    SNAPSHOT_CODECS,
+    SNAPSHOT_DB,
+    SNAPSHOT_KINDS,
+    SnapshotStore,
+    migrate_tree,
+)
+
+import argparse
+import logging
+import os
+import shutil
+
+log = logging.getLogger(__name__)
+
+
+if __name__ == "__main__":
+
+    logging.basicConfig(
+        format="%(asctime)-15s %(levelname)s: %(message)s", level=logging.INFO
+    )
+
+    parser = argparse.ArgumentParser(
+        description="Moves Hanna's snapshot directory tree into its store."
+    )
+    parser.add_argument("--data-dir", required=False, default="data")
+    parser.add_argument(
+        "--remove", required=False, default=False, action="store_true"
+    )
+    parser.add_argument(
+        "--codec",
+        required=False,
+        default=SNAPSHOT_CODEC,
+        choices=SNAPSHOT_CODECS,
+        help="encoding of the migrated snapshots",
+    )
+    parser.add_argument(
+        "--recode",
+        required=False,
+        default=False,
+        action="store_true",
+        help="also encode the snapshots already in the store with --codec",
+    )
+
+    args = parser.parse_args()
+
+    with SnapshotStore(
+        os.path.join(args.data_dir, SNAPSHOT_DB), codec=args.codec
+    ) as store:
+        migrated: int = migrate_tree(args.data_dir, store)
+        log.info(
+            "Migrated {} snapshots into {} ({} in all).".format(
+                migrated, store.get_path(), len(store)
+            )
+        )
+        if args.recode:
+            log.info(
+                "Encoded {} snapshots with {} ({} bytes).".format(
+                    store.recode(),
+                    args.codec,
+                    os.path.getsize(store.get_path()),
+                )
+            )
+    if args.remove:
+        # Only once every snapshot is committed to the store
+        for kind in SNAPSHOT_KINDS:
+            tree_dir: str = os.path.join(args.data_dir, kind)
+            if os.path.isdir(tree_dir):
+                shutil.rmtree(tree_dir)
+                log.info("Removed {}.".format(tree_dir))
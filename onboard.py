@@ -2,7 +2,9 @@
 # Hanna
 # onboard.py
 
-from typing import Any, Dict, List, Tuple
+from src.instrument_cache import InstrumentCache
+
+from typing import Any, Dict, List, Optional, Tuple
 
 import logging
 import os
@@ -17,15 +19,24 @@ def ask_user_input(prompt: str) -> str:
     return input(prompt)
 
 
-def ask_security(ac_name: str) -> Tuple[str, str]:
+def ask_security(
+    ac_name: str, cache: Optional[InstrumentCache] = None
+) -> Tuple[str, str]:
     """
     Asks the user for the symbol of a security to add and returns the
-    security's id and name.
+    security's id and name, which are looked up in the instrument cache (if
+    given) before hitting the Robinhood API.
     """
     sec_sym: str = ask_user_input(
         "\t\tEnter the symbol for the new {} security: ".format(ac_name)
     )
+    if cache is not None:
+        cached: Optional[Dict[str, Any]] = cache.get_by_symbol(sec_sym)
+        if cached is not None:
+            return (cached["id"], cached["name"])
     instrument: Dict[str, Any] = r.get_instruments_by_symbols([sec_sym])[0]
+    if cache is not None:
+        cache.put(instrument["id"], instrument["name"], instrument["symbol"])
     return (instrument["id"], instrument["name"])
 
 
@@ -85,22 +96,26 @@ def ask_target_pct(ac_name: str, pct_left: float) -> float:
     return ac_target_pct
 
 
-def setup_security(ac_name: str) -> Tuple[str, bool]:
+def setup_security(
+    ac_name: str, cache: Optional[InstrumentCache] = None
+) -> Tuple[str, bool]:
     """
     Collects user input to set up a security".
     """
-    security: Tuple[str, str] = ask_security(ac_name)
+    security: Tuple[str, str] = ask_security(ac_name, cache)
     security_id: str = security[0]
     security_name: str = security[1]
     confirm_security: bool = ask_confirm_security(security_name)
     if not confirm_security:
-        setup_security(ac_name)
+        setup_security(ac_name, cache)
     allow_purchase: bool = ask_allow_purchase()
     return (security_id, allow_purchase)
 
 
 def setup_asset_class(
-    first: bool, existing_total_pct: float
+    first: bool,
+    existing_total_pct: float,
+    cache: Optional[InstrumentCache] = None,
 ) -> Dict[str, str]:
     """
     Collects user input to set up an asset class.
@@ -121,7 +136,7 @@ def setup_asset_class(
     asset_class["buy_restrictions"] = []
     add_sec: bool = True
     while add_sec:
-        security: Tuple[str, bool] = setup_security(ac_name)
+        security: Tuple[str, bool] = setup_security(ac_name, cache)
         security_id: str = security[0]
         allow_purchase: bool = security[1]
         asset_class["securities"].append(security_id)
@@ -148,11 +163,13 @@ if __name__ == "__main__":
     portfolio_config: List[Dict[str, Any]] = []
     first: bool = True
     total_pct: float = 0.0
+    cache: InstrumentCache = InstrumentCache()
     while total_pct < 1:
-        ac: Dict[str, Any] = setup_asset_class(first, total_pct)
+        ac: Dict[str, Any] = setup_asset_class(first, total_pct, cache)
         portfolio_config.append(ac)
         total_pct += ac["target_percentage"]
         first = False
+    cache.save()
 
     # Get Robinhood credentials from user (only to store locally)
     credentials_config_file = os.path.join(
@@ -6,4 +6,14 @@ python3 -m unittest --verbose test.asset_class;
 python3 -m unittest --verbose test.portfolio;
 python3 -m unittest --verbose test.purchase;
 python3 -m unittest --verbose test.deposit;
-python3 -m unittest --verbose test.util;
\ No newline at end of file
+python3 -m unittest --verbose test.util;
+python3 -m unittest --verbose test.knapsack;
+python3 -m unittest --verbose test.batch;
+python3 -m unittest --verbose test.benchmark;
+python3 -m unittest --verbose test.api;
+python3 -m unittest --verbose test.instrument_cache;
+python3 -m unittest --verbose test.session;
+python3 -m unittest --verbose test.scheduler;
+python3 -m unittest --verbose test.fake_broker;
+python3 -m unittest --verbose test.cassette;
+python3 -m unittest --verbose test.snapshot_store;
@@ -2,11 +2,20 @@
 # Hanna
 # src/api.py
 
-from src.util import latest_ds
-
+from src.instrument_cache import InstrumentCache
+from src.scheduler import BACKGROUND_PRIORITY, priority
+from src.snapshot_store import (
+    SnapshotBundle,
+    iter_snapshot,
+    load_snapshot,
+    save_snapshot,
+)
+from src.util import difference_in_millis, latency_str
+
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import os
 import json
@@ -16,6 +25,12 @@ import robin_stocks as r
 
 log = logging.getLogger(__name__)
 
+# Most requests fetch_securities() has in flight at once
+FETCH_WORKERS: int = 8
+
+# Most symbols whose quotes are fetched in one request
+QUOTE_CHUNK_SIZE: int = 50
+
 
 class Credentials:
     def __init__(self, username: str, password: str) -> None:
@@ -43,22 +58,24 @@ class HoldingInfo:
         security_id: str,
         name: str,
         price: float,
-        quantity: int,
+        quantity: float,
         average_buy_price: float,
         equity: float,
         percentage: float,
         percent_change: float,
         equity_change: float,
+        symbol: Optional[str] = None,
     ) -> None:
         self.__security_id: str = security_id
         self.__name: str = name
         self.__price: float = price
-        self.__quantity: int = quantity
+        self.__quantity: float = quantity
         self.__average_buy_price: float = average_buy_price
         self.__equity: float = equity
         self.__percentage: float = percentage
         self.__percent_change: float = percent_change
         self.__equity_change: float = equity_change
+        self.__symbol: Optional[str] = symbol
 
     def get_security_id(self) -> str:
         return self.__security_id
@@ -69,7 +86,7 @@ class HoldingInfo:
     def get_price(self) -> float:
         return self.__price
 
-    def get_quantity(self) -> int:
+    def get_quantity(self) -> float:
         return self.__quantity
 
     def get_average_buy_price(self) -> float:
@@ -87,6 +104,9 @@ class HoldingInfo:
     def get_equity_change(self) -> float:
         return self.__equity_change
 
+    def get_symbol(self) -> Optional[str]:
+        return self.__symbol
+
 
 class SecurityInfo:
     def __init__(self, name: str, symbol: str, price: float) -> None:
@@ -128,49 +148,28 @@ def load_credentials() -> Credentials:
 
 
 def load_account_profile(
-    t: datetime, online: bool, log: bool
+    t: datetime,
+    online: bool,
+    log: bool,
+    data_dir: str = "data",
+    bundle: Optional[SnapshotBundle] = None,
 ) -> AccountProfile:
     """
     Loads user profile information from Robinhood including total equity,
-    cash, and dividend total.
+    cash, and dividend total. With a bundle, the snapshot is logged to (or
+    read from) the bundle rather than the store in data_dir.
     """
     resp: Dict[str, Any] = {}
-    account_profile_base_dir: str = os.path.join("data", "account_profile")
-    account_profile_output_dir: str = os.path.join(
-        account_profile_base_dir,
-        t.strftime("%Y"),
-        t.strftime("%m"),
-        t.strftime("%d"),
-        t.strftime("%H"),
-        t.strftime("%M"),
-        t.strftime("%S"),
-    )
     if online:
         resp = r.load_account_profile()
-        if log:
-            if not os.path.exists(account_profile_output_dir):
-                os.makedirs(account_profile_output_dir)
-            account_profile_output_file = os.path.join(
-                account_profile_output_dir,
-                "{}.json".format(t.strftime("%Y_%m_%d_%H_%M_%S")),
-            )
-            with open(account_profile_output_file, "w") as f:
-                f.write(json.dumps(resp, indent=4))
+        if log and bundle is not None:
+            bundle.put("account_profile", resp)
+        elif log:
+            save_snapshot(data_dir, "account_profile", t, resp)
+    elif bundle is not None:
+        resp = bundle.get("account_profile")
     else:
-        latest = datetime.strptime(
-            latest_ds(account_profile_base_dir), "%Y/%m/%d/%H/%M/%S"
-        )
-        account_profile_latest_file: str = os.path.join(
-            account_profile_base_dir,
-            latest.strftime("%Y"),
-            latest.strftime("%m"),
-            latest.strftime("%d"),
-            latest.strftime("%H"),
-            latest.strftime("%M"),
-            latest.strftime("%S"),
-            "{}.json".format(latest.strftime("%Y_%m_%d_%H_%M_%S")),
-        )
-        resp = json.load(open(account_profile_latest_file, "r"))
+        resp = load_snapshot(data_dir, "account_profile")
     assert "margin_balances" in resp
     assert "unallocated_margin_cash" in resp["margin_balances"]
     buying_power: float = float(
@@ -180,123 +179,348 @@ def load_account_profile(
 
 
 def load_holdings(
-    t: datetime, online: bool, log: bool
+    t: datetime,
+    online: bool,
+    log: bool,
+    data_dir: str = "data",
+    from_positions: bool = False,
+    bundle: Optional[SnapshotBundle] = None,
 ) -> Dict[str, HoldingInfo]:
     """
-    Hits the Robinhood API to pull down user's holdings data.
+    Hits the Robinhood API to pull down user's holdings data, with
+    build_holdings() or, if from_positions is set, with fetch_positions().
+    With a bundle, the snapshot is logged to (or read from) the bundle.
+    Offline, the holdings are parsed one record at a time as the snapshot
+    is decoded (see iter_records()).
     """
-    holding_info_base_dir: str = os.path.join("data", "holdings")
-    holding_info_output_dir: str = os.path.join(
-        holding_info_base_dir,
-        t.strftime("%Y"),
-        t.strftime("%m"),
-        t.strftime("%d"),
-        t.strftime("%H"),
-        t.strftime("%M"),
-        t.strftime("%S"),
-    )
     resp: List[Dict[str, Any]] = []
+    records: Iterator[Dict[str, Any]] = iter(resp)
+    if online and from_positions:
+        resp = fetch_positions(
+            InstrumentCache(os.path.join(data_dir, "instruments.json"))
+        )
+    elif online:
+        # Keep the symbol, which build_holdings() only has as the key
+        resp = [
+            dict(holding, symbol=sym)
+            for (sym, holding) in r.build_holdings().items()
+        ]
     if online:
-        resp = list(r.build_holdings().values())
-        if log:
-            if not os.path.exists(holding_info_output_dir):
-                os.makedirs(holding_info_output_dir)
-            holding_info_output_file = os.path.join(
-                holding_info_output_dir,
-                "{}.json".format(t.strftime("%Y_%m_%d_%H_%M_%S")),
-            )
-            with open(holding_info_output_file, "w") as f:
-                f.write(json.dumps(resp, indent=4))
+        records = iter(resp)
+        if log and bundle is not None:
+            bundle.put("holdings", resp)
+        elif log:
+            save_snapshot(data_dir, "holdings", t, resp)
+    elif bundle is not None:
+        records = bundle.records("holdings")
     else:
-        latest = datetime.strptime(
-            latest_ds(holding_info_base_dir), "%Y/%m/%d/%H/%M/%S"
-        )
-        holding_info_latest_file: str = os.path.join(
-            holding_info_base_dir,
-            latest.strftime("%Y"),
-            latest.strftime("%m"),
-            latest.strftime("%d"),
-            latest.strftime("%H"),
-            latest.strftime("%M"),
-            latest.strftime("%S"),
-            "{}.json".format(latest.strftime("%Y_%m_%d_%H_%M_%S")),
-        )
-        resp = json.load(open(holding_info_latest_file, "r"))
+        records = iter_snapshot(data_dir, "holdings")
     holdings: Dict[str, HoldingInfo] = {}
-    for s in resp:
+    for s in records:
         s_id: str = s["id"]
         holdings[s_id] = HoldingInfo(
             s_id,
             s["name"],
             float(s["price"]),
-            int(float(s["quantity"])),
+            float(s["quantity"]),
             float(s["average_buy_price"]),
             float(s["equity"]),
             float(s["percentage"]),
             float(s["percent_change"]),
             float(s["equity_change"]),
+            s.get("symbol"),
         )
     return holdings
 
 
+def derive_securities(holdings: Dict[str, HoldingInfo]) -> Dict[str, Any]:
+    """
+    Returns the security information (in the format load_securities()
+    snapshots) that the holdings already carry: the name, symbol and price
+    of each holding. Holdings loaded from snapshots without symbols are
+    left out.
+    """
+    derived: Dict[str, Any] = {}
+    for (sec_id, hol_info) in holdings.items():
+        sym: Optional[str] = hol_info.get_symbol()
+        if sym is not None:
+            derived[sec_id] = {
+                "name": hol_info.get_name(),
+                "symbol": sym,
+                "price": [str(hol_info.get_price())],
+            }
+    return derived
+
+
+def fetch_instrument(sec_id: str) -> Tuple[Dict[str, Any], float]:
+    """
+    Hits the Robinhood API for the name and symbol of the security. Returns
+    them along with the latency (in milliseconds) of the request.
+    """
+    s: datetime = datetime.now()
+    sec_url = os.path.join("https://api.robinhood.com", "instruments", sec_id)
+    sec_meta = r.get_instrument_by_url(sec_url)
+    latency: float = difference_in_millis(s, datetime.now())
+    return ({"name": sec_meta["name"], "symbol": sec_meta["symbol"]}, latency)
+
+
+def fetch_quotes(symbols: List[str]) -> Tuple[Dict[str, str], float]:
+    """
+    Hits the Robinhood API for the quotes of the symbols in one request.
+    Returns the latest price (as a string) of each symbol, the extended
+    hours price if there is one, along with the latency (in milliseconds) of
+    the request. Quotes are fetched at background priority, so orders go
+    ahead of them.
+    """
+    s: datetime = datetime.now()
+    with priority(BACKGROUND_PRIORITY):
+        quotes = r.get_quotes(symbols)
+    latency: float = difference_in_millis(s, datetime.now())
+    prices: Dict[str, str] = {}
+    for q in quotes or []:
+        # A chunk of symbols none of which has a quote comes back as [None]
+        if q is None:
+            continue
+        if q["last_extended_hours_trade_price"] is None:
+            prices[q["symbol"]] = q["last_trade_price"]
+        else:
+            prices[q["symbol"]] = q["last_extended_hours_trade_price"]
+    return (prices, latency)
+
+
+def fetch_latest_prices(
+    symbols: List[str],
+    chunk_size: int = QUOTE_CHUNK_SIZE,
+    max_workers: int = FETCH_WORKERS,
+) -> Dict[str, str]:
+    """
+    Returns the latest price (as a string) of each symbol, fetching the
+    quotes of up to chunk_size symbols per request with up to max_workers
+    requests in flight at once. Symbols without a quote are left out.
+    """
+    unique: List[str] = list(dict.fromkeys(symbols))
+    chunks: List[List[str]] = []
+    for sym in unique:
+        if len(chunks) == 0 or len(chunks[-1]) == chunk_size:
+            chunks.append([])
+        chunks[-1].append(sym)
+    s: datetime = datetime.now()
+    prices: Dict[str, str] = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for (chunk_prices, latency) in pool.map(fetch_quotes, chunks):
+            log.debug(
+                "Fetched {} quotes in {:.3g} ms.".format(
+                    len(chunk_prices), latency
+                )
+            )
+            prices.update(chunk_prices)
+    if len(chunks) > 0:
+        log.info(
+            "Fetched {} quotes in {} requests. ({})".format(
+                len(prices), len(chunks), latency_str(s, datetime.now())
+            )
+        )
+    missing: List[str] = [sym for sym in unique if sym not in prices]
+    if len(missing) > 0:
+        log.warning("No quotes found for {}.".format(", ".join(missing)))
+    return prices
+
+
+def fetch_securities(
+    security_ids: List[str],
+    max_workers: int = FETCH_WORKERS,
+    cache: Optional[InstrumentCache] = None,
+) -> Dict[str, Any]:
+    """
+    Fetches the name and symbol of every security not in the instrument
+    cache (if given) with up to max_workers requests in flight at once, so
+    their round trips overlap instead of adding up, then fetches all of
+    their prices with fetch_latest_prices(). Returns the fetched information
+    by security id, in the order of security_ids. Fetched instruments are
+    added to the cache.
+    """
+    s: datetime = datetime.now()
+    resp: Dict[str, Any] = dict([(sec_id, None) for sec_id in security_ids])
+    missing: List[str] = []
+    for sec_id in security_ids:
+        cached: Optional[Dict[str, Any]] = (
+            cache.get(sec_id) if cache is not None else None
+        )
+        if cached is not None:
+            resp[sec_id] = cached
+        else:
+            missing.append(sec_id)
+    latencies: List[float] = []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        fetched = pool.map(fetch_instrument, missing)
+        for (sec_id, (info, latency)) in zip(missing, fetched):
+            log.debug(
+                "Fetched instrument {} in {:.3g} ms.".format(sec_id, latency)
+            )
+            resp[sec_id] = info
+            latencies.append(latency)
+            if cache is not None:
+                cache.put(sec_id, info["name"], info["symbol"])
+    if len(latencies) > 0:
+        log.info(
+            "Fetched {} instruments. ({}, {:.3g} ms mean, {:.3g} ms "
+            "max)".format(
+                len(missing),
+                latency_str(s, datetime.now()),
+                sum(latencies) / len(latencies),
+                max(latencies),
+            )
+        )
+    if cache is not None:
+        log.info(
+            "Found {} of {} instruments in the cache.".format(
+                len(security_ids) - len(missing), len(security_ids)
+            )
+        )
+    prices: Dict[str, str] = fetch_latest_prices(
+        [info["symbol"] for info in resp.values()],
+        max_workers=max_workers,
+    )
+    for info in resp.values():
+        sym: str = info["symbol"]
+        info["price"] = [prices[sym]] if sym in prices else []
+    return resp
+
+
+def fetch_positions(
+    cache: Optional[InstrumentCache] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Hits the Robinhood API for the open positions (following the pages of
+    the positions list) and joins them with fetch_securities() for their
+    names, symbols and prices. Returns holdings in the format of
+    build_holdings() (plus the symbol), but in a constant number of requests
+    when the instruments are cached, where build_holdings() makes several
+    per position. Percentages are of the total equity of the positions.
+    """
+    s: datetime = datetime.now()
+    positions: List[Dict[str, Any]] = [
+        p for p in r.get_current_positions() or [] if p is not None
+    ]
+    sec_ids: List[str] = [
+        os.path.basename(p["instrument"].rstrip("/")) for p in positions
+    ]
+    securities: Dict[str, Any] = fetch_securities(sec_ids, cache=cache)
+    if cache is not None:
+        cache.save()
+    held: List[Tuple[str, Dict[str, Any], float]] = []
+    for (sec_id, p) in zip(sec_ids, positions):
+        info: Dict[str, Any] = securities[sec_id]
+        if len(info["price"]) == 0:
+            log.warning(
+                "Omitting position in {} because it has no quote.".format(
+                    sec_id
+                )
+            )
+            continue
+        held.append((sec_id, p, float(info["price"][0])))
+    total_equity: float = sum(
+        [float(p["quantity"]) * price for (_, p, price) in held]
+    )
+    resp: List[Dict[str, Any]] = []
+    for (sec_id, p, price) in held:
+        quantity: float = float(p["quantity"])
+        average_buy_price: float = float(p["average_buy_price"])
+        equity: float = quantity * price
+        resp.append(
+            {
+                "id": sec_id,
+                "name": securities[sec_id]["name"],
+                "symbol": securities[sec_id]["symbol"],
+                "price": securities[sec_id]["price"][0],
+                "quantity": p["quantity"],
+                "average_buy_price": p["average_buy_price"],
+                "equity": "{:.2f}".format(equity),
+                "percentage": "{:.2f}".format(
+                    equity * 100 / total_equity if total_equity else 0.0
+                ),
+                "percent_change": "{:.2f}".format(
+                    (price - average_buy_price) * 100 / average_buy_price
+                    if average_buy_price
+                    else 0.0
+                ),
+                "equity_change": "{:.2f}".format(
+                    (price - average_buy_price) * quantity
+                ),
+            }
+        )
+    log.info(
+        "Fetched {} positions. ({})".format(
+            len(resp), latency_str(s, datetime.now())
+        )
+    )
+    return resp
+
+
 def load_securities(
-    security_ids: List[str], t: datetime, online: bool, log: bool
+    security_ids: List[str],
+    t: datetime,
+    online: bool,
+    log: bool,
+    data_dir: str = "data",
+    cache: Optional[InstrumentCache] = None,
+    derived: Optional[Dict[str, Any]] = None,
+    bundle: Optional[SnapshotBundle] = None,
 ) -> Dict[str, SecurityInfo]:
     """
     Hits the Robinhood API to pull down security information like the latest
-    price and the full security name.
+    price and the full security name. Names and symbols are looked up in the
+    instrument cache first, by default the one kept in data_dir.
+
+    Securities in derived (see derive_securities()) aren't fetched at all;
+    their derived information is used (and snapshotted) instead. With a
+    bundle, the snapshot is logged to (or read from) the bundle.
     """
-    security_info_base_dir: str = os.path.join("data", "securities")
-    security_info_output_dir: str = os.path.join(
-        security_info_base_dir,
-        t.strftime("%Y"),
-        t.strftime("%m"),
-        t.strftime("%d"),
-        t.strftime("%H"),
-        t.strftime("%M"),
-        t.strftime("%S"),
-    )
+    if derived is None:
+        derived = {}
     resp: Dict[str, Any] = {}
     if online:
-        for sec_id in security_ids:
-            sec_url = os.path.join(
-                "https://api.robinhood.com", "instruments", sec_id
-            )
-            sec_meta = r.get_instrument_by_url(sec_url)
-            sec_name = sec_meta["name"]
-            sec_sym = sec_meta["symbol"]
-            sec_price = r.get_latest_price(sec_sym)
-            resp[sec_id] = {
-                "name": sec_name,
-                "symbol": sec_sym,
-                "price": sec_price,
-            }
-        if log:
-            if not os.path.exists(security_info_output_dir):
-                os.makedirs(security_info_output_dir)
-            security_info_output_file = os.path.join(
-                security_info_output_dir,
-                "{}.json".format(t.strftime("%Y_%m_%d_%H_%M_%S")),
-            )
-            with open(security_info_output_file, "w") as f:
-                f.write(json.dumps(resp, indent=4))
-    else:
-        latest = datetime.strptime(
-            latest_ds(security_info_base_dir), "%Y/%m/%d/%H/%M/%S"
+        if cache is None:
+            cache = InstrumentCache(os.path.join(data_dir, "instruments.json"))
+        fetched: Dict[str, Any] = fetch_securities(
+            [sec_id for sec_id in security_ids if sec_id not in derived],
+            cache=cache,
         )
-        security_info_latest_file: str = os.path.join(
-            security_info_base_dir,
-            latest.strftime("%Y"),
-            latest.strftime("%m"),
-            latest.strftime("%d"),
-            latest.strftime("%H"),
-            latest.strftime("%M"),
-            latest.strftime("%S"),
-            "{}.json".format(latest.strftime("%Y_%m_%d_%H_%M_%S")),
+        cache.save()
+        resp = dict(
+            [
+                (
+                    sec_id,
+                    derived[sec_id] if sec_id in derived else fetched[sec_id],
+                )
+                for sec_id in security_ids
+            ]
         )
-        resp = json.load(open(security_info_latest_file, "r"))
+        if log and bundle is not None:
+            bundle.put("securities", resp)
+        elif log:
+            save_snapshot(data_dir, "securities", t, resp)
+    elif bundle is not None:
+        resp = bundle.get("securities")
+    else:
+        resp = load_snapshot(data_dir, "securities")
+        resp.update(derived)
+    return build_securities(resp)
+
+
+def build_securities(resp: Dict[str, Any]) -> Dict[str, SecurityInfo]:
+    """
+    Returns the security information in a securities snapshot (see
+    load_securities()) by security id. Securities without a quote are left
+    out.
+    """
     security_info: Dict[str, SecurityInfo] = {}
     for (sec_id, info) in resp.items():
+        if len(info["price"]) == 0:
+            log.warning(
+                "Omitting security {} because it has no quote.".format(sec_id)
+            )
+            continue
         security_info[sec_id] = SecurityInfo(
             info["name"], info["symbol"], float(info["price"][0])
         )
@@ -304,58 +528,43 @@ def load_securities(
 
 
 def load_dividends(
-    security_ids: List[str], t: datetime, online: bool, log: bool
+    security_ids: List[str],
+    t: datetime,
+    online: bool,
+    log: bool,
+    data_dir: str = "data",
+    bundle: Optional[SnapshotBundle] = None,
 ) -> Dict[str, DividendInfo]:
     """
-    Hits the Robinhood API to pull down user's dividend data.
+    Hits the Robinhood API to pull down user's dividend data. With a bundle,
+    the snapshot is logged to (or read from) the bundle. Offline, the
+    dividends are summed one record at a time as the snapshot is decoded
+    (see iter_records()).
     """
-    dividend_info_base_dir: str = os.path.join("data", "dividends")
-    dividend_info_output_dir: str = os.path.join(
-        dividend_info_base_dir,
-        t.strftime("%Y"),
-        t.strftime("%m"),
-        t.strftime("%d"),
-        t.strftime("%H"),
-        t.strftime("%M"),
-        t.strftime("%S"),
-    )
     resp: List[Dict[str, Any]] = []
+    records: Iterator[Dict[str, Any]] = iter(resp)
     if online:
         resp = list(r.account.get_dividends())
-        if log:
-            if not os.path.exists(dividend_info_output_dir):
-                os.makedirs(dividend_info_output_dir)
-            dividend_info_output_file = os.path.join(
-                dividend_info_output_dir,
-                "{}.json".format(t.strftime("%Y_%m_%d_%H_%M_%S")),
-            )
-            with open(dividend_info_output_file, "w") as f:
-                f.write(json.dumps(resp, indent=4))
+        records = iter(resp)
+        if log and bundle is not None:
+            bundle.put("dividends", resp)
+        elif log:
+            save_snapshot(data_dir, "dividends", t, resp)
+    elif bundle is not None:
+        records = bundle.records("dividends")
     else:
-        latest = datetime.strptime(
-            latest_ds(dividend_info_base_dir), "%Y/%m/%d/%H/%M/%S"
-        )
-        dividend_info_latest_file: str = os.path.join(
-            dividend_info_base_dir,
-            latest.strftime("%Y"),
-            latest.strftime("%m"),
-            latest.strftime("%d"),
-            latest.strftime("%H"),
-            latest.strftime("%M"),
-            latest.strftime("%S"),
-            "{}.json".format(latest.strftime("%Y_%m_%d_%H_%M_%S")),
-        )
-        resp = json.load(open(dividend_info_latest_file, "r"))
-    dividends: Dict[str, DividendInfo] = {}
-    for s in resp:
+        records = iter_snapshot(data_dir, "dividends")
+    # Total dividends by security
+    amounts: Dict[str, float] = {}
+    for s in records:
         s_id: str = os.path.basename(s["instrument"][:-1])
-        amount: float = float(s["amount"])
-        if s_id in dividends:
-            old = dividends[s_id]
-            new = DividendInfo(s_id, old.get_amount() + amount)
-            dividends[s_id] = new
-        else:
-            dividends[s_id] = DividendInfo(s_id, amount)
+        amounts[s_id] = amounts.get(s_id, 0.0) + float(s["amount"])
+    dividends: Dict[str, DividendInfo] = dict(
+        [
+            (s_id, DividendInfo(s_id, amount))
+            for (s_id, amount) in amounts.items()
+        ]
+    )
     no_dividend_securities = list(
         set(security_ids).difference(set(dividends.keys()))
     )
@@ -3,19 +3,37 @@
 # src/asset_class.py
 
 from src.holding import Holding
+from src.knapsack import (
+    LARGE_BUDGET,
+    KnapsackTable,
+    leftover_bound,
+    optimality_gap,
+)
 from src.purchase import Purchase
+from src.scheduler import ORDER_PRIORITY, priority
 from src.security import Security
-from src.util import dollar_str
+from src.util import dollar_str, shares_str
 
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 import robin_stocks as r
 
 import json
 import logging
+import math
 
 log = logging.getLogger(__name__)
 
+# Number of plans each asset class remembers in plan_purchases()
+PLAN_CACHE_SIZE: int = 32
+
+# Decimal places of the share quantities plan_fractional_purchases() plans
+FRACTIONAL_PRECISION: int = 6
+
+# Decimal places of a cent kept when converting prices to cents, enough for
+# quotes with six decimal places of a dollar
+SUB_CENT_DIGITS: int = 4
+
 
 class AssetClass:
     def __init__(self, name: str, target_percentage: float) -> None:
@@ -24,6 +42,9 @@ class AssetClass:
         self.__securities: Dict[str, Security] = {}
         self.__holdings: Dict[str, Holding] = {}
         self.__purchase_buffer: float = 0.0
+        self.__plan_cache: Dict[Tuple[Any, ...], List[int]] = {}
+        self.__plan_cache_hits: int = 0
+        self.__plan_cache_misses: int = 0
 
     def __eq__(self, other: object) -> bool:
         if not isinstance(other, AssetClass):
@@ -61,6 +82,12 @@ class AssetClass:
     def get_value(self) -> float:
         return sum([h.get_value() for h in self.get_holdings()])
 
+    def get_plan_cache_hits(self) -> int:
+        return self.__plan_cache_hits
+
+    def get_plan_cache_misses(self) -> int:
+        return self.__plan_cache_misses
+
     def set_target_percentage(self, target_percentage: float) -> None:
         self.__target_percentage = target_percentage
 
@@ -100,7 +127,7 @@ class AssetClass:
             m = "get_holding(): {} is not in the '{}' asset class's holdings."
             raise Exception(m.format(security_id, self.get_name()))
 
-    def get_num_shares(self) -> int:
+    def get_num_shares(self) -> float:
         """
         Returns the number of shares in this asset class.
         """
@@ -201,7 +228,7 @@ class AssetClass:
     def update_holding(
         self,
         security_id: str,
-        num_shares: int,
+        num_shares: float,
         average_buy_price: float,
         dividends: float,
     ) -> None:
@@ -226,7 +253,7 @@ class AssetClass:
                 "class's securities.".format(security_id, self.get_name())
             )
 
-    def buy(self, security: Security, num_shares: int, online: bool) -> str:
+    def buy(self, security: Security, num_shares: float, online: bool) -> str:
         """
         Adds num_shares of the given security to the holdings of this asset
         class. Returns the state of the buy transaction.
@@ -237,10 +264,10 @@ class AssetClass:
         security_id: str = security.get_id()
         if self.contains_holding(security_id):
             hol: Holding = self.get_holding(security_id)
-            old_num_shares: int = hol.get_num_shares()
+            old_num_shares: float = hol.get_num_shares()
             old_abp: float = hol.get_average_buy_price()
             old_div: float = hol.get_dividends()
-            new_num_shares: int = old_num_shares + num_shares
+            new_num_shares: float = old_num_shares + num_shares
             new_abp: float = (
                 old_abp * old_num_shares + price * num_shares
             ) / (old_num_shares + num_shares)
@@ -250,8 +277,8 @@ class AssetClass:
 
         log.info(
             "Buy {n} {s} of {c} at {p} for a total of {t}? (Y/n) ".format(
-                n=num_shares,
-                s="shares" if num_shares > 1 else "share",
+                n=shares_str(num_shares),
+                s="share" if num_shares == 1 else "shares",
                 c=security.get_symbol(),
                 p=dollar_str(price),
                 t=dollar_str(price * num_shares),
@@ -262,73 +289,195 @@ class AssetClass:
             # Actually buy the ETFs
             user_choice: str = input("").lower()
             if user_choice in ["", "y"]:
-                resp: Dict[str, Any] = r.order_buy_limit(
-                    security.get_symbol(), num_shares, security.get_price()
-                )
+                # Orders go ahead of any quote refreshes waiting to be sent
+                with priority(ORDER_PRIORITY):
+                    resp: Dict[str, Any] = r.order_buy_limit(
+                        security.get_symbol(),
+                        num_shares,
+                        security.get_price(),
+                    )
                 if resp is None:
                     order_state = "failed"
                 else:
                     order_state = resp["state"]
         return order_state
 
-    def plan_purchases(self, budget: float) -> Dict[str, Purchase]:
+    def get_leftover_bound(
+        self, budget: float, granularity: float = 0.01
+    ) -> float:
+        """
+        Returns the most plan_purchases() can leave unspent from the budget
+        when planning at the given granularity (in dollars).
+        """
+        budget_cents: int = int(budget * 100)
+        (_, prices_in_cents) = self.__get_buyable_prices_in_cents()
+        return (
+            leftover_bound(
+                prices_in_cents, budget_cents, int(round(granularity * 100))
+            )
+            / 100.0
+        )
+
+    def build_purchase_table(
+        self,
+        max_budget: float,
+        engine: str = "auto",
+        granularity: float = 0.01,
+        large_budget: float = LARGE_BUDGET / 100.0,
+    ) -> KnapsackTable:
+        """
+        Builds the knapsack table for this asset class's buyable securities
+        once, so plan_purchases() can reuse it for any budget up to
+        max_budget. See plan_purchases() for the other arguments.
+        """
+        (_, prices_in_cents) = self.__get_buyable_prices_in_cents()
+        return KnapsackTable(
+            prices_in_cents,
+            int(max_budget * 100),
+            engine,
+            int(round(granularity * 100)),
+            int(large_budget * 100),
+        )
+
+    def plan_purchases(
+        self,
+        budget: float,
+        engine: str = "auto",
+        granularity: float = 0.01,
+        large_budget: float = LARGE_BUDGET / 100.0,
+        table: Optional[KnapsackTable] = None,
+    ) -> Dict[str, Purchase]:
         """
         Uses a Dynamic Program to determine how to optimally spend the budget
         on the asset class's securities. This is the well known Unbounded
-        Knapsack problem.
+        Knapsack problem. The engine selects the solver in src/knapsack.py
+        ("dp" for the pure Python table, "numpy" for the vectorized table,
+        "bitset" for the integer bitmasks, "bnb" for greedy plus branch and
+        bound). "auto" uses "dp" unless the budget is above large_budget, in
+        which case it uses "bnb". A granularity (in dollars) above a cent
+        plans the bulk of the budget on a coarser grid, which is faster for
+        large budgets, and the residual exactly (see KnapsackTable), leaving
+        at most get_leftover_bound() unspent.
+
+        A table from build_purchase_table() is reused (in place of the other
+        arguments) as long as it covers the budget and the buyable
+        securities' prices haven't changed since it was built.
+
+        The last PLAN_CACHE_SIZE plans are cached by budget, prices, buy
+        restrictions and planning arguments, so an asset class whose
+        securities haven't changed isn't planned again.
         """
         budget_cents: int = int(budget * 100)
         if budget_cents < 0:
             return {}
+        (sec_ids, prices_in_cents) = self.__get_buyable_prices_in_cents()
+        key: Tuple[Any, ...] = (
+            budget_cents,
+            tuple(zip(sec_ids, prices_in_cents)),
+            tuple(
+                [
+                    s.get_id()
+                    for s in self.get_securities()
+                    if s.get_buy_restricted()
+                ]
+            ),
+            engine,
+            granularity,
+            large_budget,
+        )
+        counts: List[int] = []
+        if key in self.__plan_cache:
+            self.__plan_cache_hits += 1
+            counts = self.__plan_cache[key]
+        else:
+            self.__plan_cache_misses += 1
+            if (
+                table is None
+                or table.get_prices() != prices_in_cents
+                or table.get_budget() < budget_cents
+            ):
+                table = KnapsackTable(
+                    prices_in_cents,
+                    budget_cents,
+                    engine,
+                    int(round(granularity * 100)),
+                    int(large_budget * 100),
+                )
+            counts = table.solve(budget_cents)
+            self.__plan_cache[key] = counts
+            if len(self.__plan_cache) > PLAN_CACHE_SIZE:
+                # Evict the oldest plan
+                del self.__plan_cache[next(iter(self.__plan_cache))]
+        log.debug(
+            "Planned purchases for '{}' at most {} short of optimal.".format(
+                self.get_name(),
+                dollar_str(
+                    optimality_gap(prices_in_cents, budget_cents, counts)
+                    / 100.0
+                ),
+            )
+        )
+        # Prune purchases of no shares from return value
+        return dict(
+            [
+                (s_id, Purchase(self.get_security(s_id), n))
+                for (s_id, n) in zip(sec_ids, counts)
+                if n != 0
+            ]
+        )
 
-        sec_ids: List[str] = []
-        prices_in_cents: List[int] = []
+    def plan_fractional_purchases(self, budget: float) -> Dict[str, Purchase]:
+        """
+        Splits the budget evenly across the asset class's buyable securities
+        and buys fractional shares of each, so (up to rounding the quantities
+        down to FRACTIONAL_PRECISION decimal places) nothing is left unspent.
+        Takes time linear in the number of securities.
+        """
+        securities: List[Security] = self.get_buyable_securities()
+        if budget <= 0 or len(securities) == 0:
+            return {}
+        scale: int = 10**FRACTIONAL_PRECISION
+        share_budget: float = budget / len(securities)
+        purchases: Dict[str, Purchase] = {}
+        for s in securities:
+            price = s.get_price()
+            if price is not None:
+                units: int = math.floor(share_budget / price * scale)
+                if units > 0:
+                    purchases[s.get_id()] = Purchase(s, units / scale)
+        return purchases
+
+    def get_buyable_securities(self) -> List[Security]:
+        """
+        Returns the securities in this asset class that can be bought, i.e.
+        that aren't buy restricted and have a price.
+        """
+        buyable: List[Security] = []
         for s in self.get_securities():
             if not s.get_buy_restricted():
-                s_id = s.get_id()
-                price = s.with_cents().get_price()
-                if price is not None:
-                    sec_ids.append(s_id)
-                    prices_in_cents.append(int(price))
+                if s.get_price() is not None:
+                    buyable.append(s)
                 else:
                     log.warn(
                         "Omitting {} from purchases because it has an "
-                        "undefined price".format(s_id)
+                        "undefined price".format(s.get_id())
                     )
+        return buyable
 
-        # Purchase at T[i] maximizes expenditure with budget i
-        T: List[int] = [0 for x in range(budget_cents + 1)]
-        for b_cents in range(budget_cents + 1):
-            for (j_id, j_price_cents) in zip(sec_ids, prices_in_cents):
-                # Check if budget of b allows for a purchase of j
-                if j_price_cents <= b_cents:
-                    # Check if buying it increases expenditures
-                    cur_exp: int = T[b_cents]
-                    new_exp: int = T[b_cents - j_price_cents] + j_price_cents
-                    if new_exp > cur_exp:
-                        # Optimal purchases at budget i now includes buying j
-                        T[b_cents] = new_exp
-
-        # Backtrack thru T to construct set of optimal purchases
-        purchases: Dict[str, Purchase] = {}
-        i: int = len(T) - 1
-        while T[i]:
-            exp_i: int = T[i]  # Optimal amount spent at budget i
-            # Find last security purchased
-            for (j_id, j_price_cents) in zip(sec_ids, prices_in_cents):
-                # If buying security j brought us to optimal expenditures at
-                # budget i
-                if (
-                    exp_i - j_price_cents >= 0
-                    and T[exp_i - j_price_cents] + j_price_cents == exp_i
-                ):
-                    if j_id in purchases:
-                        purchases[j_id].add_shares(1)
-                    else:
-                        purchases[j_id] = Purchase(self.get_security(j_id), 1)
-                    break
-            i = exp_i - j_price_cents + 1
-        # Prune purchases of no shares from return value
-        return dict(
-            [(s, p) for (s, p) in purchases.items() if p.get_num_shares() != 0]
-        )
+    def __get_buyable_prices_in_cents(self) -> Tuple[List[str], List[int]]:
+        """
+        Returns the ids and prices (in cents) of the securities in this asset
+        class that can be bought.
+        """
+        sec_ids: List[str] = []
+        prices_in_cents: List[int] = []
+        for s in self.get_buyable_securities():
+            price = s.with_cents().get_price()
+            if price is not None:
+                sec_ids.append(s.get_id())
+                # Round away float noise (1.15 * 100 is 114.999...), then up,
+                # so a sub-cent quote is never planned cheaper than ordered
+                prices_in_cents.append(
+                    math.ceil(round(price, SUB_CENT_DIGITS))
+                )
+        return (sec_ids, prices_in_cents)
@@ -0,0 +1,187 @@
+# Ricky Galliani
+# Hanna
+# src/cassette.py
+
+from requests.adapters import BaseAdapter
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import json
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# Response fields never written to a cassette, so recordings of a live
+# session don't leak its credentials
+REDACTED_KEYS: List[str] = ["access_token", "refresh_token", "mfa_code"]
+
+
+class Cassette:
+    def __init__(self, path: str, fresh: bool = False) -> None:
+        """
+        A recording of broker requests and their responses, along with how
+        long each response took, kept in the JSON file at path, which is
+        read now if it exists (unless fresh is set, to record over it) and
+        written by save().
+        """
+        self.__path: str = path
+        self.__interactions: List[Dict[str, Any]] = []
+        # Recorded responses and how many have been played, by request
+        self.__recorded: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        self.__played: Dict[Tuple[str, str], int] = {}
+        self.__lock: threading.Lock = threading.Lock()
+        if os.path.exists(path) and not fresh:
+            with open(path, "r") as f:
+                for interaction in json.load(f):
+                    self.__add(interaction)
+
+    def __len__(self) -> int:
+        return len(self.__interactions)
+
+    def get_path(self) -> str:
+        return self.__path
+
+    def get_interactions(self) -> List[Dict[str, Any]]:
+        return self.__interactions
+
+    def get_played(self) -> int:
+        """
+        Returns the number of responses played since the last rewind().
+        """
+        return sum(self.__played.values())
+
+    def record(
+        self,
+        method: str,
+        url: str,
+        status: int,
+        content: bytes,
+        latency: float,
+    ) -> None:
+        """
+        Adds the response (with its latency in milliseconds) to a request.
+        Request bodies aren't kept, since a login's holds the password.
+        """
+        text: str = content.decode("utf-8", "replace")
+        try:
+            text = json.dumps(redact(json.loads(text)))
+        except ValueError:
+            pass
+        with self.__lock:
+            self.__add(
+                {
+                    "method": method,
+                    "url": url,
+                    "status": status,
+                    "content": text,
+                    "latency": round(latency, 3),
+                }
+            )
+
+    def play(self, method: str, url: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns the next recorded response to the request, in the order they
+        were recorded, or the last one again once they've all been played.
+        Returns None if the request was never recorded.
+        """
+        matches: List[Dict[str, Any]] = self.__recorded.get((method, url), [])
+        if len(matches) == 0:
+            return None
+        with self.__lock:
+            played: int = self.__played.get((method, url), 0)
+            self.__played[(method, url)] = played + 1
+        return matches[min(played, len(matches) - 1)]
+
+    def rewind(self) -> None:
+        """
+        Plays every response from the start again.
+        """
+        with self.__lock:
+            self.__played = {}
+
+    def save(self) -> None:
+        """
+        Writes the cassette to its file, replacing the old file only once the
+        new one is fully written.
+        """
+        cassette_dir: str = os.path.dirname(self.get_path())
+        if cassette_dir != "" and not os.path.exists(cassette_dir):
+            os.makedirs(cassette_dir)
+        tmp_path: str = "{}.tmp".format(self.get_path())
+        with open(tmp_path, "w") as f:
+            f.write(json.dumps(self.__interactions, indent=4))
+        os.replace(tmp_path, self.get_path())
+        log.info(
+            "Saved {} interactions to {}.".format(len(self), self.get_path())
+        )
+
+    def __add(self, interaction: Dict[str, Any]) -> None:
+        self.__interactions.append(interaction)
+        key: Tuple[str, str] = (interaction["method"], interaction["url"])
+        self.__recorded.setdefault(key, []).append(interaction)
+
+
+def redact(data: Any) -> Any:
+    """
+    Returns the JSON data with the values of REDACTED_KEYS blanked out.
+    """
+    if isinstance(data, dict):
+        return dict(
+            [
+                (k, "REDACTED" if k in REDACTED_KEYS else redact(v))
+                for (k, v) in data.items()
+            ]
+        )
+    if isinstance(data, list):
+        return [redact(v) for v in data]
+    return data
+
+
+class ReplayAdapter(BaseAdapter):
+    def __init__(self, cassette: Cassette, speed: float = 1.0) -> None:
+        """
+        A transport adapter answering requests from the cassette instead of
+        the network, each after its recorded latency divided by speed (so 1
+        replays at the original speed, 10 ten times faster and 0 at once).
+        """
+        super().__init__()
+        self.__cassette: Cassette = cassette
+        self.__speed: float = speed
+
+    def get_cassette(self) -> Cassette:
+        return self.__cassette
+
+    def get_speed(self) -> float:
+        return self.__speed
+
+    def send(self, request: Any, *args: Any, **kwargs: Any) -> Response:
+        interaction: Optional[Dict[str, Any]] = self.get_cassette().play(
+            request.method, request.url
+        )
+        if interaction is None:
+            raise Exception(
+                "send(): {} {} isn't in {}".format(
+                    request.method,
+                    request.url,
+                    self.get_cassette().get_path(),
+                )
+            )
+        if self.get_speed() > 0:
+            time.sleep(interaction["latency"] / 1000 / self.get_speed())
+        resp: Response = Response()
+        resp.status_code = interaction["status"]
+        resp.headers = CaseInsensitiveDict(
+            {"Content-Type": "application/json"}
+        )
+        resp._content = interaction["content"].encode("utf-8")
+        resp.encoding = "utf-8"
+        resp.url = request.url
+        resp.request = request
+        return resp
+
+    def close(self) -> None:
+        pass
@@ -4,7 +4,7 @@
 
 from src.purchase import Purchase
 from src.security import Security
-from src.util import dollar_str
+from src.util import dollar_str, shares_str
 
 from prettytable import PrettyTable
 from typing import Any, Dict, List, KeysView, Optional, Tuple
@@ -15,7 +15,7 @@ import json
 class Deposit:
     def __init__(self) -> None:
         self.__total: float = 0.0  # Total spent on all purchases
-        self.__num_shares: int = 0  # Total shares bought on all purchases
+        self.__num_shares: float = 0  # Total shares bought on all purchases
         self.__purchases: Dict[str, List[Purchase]] = {}
 
     def __eq__(self, other: object) -> bool:
@@ -29,7 +29,7 @@ class Deposit:
     def get_total(self) -> float:
         return self.__total
 
-    def get_num_shares(self) -> int:
+    def get_num_shares(self) -> float:
         return self.__num_shares
 
     def get_purchases(self) -> Dict[str, List[Purchase]]:
@@ -72,13 +72,13 @@ class Deposit:
                 sec: Security = p.get_security()
                 name: Optional[str] = sec.get_name()
                 sym: Optional[str] = sec.get_symbol()
-                shares: int = p.get_num_shares()
+                shares: str = shares_str(p.get_num_shares())
                 price: Optional[float] = sec.get_price()
                 price_str: str = dollar_str(price) if price is not None else ""
                 cost: str = dollar_str(p_cost)
                 p_sec.add_row([ac_name, name, sym, shares, price_str, cost])
         p_ac.add_row(["Total", dollar_str(self.get_total())])
-        tot_shares: int = self.get_num_shares()
+        tot_shares: str = shares_str(self.get_num_shares())
         tot_cost: float = self.get_total()
         p_sec.add_row(
             ["Total", "-", "-", tot_shares, "-", dollar_str(tot_cost)]
@@ -104,6 +104,19 @@ class Deposit:
         """
         return asset_class_name in self.get_involved_asset_classes()
 
+    def is_fractional(self) -> bool:
+        """
+        Returns whether any purchase in this deposit is of a fractional
+        number of shares.
+        """
+        return any(
+            [
+                not float(p.get_num_shares()).is_integer()
+                for ps in self.get_purchases().values()
+                for p in ps
+            ]
+        )
+
     def get_purchases_for_asset_class(
         self, asset_class_name: str
     ) -> List[Purchase]:
@@ -13,7 +13,7 @@ class Holding:
     def __init__(
         self,
         security: Security,
-        num_shares: int,
+        num_shares: float,
         average_buy_price: float,
         dividends: float = 0.0,
     ) -> None:
@@ -26,7 +26,7 @@ class Holding:
                 "Holding must be instantiated with a positive number of shares"
             )
         self.__security: Security = security
-        self.__num_shares: int = num_shares
+        self.__num_shares: float = num_shares
         self.__average_buy_price: float = average_buy_price
         self.__dividends: float = dividends
 
@@ -41,7 +41,7 @@ class Holding:
     def get_security(self) -> Security:
         return self.__security
 
-    def get_num_shares(self) -> int:
+    def get_num_shares(self) -> float:
         return self.__num_shares
 
     def get_average_buy_price(self) -> float:
@@ -61,7 +61,7 @@ class Holding:
 
     def get_cost(self) -> float:
         abp: float = self.get_average_buy_price()
-        num_shares: int = self.get_num_shares()
+        num_shares: float = self.get_num_shares()
         return abp * num_shares
 
     def get_return(self) -> float:
@@ -71,13 +71,13 @@ class Holding:
                 "Can't compute holding return, underlying "
                 "security has undefined price"
             )
-        num_shares: int = self.get_num_shares()
+        num_shares: float = self.get_num_shares()
         value: float = price * num_shares
         cost: float = self.get_average_buy_price() * num_shares
         dividends: float = self.get_dividends()
         return (value - cost + dividends) / cost
 
-    def set_num_shares(self, num_shares: int) -> None:
+    def set_num_shares(self, num_shares: float) -> None:
         self.__num_shares = num_shares
 
     def set_average_buy_price(self, average_buy_price: float) -> None:
@@ -0,0 +1,135 @@
+# Ricky Galliani
+# Hanna
+# src/instrument_cache.py
+
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import json
+import logging
+import os
+
+log = logging.getLogger(__name__)
+
+# How long a cached instrument is trusted before it's fetched again
+INSTRUMENT_TTL: timedelta = timedelta(days=7)
+
+# Format of the fetch times stored in the cache file
+FETCHED_AT_FORMAT: str = "%Y-%m-%dT%H:%M:%S"
+
+
+class InstrumentCache:
+    def __init__(
+        self,
+        path: str = os.path.join("data", "instruments.json"),
+        ttl: timedelta = INSTRUMENT_TTL,
+    ) -> None:
+        """
+        Caches the name and symbol of instruments by instrument (security)
+        id in the JSON file at path, which is read now if it exists and
+        written by save(). Entries older than ttl are treated as missing.
+        """
+        self.__path: str = path
+        self.__ttl: timedelta = ttl
+        self.__entries: Dict[str, Dict[str, Any]] = {}
+        self.__hits: int = 0
+        self.__misses: int = 0
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self.__entries = json.load(f)
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def get_path(self) -> str:
+        return self.__path
+
+    def get_hits(self) -> int:
+        return self.__hits
+
+    def get_misses(self) -> int:
+        return self.__misses
+
+    def get(
+        self, sec_id: str, now: Optional[datetime] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Returns the cached name and symbol of the instrument, or None if it
+        isn't cached or has expired.
+        """
+        entry: Optional[Dict[str, Any]] = self.__entries.get(sec_id)
+        if entry is not None and not self.__expired(entry, now):
+            self.__hits += 1
+            return {"name": entry["name"], "symbol": entry["symbol"]}
+        self.__misses += 1
+        return None
+
+    def get_by_symbol(
+        self, symbol: str, now: Optional[datetime] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Returns the cached id and name of the instrument with the given
+        symbol, or None if it isn't cached or has expired.
+        """
+        for (sec_id, entry) in self.__entries.items():
+            if entry["symbol"] == symbol and not self.__expired(entry, now):
+                self.__hits += 1
+                return {"id": sec_id, "name": entry["name"]}
+        self.__misses += 1
+        return None
+
+    def put(
+        self,
+        sec_id: str,
+        name: str,
+        symbol: str,
+        now: Optional[datetime] = None,
+    ) -> None:
+        """
+        Caches the name and symbol of the instrument as fetched now.
+        """
+        fetched_at: datetime = datetime.now() if now is None else now
+        self.__entries[sec_id] = {
+            "name": name,
+            "symbol": symbol,
+            "fetched_at": fetched_at.strftime(FETCHED_AT_FORMAT),
+        }
+
+    def invalidate(self, sec_ids: Optional[List[str]] = None) -> None:
+        """
+        Drops the given instruments from the cache, or every instrument if
+        none are given.
+        """
+        if sec_ids is None:
+            self.__entries = {}
+        else:
+            for sec_id in sec_ids:
+                self.__entries.pop(sec_id, None)
+
+    def save(self) -> None:
+        """
+        Writes the cache to its file, replacing the old file only once the
+        new one is fully written.
+        """
+        cache_dir: str = os.path.dirname(self.get_path())
+        if cache_dir != "" and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        tmp_path: str = "{}.tmp".format(self.get_path())
+        with open(tmp_path, "w") as f:
+            f.write(json.dumps(self.__entries, indent=4))
+        os.replace(tmp_path, self.get_path())
+        log.info(
+            "Saved {} instruments to {}. ({} hits, {} misses)".format(
+                len(self), self.get_path(), self.get_hits(), self.get_misses()
+            )
+        )
+
+    def __expired(
+        self, entry: Dict[str, Any], now: Optional[datetime] = None
+    ) -> bool:
+        if now is None:
+            now = datetime.now()
+        fetched_at: datetime = datetime.strptime(
+            entry["fetched_at"], FETCHED_AT_FORMAT
+        )
+        return now - fetched_at > self.__ttl
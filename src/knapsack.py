@@ -0,0 +1,417 @@
+# Ricky Galliani
+# Hanna
+# src/knapsack.py
+
+from functools import reduce
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import math
+import numpy as np
+
+
+def build_table(prices: List[int], budget: int) -> List[int]:
+    """
+    Builds the Unbounded Knapsack table T for the given prices, where T[i] is
+    the maximum amount that can be spent with a budget of i.
+    """
+    T: List[int] = [0 for x in range(budget + 1)]
+    for b in range(budget + 1):
+        for price in prices:
+            # Check if budget of b allows for a purchase at this price
+            if price <= b:
+                # Check if buying it increases expenditures
+                new_exp: int = T[b - price] + price
+                if new_exp > T[b]:
+                    T[b] = new_exp
+    return T
+
+
+def backtrack(T: List[int], prices: List[int], budget: int) -> List[int]:
+    """
+    Walks back through T from the given budget and returns the number of
+    units bought at each price. When several prices lead to the optimal
+    expenditures, the first one is chosen.
+    """
+    counts: List[int] = [0 for p in prices]
+    i: int = budget
+    while T[i]:
+        exp_i: int = T[i]  # Optimal amount spent at budget i
+        # Find last unit purchased
+        for (j, price) in enumerate(prices):
+            # If buying unit j brought us to optimal expenditures at budget i
+            if exp_i - price >= 0 and T[exp_i - price] + price == exp_i:
+                counts[j] += 1
+                i = exp_i - price
+                break
+    return counts
+
+
+def build_table_numpy(prices: List[int], budget: int) -> np.ndarray:
+    """
+    Builds the same table as build_table() using one vectorized pass per
+    price. It tracks the leftover W[b] = b - T[b] instead of T: viewing W as
+    rows of length p, buying units at price p makes W[k*p + r] the minimum of
+    W[m*p + r] over m <= k, which is a cumulative min down the columns.
+    """
+    dtype = np.int32 if budget < np.iinfo(np.int32).max else np.int64
+    W: np.ndarray = np.arange(budget + 1, dtype=dtype)
+    for price in prices:
+        if price > budget:
+            continue
+        full: int = (budget + 1) // price * price
+        grid: np.ndarray = W[:full].reshape(-1, price)
+        np.minimum.accumulate(grid, axis=0, out=grid)
+        # Fold the last row into the partial row hanging off the end of W
+        tail: np.ndarray = W[full:]
+        np.minimum(tail, grid[-1, : len(tail)], out=tail)
+    return np.arange(budget + 1, dtype=dtype) - W
+
+
+def backtrack_numpy(
+    T: np.ndarray, prices: List[int], budget: int
+) -> List[int]:
+    """
+    Same walk as backtrack(), but checks every price at each step with a
+    single vectorized comparison.
+    """
+    counts: List[int] = [0 for p in prices]
+    if len(prices) == 0:
+        return counts
+    price_arr: np.ndarray = np.array(prices, dtype=np.int64)
+    i: int = budget
+    while T[i]:
+        exp_i: int = int(T[i])
+        prev: np.ndarray = exp_i - price_arr
+        found: np.ndarray = prev >= 0
+        found[found] = T[prev[found]] + price_arr[found] == exp_i
+        j: int = int(np.argmax(found))
+        counts[j] += 1
+        i = exp_i - prices[j]
+    return counts
+
+
+def build_bitset(prices: List[int], budget: int) -> List[int]:
+    """
+    Builds the reachable expenditures for the given prices as integer
+    bitmasks, where bit i is set if exactly i can be spent. Returns the mask
+    after each price is added (starting with only 0 reachable) so the
+    backtrack can recover the units bought. Each price is added by shift-ORs
+    of doubling multiples of the price.
+    """
+    mask: int = (1 << (budget + 1)) - 1
+    reach: int = 1
+    stages: List[int] = [reach]
+    for price in prices:
+        shift: int = price
+        while shift <= budget:
+            reach |= (reach << shift) & mask
+            shift *= 2
+        stages.append(reach)
+    return stages
+
+
+def backtrack_bitset(
+    stages: List[int], prices: List[int], budget: int
+) -> List[int]:
+    """
+    Walks back through the bitmasks from build_bitset(), starting from the
+    largest expenditure reachable within the budget. Buys as few units as
+    possible at the later prices so the earlier prices are preferred, like
+    backtrack().
+    """
+    counts: List[int] = [0 for p in prices]
+    mask: int = (1 << (budget + 1)) - 1
+    exp: int = (stages[-1] & mask).bit_length() - 1
+    num_bytes: int = budget // 8 + 1
+    for j in range(len(prices) - 1, -1, -1):
+        bits: bytes = (stages[j] & mask).to_bytes(num_bytes, "little")
+        while not bits[exp >> 3] >> (exp & 7) & 1:
+            exp -= prices[j]
+            counts[j] += 1
+    return counts
+
+
+ENGINES: Dict[str, Tuple[Callable[..., Any], Callable[..., List[int]]]] = {
+    "dp": (build_table, backtrack),
+    "numpy": (build_table_numpy, backtrack_numpy),
+    "bitset": (build_bitset, backtrack_bitset),
+}
+
+
+# Budgets (in cents) above which the "auto" engine switches from the cents
+# table to branch and bound
+LARGE_BUDGET: int = 10000000
+
+# Multiples of the largest price solve_bnb() leaves for branch and bound
+BNB_RESERVE: int = 50
+
+# Search nodes explored by solve_bnb() before settling for the best plan found
+BNB_MAX_NODES: int = 200000
+
+# Multiples of the largest rounded price a coarse plan's residual is planned
+# exactly within, the rest of it being spent on the cheapest security first
+RESIDUAL_RESERVE: int = 2
+
+
+def solve_bnb(
+    prices: List[int], budget: int, reserve: Optional[int] = None
+) -> List[int]:
+    """
+    Solves the Unbounded Knapsack problem without a table that grows with the
+    budget. Everything but a reserve (BNB_RESERVE of the largest price by
+    default) is spent greedily, largest price first since every price has
+    the same value to weight ratio. The residual is then solved exactly by
+    branch and bound, pruning any branch that can't beat the best plan even
+    if it spent every remaining multiple of the GCD of its prices.
+    optimality_gap() bounds how far the result is from the optimum.
+    """
+    counts: List[int] = [0 for p in prices]
+    if len(prices) == 0 or budget < 0:
+        return counts
+    order: List[int] = sorted(
+        range(len(prices)), key=lambda j: prices[j], reverse=True
+    )
+    if reserve is None:
+        reserve = BNB_RESERVE * prices[order[0]]
+
+    # Buy the bulk greedily
+    left: int = budget
+    bulk: int = max(budget - reserve, 0)
+    for j in order:
+        counts[j] = bulk // prices[j]
+        bulk -= counts[j] * prices[j]
+        left -= counts[j] * prices[j]
+
+    # Branch and bound on the residual, largest price first
+    sorted_prices: List[int] = [prices[j] for j in order]
+    suffix_gcds: List[int] = [0 for p in range(len(prices) + 1)]
+    for i in range(len(prices) - 1, -1, -1):
+        suffix_gcds[i] = math.gcd(sorted_prices[i], suffix_gcds[i + 1])
+    upper: int = left - left % suffix_gcds[0]
+    best: List[Any] = [0, [0 for p in prices]]
+    current: List[int] = [0 for p in prices]
+    nodes: List[int] = [0]
+
+    def branch(i: int, remaining: int) -> None:
+        nodes[0] += 1
+        spent: int = left - remaining
+        if spent > best[0]:
+            best[0] = spent
+            best[1] = list(current)
+        if i == len(sorted_prices) or best[0] == upper:
+            return
+        reachable: int = remaining - remaining % suffix_gcds[i]
+        if spent + reachable <= best[0]:
+            return
+        price: int = sorted_prices[i]
+        for c in range(remaining // price, -1, -1):
+            if best[0] == upper or nodes[0] >= BNB_MAX_NODES:
+                break
+            current[i] = c
+            branch(i + 1, remaining - c * price)
+        current[i] = 0
+
+    branch(0, left)
+    for (i, j) in enumerate(order):
+        counts[j] += best[1][i]
+    return counts
+
+
+def optimality_gap(prices: List[int], budget: int, counts: List[int]) -> int:
+    """
+    Returns a proven upper bound on how much less the given purchases spend
+    than the optimal ones: no plan can spend more than the largest multiple
+    of the GCD of the prices within the budget.
+    """
+    if len(prices) == 0 or budget < 0:
+        return 0
+    gcd: int = reduce(math.gcd, prices)
+    spent: int = sum([c * p for (c, p) in zip(counts, prices)])
+    return budget - budget % gcd - spent
+
+
+def grid_prices(prices: List[int], granularity: int = 1) -> List[int]:
+    """
+    Returns the prices rounded up to the granularity, in units of the
+    granularity. Rounding up keeps every purchase planned on the coarse grid
+    within the real budget.
+    """
+    return [-(-price // granularity) for price in prices]
+
+
+def residual_bound(
+    prices: List[int], budget: int, granularity: int = 1
+) -> int:
+    """
+    Returns the most of what a plan on the grid of the given granularity
+    leaves unspent (for any budget up to the given one) that is then planned
+    exactly. An optimal plan on the grid leaves less than the cheapest price
+    in grid units, the budget loses up to granularity - 1 to rounding down,
+    and every unit bought may have been rounded up by up to granularity - 1.
+    That grows with the number of units bought, so only up to
+    RESIDUAL_RESERVE of the largest rounded price is planned exactly.
+    """
+    if len(prices) == 0 or budget < 0:
+        return max(budget, 0)
+    units: int = budget // granularity
+    grid: List[int] = grid_prices(prices, granularity)
+    cheapest: int = min(grid)
+    return min(
+        budget,
+        granularity * cheapest - 1 + (granularity - 1) * (units // cheapest),
+        RESIDUAL_RESERVE * granularity * max(grid),
+    )
+
+
+def leftover_bound(
+    prices: List[int], budget: int, granularity: int = 1
+) -> int:
+    """
+    Returns the most that can be left unspent by solve() for the given
+    prices, budget and granularity. What the coarse grid leaves unspent is
+    planned again on the exact grid, so at any granularity an optimal plan
+    leaves less than the cheapest price.
+    """
+    if len(prices) == 0 or budget < 0:
+        return max(budget, 0)
+    return min(budget, min(prices) - 1)
+
+
+class KnapsackTable:
+    def __init__(
+        self,
+        prices: List[int],
+        budget: int,
+        engine: str = "auto",
+        granularity: int = 1,
+        large_budget: int = LARGE_BUDGET,
+    ) -> None:
+        """
+        Builds the table for the Unbounded Knapsack problem (where value
+        equals weight) with the given integer prices and budget, which then
+        answers solve() for any budget up to it. The "auto" engine uses the
+        "dp" table up to large_budget and "bnb" above it.
+
+        The problem is solved on a grid whose cells are the granularity times
+        the GCD of the (rounded) prices. With a granularity of 1 this is
+        exact and only shrinks the table. A coarser granularity plans the
+        bulk of the budget on a proportionally smaller table, then plans the
+        residual it leaves unspent exactly on a second table of at most
+        residual_bound(), which doesn't grow with the budget, so it still
+        leaves at most leftover_bound() unspent.
+        """
+        if engine == "auto":
+            engine = "bnb" if budget > large_budget else "dp"
+        if engine not in ENGINES and engine != "bnb":
+            raise Exception(
+                "KnapsackTable(): unknown engine '{}', expected one of "
+                "{}.".format(
+                    engine, sorted(list(ENGINES.keys()) + ["auto", "bnb"])
+                )
+            )
+        if granularity < 1:
+            raise Exception(
+                "KnapsackTable(): granularity must be a positive integer."
+            )
+        self.__prices: List[int] = prices
+        self.__budget: int = budget
+        self.__engine: str = engine
+        self.__granularity: int = granularity
+        self.__cell: int = granularity
+        self.__grid: List[int] = []
+        self.__T: Any = None
+        self.__residual: Optional[KnapsackTable] = None
+        if budget >= 0 and len(prices) > 0:
+            units: List[int] = grid_prices(prices, granularity)
+            gcd: int = reduce(math.gcd, units)
+            self.__cell = granularity * gcd
+            self.__grid = [u // gcd for u in units]
+            if engine != "bnb":
+                build, _ = ENGINES[engine]
+                self.__T = build(self.__grid, budget // self.__cell)
+            if granularity > 1:
+                self.__residual = KnapsackTable(
+                    prices,
+                    residual_bound(prices, budget, granularity),
+                    engine,
+                    1,
+                    large_budget,
+                )
+
+    def get_prices(self) -> List[int]:
+        return self.__prices
+
+    def get_budget(self) -> int:
+        return self.__budget
+
+    def get_engine(self) -> str:
+        return self.__engine
+
+    def get_granularity(self) -> int:
+        return self.__granularity
+
+    def solve(self, budget: int) -> List[int]:
+        """
+        Returns the number of units bought at each price to spend the given
+        budget, which can't be more than the budget the table was built for.
+        """
+        if budget > self.get_budget():
+            raise Exception(
+                "solve(): budget {} is more than the table's budget "
+                "{}.".format(budget, self.get_budget())
+            )
+        if budget < 0 or len(self.__grid) == 0:
+            return [0 for p in self.get_prices()]
+        grid_budget: int = budget // self.__cell
+        counts: List[int] = []
+        if self.get_engine() == "bnb":
+            counts = solve_bnb(self.__grid, grid_budget)
+        else:
+            _, walk = ENGINES[self.get_engine()]
+            counts = walk(self.__T, self.__grid, grid_budget)
+        if self.__residual is not None:
+            # Spend what the coarse grid left unspent on the cheapest
+            # security down to the residual table's budget, then plan the
+            # rest exactly
+            prices: List[int] = self.get_prices()
+            left: int = budget - sum([c * p for (c, p) in zip(counts, prices)])
+            excess: int = left - self.__residual.get_budget()
+            if excess > 0:
+                j: int = prices.index(min(prices))
+                bulk: int = -(-excess // prices[j])
+                counts[j] += bulk
+                left -= bulk * prices[j]
+            counts = [
+                c + r for (c, r) in zip(counts, self.__residual.solve(left))
+            ]
+        return counts
+
+    def get_size(self) -> int:
+        """
+        Returns the number of budgets (grid cells) this table and its
+        residual table cover, which is 0 for "bnb" as it builds no table.
+        """
+        size: int = 0
+        if self.__T is not None:
+            size = self.get_budget() // self.__cell + 1
+        if self.__residual is not None:
+            size += self.__residual.get_size()
+        return size
+
+
+def solve(
+    prices: List[int],
+    budget: int,
+    engine: str = "auto",
+    granularity: int = 1,
+    large_budget: int = LARGE_BUDGET,
+) -> List[int]:
+    """
+    Solves the Unbounded Knapsack problem (where value equals weight) for the
+    given integer prices and budget with the given engine (see
+    KnapsackTable). Returns the number of units bought at each price.
+    """
+    table: KnapsackTable = KnapsackTable(
+        prices, budget, engine, granularity, large_budget
+    )
+    return table.solve(budget)
@@ -5,11 +5,13 @@
 from src.asset_class import AssetClass
 from src.deposit import Deposit
 from src.holding import Holding
+from src.knapsack import LARGE_BUDGET, KnapsackTable
 from src.api import (
     AccountProfile,
     DividendInfo,
     HoldingInfo,
     SecurityInfo,
+    derive_securities,
     load_account_profile,
     load_dividends,
     load_holdings,
@@ -17,11 +19,34 @@ from src.api import (
 )
 from src.purchase import Purchase
 from src.security import Security
-from src.util import latency_str, dollar_str, pct_str
+from src.snapshot_store import (
+    SnapshotBundle,
+    bundle_times,
+    load_bundle,
+    save_bundle,
+)
+from src.util import (
+    difference_in_millis,
+    dollar_str,
+    latency_str,
+    pct_str,
+    shares_str,
+    timed,
+)
 
-from datetime import datetime
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
 from prettytable import PrettyTable
-from typing import Any, Dict, KeysView, List, Optional, Tuple, ValuesView
+from typing import (
+    Any,
+    Dict,
+    Iterator,
+    KeysView,
+    List,
+    Optional,
+    Tuple,
+    ValuesView,
+)
 
 import json
 import logging
@@ -37,6 +62,7 @@ class Portfolio:
         """
         self.__asset_classes: Dict[str, AssetClass] = {}
         self.__cash: float = 0.0
+        self.__refresh_timings: Dict[str, Tuple[float, float]] = {}
 
     def load_configuration(
         self, portfolio_config: List[Dict[str, Any]]
@@ -115,9 +141,40 @@ class Portfolio:
             [ac.get_value() for ac in self.get_asset_classes()]
         )
 
-    def get_num_shares(self) -> int:
+    def get_num_shares(self) -> float:
         return sum([ac.get_num_shares() for ac in self.get_asset_classes()])
 
+    def get_refresh_timings(self) -> Dict[str, Tuple[float, float]]:
+        """
+        Returns when each stage of the last refresh() started and ended, in
+        milliseconds since the refresh started.
+        """
+        return self.__refresh_timings
+
+    def get_refresh_critical_path(self) -> List[str]:
+        """
+        Returns the chain of stages of the last refresh() that determined how
+        long it took: the stage that ended last, preceded by the holdings if
+        it's the securities stage that waited on them.
+        """
+        timings: Dict[str, Tuple[float, float]] = self.get_refresh_timings()
+        if len(timings) == 0:
+            return []
+        last: str = max(timings.keys(), key=lambda stage: timings[stage][1])
+        if last == "securities":
+            return ["holdings", "securities"]
+        return [last]
+
+    def get_plan_cache_hits(self) -> int:
+        return sum(
+            [ac.get_plan_cache_hits() for ac in self.get_asset_classes()]
+        )
+
+    def get_plan_cache_misses(self) -> int:
+        return sum(
+            [ac.get_plan_cache_misses() for ac in self.get_asset_classes()]
+        )
+
     def set_cash(self, amount: float) -> None:
         self.__cash = amount
 
@@ -191,7 +248,7 @@ class Portfolio:
                         "Yes" if s.get_buy_restricted() else "No",
                         dollar_str(hol.get_average_buy_price()),
                         price_str,
-                        hol.get_num_shares(),
+                        shares_str(hol.get_num_shares()),
                         pct_str(self.get_security_percentage(s.get_id())),
                         dollar_str(hol.get_cost()),
                         dollar_str(hol_val),
@@ -248,7 +305,7 @@ class Portfolio:
                 "-",
                 "-",
                 "-",
-                self.get_num_shares(),
+                shares_str(self.get_num_shares()),
                 pct_str(1),
                 dollar_str(self.get_cost()),
                 dollar_str(self.get_value()),
@@ -324,6 +381,17 @@ class Portfolio:
             ]
         )
 
+    def get_configured_security_ids(self) -> List[str]:
+        """
+        Returns the ids of the securities configured in the portfolio's asset
+        classes, held or not (get_all_security_ids() returns the held ones).
+        """
+        return [
+            sec.get_id()
+            for ac in self.get_asset_classes()
+            for sec in ac.get_securities()
+        ]
+
     def get_asset_class(self, asset_class_name: str) -> AssetClass:
         """
         Retrieves the asset class instance with the given name.
@@ -436,26 +504,156 @@ class Portfolio:
             remaining_value -= ac_budget
         return ac_budgets
 
-    def refresh(self, online: bool, logging: bool) -> None:
+    def refresh(
+        self,
+        online: bool,
+        logging: bool,
+        data_dir: str = "data",
+        from_holdings: bool = False,
+        from_positions: bool = False,
+        as_of: Optional[datetime] = None,
+    ) -> None:
         """
         Hits the Robinhood API to pull fresh holding data for this portfolio.
-        The internal state is changed by the in update() function.
+        The internal state is changed by the in update() function. Snapshots
+        are read from (and logged to) data_dir.
+
+        The account profile, holdings and dividends are loaded at the same
+        time, and the securities as soon as the holdings (whose ids they
+        need) are in. Each stage's start and end are kept for
+        get_refresh_timings().
+
+        With from_holdings set, the held securities' names, symbols and
+        prices are taken from the holdings (see derive_securities()), so the
+        securities stage only fetches the configured securities that aren't
+        held.
+
+        With from_positions set, the holdings are built from the positions
+        list rather than build_holdings() (see fetch_positions()).
+
+        The snapshots logged by a refresh are written together, as one
+        bundle under its start time, and offline the latest bundle is read
+        in one go (see SnapshotBundle), so the four inputs always match. Data
+        without bundles falls back to the latest snapshot of each kind.
+
+        Offline, with as_of set, the portfolio is loaded from the latest
+        bundle taken at or before then instead.
         """
+        if online and as_of is not None:
+            raise Exception(
+                "refresh(): Portfolios as of a time are only loaded offline"
+            )
         s: datetime = datetime.now()
-        account_profile: AccountProfile = load_account_profile(
-            s, online, logging
-        )
-        holdings: Dict[str, HoldingInfo] = load_holdings(s, online, logging)
-        security_ids: List[str] = list(holdings.keys())
-        securities: Dict[str, SecurityInfo] = load_securities(
-            security_ids, s, online, logging
-        )
-        dividends: Dict[str, DividendInfo] = load_dividends(
-            security_ids, s, online, logging
-        )
+        stages: Dict[str, Tuple[datetime, datetime]] = {}
+        results: Dict[str, Any] = {}
+        bundle: Optional[SnapshotBundle] = None
+        if online and logging:
+            bundle = SnapshotBundle(s)
+        elif not online:
+            bundle = load_bundle(data_dir, as_of)
+            if bundle is None and as_of is not None:
+                raise Exception(
+                    "refresh(): No snapshot bundle at or before {} in "
+                    "{}".format(as_of, data_dir)
+                )
+            if bundle is None:
+                log.info(
+                    "No snapshot bundle in {}, loading the latest snapshot "
+                    "of each kind.".format(data_dir)
+                )
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            futures: Dict[str, Future] = {
+                "account profile": pool.submit(
+                    timed,
+                    load_account_profile,
+                    s,
+                    online,
+                    logging,
+                    data_dir,
+                    bundle=bundle,
+                ),
+                "holdings": pool.submit(
+                    timed,
+                    load_holdings,
+                    s,
+                    online,
+                    logging,
+                    data_dir,
+                    from_positions,
+                    bundle=bundle,
+                ),
+                # Holdings without dividends are filled in below
+                "dividends": pool.submit(
+                    timed,
+                    load_dividends,
+                    [],
+                    s,
+                    online,
+                    logging,
+                    data_dir,
+                    bundle=bundle,
+                ),
+            }
+            held: Dict[str, HoldingInfo] = futures["holdings"].result()[0]
+            security_ids: List[str] = list(held.keys())
+            derived: Dict[str, Any] = {}
+            if from_holdings:
+                derived = derive_securities(held)
+                security_ids += [
+                    sec_id
+                    for sec_id in self.get_configured_security_ids()
+                    if sec_id not in held
+                ]
+            futures["securities"] = pool.submit(
+                timed,
+                load_securities,
+                security_ids,
+                s,
+                online,
+                logging,
+                data_dir,
+                None,
+                derived,
+                bundle=bundle,
+            )
+            for (stage, future) in futures.items():
+                (results[stage], start, end) = future.result()
+                stages[stage] = (start, end)
+        if online and bundle is not None:
+            save_bundle(data_dir, bundle)
+        account_profile: AccountProfile = results["account profile"]
+        holdings: Dict[str, HoldingInfo] = results["holdings"]
+        securities: Dict[str, SecurityInfo] = results["securities"]
+        dividends: Dict[str, DividendInfo] = results["dividends"]
+        for sec_id in holdings.keys():
+            if sec_id not in dividends:
+                dividends[sec_id] = DividendInfo(sec_id, 0.0)
         e: datetime = datetime.now()
+        self.__refresh_timings = dict(
+            [
+                (
+                    stage,
+                    (
+                        difference_in_millis(s, start),
+                        difference_in_millis(s, end),
+                    ),
+                )
+                for (stage, (start, end)) in stages.items()
+            ]
+        )
         self.update(account_profile, securities, holdings, dividends)
-        log.info("Refreshed portfolio data. ({})".format(latency_str(s, e)))
+        log.info(
+            "Refreshed portfolio data. ({}; {}; critical path {})".format(
+                latency_str(s, e),
+                ", ".join(
+                    [
+                        "{} {}".format(stage, latency_str(start, end))
+                        for (stage, (start, end)) in stages.items()
+                    ]
+                ),
+                " -> ".join(self.get_refresh_critical_path()),
+            )
+        )
         log.info("Portfolio:{}".format(self.for_display()))
 
     def update(
@@ -478,7 +676,7 @@ class Portfolio:
             hol_info: HoldingInfo = holdings[sec_id]
             sec_info: SecurityInfo = securities[sec_id]
             div_info: DividendInfo = dividends[sec_id]
-            updated_shares: int = hol_info.get_quantity()
+            updated_shares: float = hol_info.get_quantity()
             updated_average_buy_price: float = (
                 hol_info.get_average_buy_price()
             )
@@ -500,15 +698,134 @@ class Portfolio:
                 updated_average_buy_price,
                 updated_dividends,
             )
+        # Refresh the configured securities that aren't held
+        for ac in self.get_asset_classes():
+            for sec in ac.get_securities():
+                sec_id = sec.get_id()
+                if sec_id in securities and sec_id not in holdings:
+                    sec_info = securities[sec_id]
+                    ac.update_security(
+                        sec_id,
+                        sec_info.get_symbol(),
+                        sec_info.get_name(),
+                        sec_info.get_price(),
+                    )
 
-    def plan_deposit(self, amount: float) -> Deposit:
+    def plan_deposit(
+        self,
+        amount: float,
+        engine: str = "auto",
+        granularity: float = 0.01,
+        large_budget: float = LARGE_BUDGET / 100.0,
+        joint: bool = False,
+        time_budget: float = 1.0,
+        fractional: bool = False,
+    ) -> Deposit:
         """
         Returns the optimal purchases to make with deposit added to this
-        portfolio.
+        portfolio. The engine, granularity (in dollars) and large budget
+        threshold are passed through to each asset class's plan_purchases();
+        a coarser granularity plans large deposits faster.
+
+        By default each asset class is planned on its own and unspent money
+        rolls over to the next one. With joint set, that plan is then
+        improved across all asset classes at once for up to time_budget
+        seconds (see __plan_joint_deposit()).
+
+        With fractional set, each asset class's budget is instead split
+        across its securities in fractional shares (see
+        AssetClass.plan_fractional_purchases()), which leaves next to nothing
+        unspent and needs neither a knapsack table nor a joint improvement.
         """
         portfolio_cash = self.get_cash()
         deposit_budget = amount if portfolio_cash >= amount else portfolio_cash
         s: datetime = datetime.now()
+        hits: int = self.get_plan_cache_hits()
+        misses: int = self.get_plan_cache_misses()
+        deposit: Deposit = self.__plan_sequential_deposit(
+            deposit_budget, engine, granularity, large_budget, fractional
+        )
+        e: datetime = datetime.now()
+        log.info(
+            "Planned deposit. ({}, {} cached and {} new asset class "
+            "plans)".format(
+                latency_str(s, e),
+                self.get_plan_cache_hits() - hits,
+                self.get_plan_cache_misses() - misses,
+            )
+        )
+        if joint and not fractional:
+            deadline: datetime = e + timedelta(seconds=time_budget)
+            deposit = self.__plan_joint_deposit(
+                deposit, deposit_budget, deadline
+            )
+            log.info(
+                "Planned joint deposit. ({})".format(
+                    latency_str(e, datetime.now())
+                )
+            )
+        return deposit
+
+    def plan_deposit_sweep(
+        self,
+        amounts: List[float],
+        engine: str = "auto",
+        granularity: float = 0.01,
+        large_budget: float = LARGE_BUDGET / 100.0,
+    ) -> List[Deposit]:
+        """
+        Returns the deposit plan_deposit() would plan for each of the given
+        amounts. Each asset class's knapsack table is built once for the
+        largest amount and reused for every other amount.
+        """
+        portfolio_cash: float = self.get_cash()
+        s: datetime = datetime.now()
+        max_budget: float = min(max(amounts + [0.0]), portfolio_cash)
+        tables: Dict[str, KnapsackTable] = dict(
+            [
+                (
+                    ac.get_name(),
+                    ac.build_purchase_table(
+                        max_budget, engine, granularity, large_budget
+                    ),
+                )
+                for ac in self.get_asset_classes()
+            ]
+        )
+        deposits: List[Deposit] = [
+            self.__plan_sequential_deposit(
+                min(amount, portfolio_cash),
+                engine,
+                granularity,
+                large_budget,
+                False,
+                tables,
+            )
+            for amount in amounts
+        ]
+        e: datetime = datetime.now()
+        log.info(
+            "Planned deposits for {} amounts. ({})".format(
+                len(amounts), latency_str(s, e)
+            )
+        )
+        return deposits
+
+    def __plan_sequential_deposit(
+        self,
+        deposit_budget: float,
+        engine: str,
+        granularity: float,
+        large_budget: float,
+        fractional: bool = False,
+        tables: Optional[Dict[str, KnapsackTable]] = None,
+    ) -> Deposit:
+        """
+        Plans each asset class's purchases on its own, largest budget first,
+        rolling over the money left unspent by each asset class to the next.
+        Reuses the given knapsack tables where possible, and plans fractional
+        shares instead if fractional is set.
+        """
         # Compute purchases necessary to rebalance portfolio
         deposit: Deposit = Deposit()
         budgets: List[Tuple[str, float]] = sorted(
@@ -518,28 +835,165 @@ class Portfolio:
         )
         # Rollover allocations not spent in previous classes
         rollover: float = 0.0
+        leftover_bound: float = 0.0
         for (ac_name, budget) in budgets:
             ac: AssetClass = self.get_asset_class(ac_name)
             final_budget: float = budget + rollover
             if (ac_name, budget) == budgets[-1]:
                 final_budget -= ac.get_purchase_buffer()
-            ac_purchases: Dict[str, Purchase] = ac.plan_purchases(final_budget)
+            ac_purchases: Dict[str, Purchase] = {}
+            if fractional:
+                ac_purchases = ac.plan_fractional_purchases(final_budget)
+            else:
+                ac_purchases = ac.plan_purchases(
+                    final_budget,
+                    engine,
+                    granularity,
+                    large_budget,
+                    tables.get(ac_name) if tables is not None else None,
+                )
+                # Unspent money rolls over, so only the last class's bound
+                # holds
+                leftover_bound = ac.get_leftover_bound(
+                    final_budget, granularity
+                )
             ac_total: float = 0.0
             for purchase in ac_purchases.values():
                 deposit.add_purchase(ac_name, purchase)
                 ac_total += purchase.get_cost()
             rollover = final_budget - ac_total
-        e: datetime = datetime.now()
-        log.info("Planned deposit. ({})".format(latency_str(s, e)))
+        if granularity > 0.01 and not fractional:
+            log.info(
+                "Planned at {} granularity, at most {} left unspent.".format(
+                    dollar_str(granularity), dollar_str(leftover_bound)
+                )
+            )
         return deposit
 
+    def __plan_joint_deposit(
+        self, deposit: Deposit, deposit_budget: float, deadline: datetime
+    ) -> Deposit:
+        """
+        Improves the given deposit across all asset classes at once. The cost
+        of a plan is the cash it leaves unspent plus how far each asset class
+        ends up from its target value. Starting from the given deposit, the
+        single share purchase, removal or swap that lowers the cost the most
+        is applied until none does or the deadline passes, so the result is
+        never worse than the given deposit, which is also returned as is if
+        no improvement is found.
+        """
+        total_value: float = self.get_value() + deposit_budget
+        buffer: float = max(
+            [ac.get_purchase_buffer() for ac in self.get_asset_classes()]
+            + [0.0]
+        )
+        limit: float = max(deposit_budget - buffer, deposit.get_total())
+
+        # Flatten the buyable securities of every asset class
+        ac_names: List[str] = []
+        securities: List[Security] = []
+        prices: List[float] = []
+        for ac in self.get_asset_classes():
+            for sec in ac.get_buyable_securities():
+                price: Optional[float] = sec.get_price()
+                if price is not None:
+                    ac_names.append(ac.get_name())
+                    securities.append(sec)
+                    prices.append(price)
+        counts: List[int] = [0 for sec in securities]
+        for (i, (ac_name, sec)) in enumerate(zip(ac_names, securities)):
+            if deposit.involves_asset_class(ac_name):
+                for p in deposit.get_purchases_for_asset_class(ac_name):
+                    if p.get_security().get_id() == sec.get_id():
+                        counts[i] += int(p.get_num_shares())
+
+        # Track the post deposit deviation of every asset class
+        devs: Dict[str, float] = dict(
+            [
+                (
+                    ac.get_name(),
+                    ac.get_value()
+                    - self.get_asset_class_target_value(
+                        ac.get_name(), total_value
+                    ),
+                )
+                for ac in self.get_asset_classes()
+            ]
+        )
+        spent: float = 0.0
+        for (i, ac_name) in enumerate(ac_names):
+            devs[ac_name] += counts[i] * prices[i]
+            spent += counts[i] * prices[i]
+
+        def cost_change(changes: List[Tuple[int, int]]) -> Optional[float]:
+            # Change in cost of buying (or selling) shares, None if infeasible
+            new_spent: float = spent
+            new_devs: Dict[str, float] = {}
+            for (i, n) in changes:
+                if counts[i] + n < 0:
+                    return None
+                name: str = ac_names[i]
+                new_devs[name] = new_devs.get(name, devs[name]) + n * prices[i]
+                new_spent += n * prices[i]
+            if new_spent > limit + 1e-9:
+                return None
+            change: float = spent - new_spent
+            for (name, dev) in new_devs.items():
+                change += abs(dev) - abs(devs[name])
+            return change
+
+        improved: bool = False
+        while datetime.now() < deadline:
+            best: Optional[Tuple[float, List[Tuple[int, int]]]] = None
+            moves: List[List[Tuple[int, int]]] = []
+            for i in range(len(securities)):
+                moves.append([(i, 1)])
+                moves.append([(i, -1)])
+                for j in range(len(securities)):
+                    if i != j:
+                        moves.append([(i, -1), (j, 1)])
+            for move in moves:
+                change: Optional[float] = cost_change(move)
+                if change is not None and change < -1e-9:
+                    if best is None or change < best[0]:
+                        best = (change, move)
+            if best is None:
+                break
+            for (i, n) in best[1]:
+                counts[i] += n
+                devs[ac_names[i]] += n * prices[i]
+                spent += n * prices[i]
+            improved = True
+        else:
+            log.warn("Joint deposit planning ran out of time.")
+
+        if not improved:
+            return deposit
+        joint: Deposit = Deposit()
+        for (ac_name, sec, n) in zip(ac_names, securities, counts):
+            if n > 0:
+                joint.add_purchase(ac_name, Purchase(sec, n))
+        log.info(
+            "Joint deposit leaves {} unspent instead of {}.".format(
+                dollar_str(deposit_budget - joint.get_total()),
+                dollar_str(deposit_budget - deposit.get_total()),
+            )
+        )
+        return joint
+
     def make_deposit(self, deposit: Deposit, online: bool) -> None:
         """
         Makes all the purchases in the given deposit, updating the state of
-        this portfolio.
+        this portfolio. Orders are only placed for whole shares, so a
+        fractional deposit (see plan_deposit()) can only be made offline.
         """
         if deposit.get_total() > self.get_cash():
             raise Exception("Deposit total is more than cash in portfolio.")
+        if online and deposit.is_fractional():
+            raise Exception(
+                "make_deposit(): Can't place orders for fractional shares, "
+                "plan the deposit without fractional set."
+            )
         log.info("Deposit:{}".format(deposit.for_display()))
         acs: List[Tuple[str, float]] = [
             (ac, deposit.get_asset_class_expenditures(ac))
@@ -569,3 +1023,23 @@ class Portfolio:
                         state.capitalize()
                     )
                     log.error(em)
+
+
+def iter_history(
+    portfolio_config: List[Dict[str, Any]],
+    start: datetime,
+    end: datetime,
+    data_dir: str = "data",
+    from_holdings: bool = False,
+) -> Iterator[Tuple[datetime, Portfolio]]:
+    """
+    Yields the portfolio with the given configuration as of each snapshot
+    bundle in data_dir taken between start and end (inclusive), oldest
+    first, along with when the bundle was taken. Only the bundle times are
+    read up front; each portfolio is loaded when it's asked for.
+    """
+    for t in bundle_times(data_dir, start, end):
+        portfolio: Portfolio = Portfolio()
+        portfolio.load_configuration(portfolio_config)
+        portfolio.refresh(False, False, data_dir, from_holdings, as_of=t)
+        yield (t, portfolio)
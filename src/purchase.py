@@ -10,7 +10,7 @@ import json
 
 
 class Purchase:
-    def __init__(self, security: Security, num_shares: int) -> None:
+    def __init__(self, security: Security, num_shares: float) -> None:
         sec_price = security.get_price()
         if sec_price is None:
             raise Exception(
@@ -22,7 +22,7 @@ class Purchase:
                 "Purchase must be instantiated with num_shares >= 0"
             )
         self.__security: Security = security
-        self.__num_shares: int = num_shares
+        self.__num_shares: float = num_shares
         self.__cost: float = sec_price * self.__num_shares
 
     def __eq__(self, other: object) -> bool:
@@ -36,13 +36,13 @@ class Purchase:
     def get_security(self) -> Security:
         return self.__security
 
-    def get_num_shares(self) -> int:
+    def get_num_shares(self) -> float:
         return self.__num_shares
 
     def get_cost(self) -> float:
         return self.__cost
 
-    def add_shares(self, num_shares: int) -> None:
+    def add_shares(self, num_shares: float) -> None:
         sec_price = self.get_security().get_price()
         if sec_price is None:
             raise Exception(
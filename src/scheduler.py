@@ -0,0 +1,211 @@
+# Ricky Galliani
+# Hanna
+# src/scheduler.py
+
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple
+
+import heapq
+import logging
+import random
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# Request priorities, lower going first: order submission preempts the
+# loaders, which preempt background quote refreshes
+ORDER_PRIORITY: int = 0
+DEFAULT_PRIORITY: int = 1
+BACKGROUND_PRIORITY: int = 2
+
+# Requests per second let through once the burst is spent, and the size of
+# the burst
+RATE: float = 5.0
+BURST: int = 10
+
+# Retries of a throttled or failed request, and the bounds (in seconds) of
+# the exponential backoff before each retry
+MAX_RETRIES: int = 4
+BACKOFF_BASE: float = 0.5
+BACKOFF_CAP: float = 8.0
+
+# Statuses worth retrying: throttling and server errors
+RETRY_STATUSES: List[int] = [429, 500, 502, 503, 504]
+
+# Methods that are safe to send again after a server error
+IDEMPOTENT_METHODS: List[str] = ["GET", "HEAD", "OPTIONS", "PUT", "DELETE"]
+
+thread_state: threading.local = threading.local()
+
+
+def get_priority() -> int:
+    """
+    Returns the priority of the requests made by the current thread.
+    """
+    return getattr(thread_state, "priority", DEFAULT_PRIORITY)
+
+
+@contextmanager
+def priority(level: int) -> Iterator[None]:
+    """
+    Makes the requests of the current thread run at the given priority
+    inside the with block.
+    """
+    old: int = get_priority()
+    thread_state.priority = level
+    try:
+        yield
+    finally:
+        thread_state.priority = old
+
+
+class RequestScheduler:
+    def __init__(
+        self,
+        rate: float = RATE,
+        burst: int = BURST,
+        max_retries: int = MAX_RETRIES,
+        backoff_base: float = BACKOFF_BASE,
+        backoff_cap: float = BACKOFF_CAP,
+    ) -> None:
+        """
+        Lets requests through at rate per second (after an initial burst)
+        from a token bucket, highest priority first and in arrival order
+        within a priority, and decides how long to back off before retrying
+        a throttled or failed request.
+        """
+        self.__rate: float = rate
+        self.__burst: int = burst
+        self.__max_retries: int = max_retries
+        self.__backoff_base: float = backoff_base
+        self.__backoff_cap: float = backoff_cap
+        self.__tokens: float = float(burst)
+        self.__refilled_at: float = time.monotonic()
+        self.__waiting: List[Tuple[int, int]] = []
+        self.__arrivals: int = 0
+        self.__cond: threading.Condition = threading.Condition()
+        self.__requests: int = 0
+        self.__retries: int = 0
+        self.__total_wait: float = 0.0
+        self.__max_wait: float = 0.0
+        self.__max_queue_depth: int = 0
+
+    def get_max_retries(self) -> int:
+        return self.__max_retries
+
+    def should_retry(self, method: str, status: int, attempt: int) -> bool:
+        """
+        Returns whether a request that got the given status on retry number
+        attempt (from 0) should be retried. Only throttled requests are
+        retried if they aren't idempotent (e.g. order submissions), since
+        after a server error the order may have gone through.
+        """
+        if attempt >= self.__max_retries or status not in RETRY_STATUSES:
+            return False
+        return status == 429 or method.upper() in IDEMPOTENT_METHODS
+
+    def get_queue_depth(self) -> int:
+        """
+        Returns the number of requests waiting for a token.
+        """
+        with self.__cond:
+            return len(self.__waiting)
+
+    def get_max_queue_depth(self) -> int:
+        return self.__max_queue_depth
+
+    def get_requests(self) -> int:
+        return self.__requests
+
+    def get_retries(self) -> int:
+        return self.__retries
+
+    def get_total_wait(self) -> float:
+        """
+        Returns the seconds requests have spent waiting for a token, summed.
+        """
+        return self.__total_wait
+
+    def get_max_wait(self) -> float:
+        return self.__max_wait
+
+    def get_mean_wait(self) -> float:
+        if self.__requests == 0:
+            return 0.0
+        return self.__total_wait / self.__requests
+
+    def acquire(self, level: Optional[int] = None) -> float:
+        """
+        Blocks until a request of the given priority (by default the current
+        thread's, see priority()) may be sent. Returns the seconds waited.
+        """
+        if level is None:
+            level = get_priority()
+        s: float = time.monotonic()
+        with self.__cond:
+            ticket: Tuple[int, int] = (level, self.__arrivals)
+            self.__arrivals += 1
+            heapq.heappush(self.__waiting, ticket)
+            self.__max_queue_depth = max(
+                self.__max_queue_depth, len(self.__waiting)
+            )
+            while True:
+                self.__refill()
+                if self.__waiting[0] == ticket and self.__tokens >= 1:
+                    break
+                timeout: Optional[float] = None
+                if self.__waiting[0] == ticket:
+                    timeout = (1 - self.__tokens) / self.__rate
+                self.__cond.wait(timeout)
+            heapq.heappop(self.__waiting)
+            self.__tokens -= 1
+            waited: float = time.monotonic() - s
+            self.__requests += 1
+            self.__total_wait += waited
+            self.__max_wait = max(self.__max_wait, waited)
+            # Let the next request in line check for a token
+            self.__cond.notify_all()
+        return waited
+
+    def backoff(
+        self, attempt: int, retry_after: Optional[float] = None
+    ) -> float:
+        """
+        Returns the seconds to wait before retry number attempt (from 0): a
+        random time up to the exponential backoff, so throttled clients don't
+        all retry at once, but no less than the server's retry_after.
+        """
+        with self.__cond:
+            self.__retries += 1
+        ceiling: float = min(
+            self.__backoff_cap, self.__backoff_base * (2 ** attempt)
+        )
+        delay: float = random.uniform(0, ceiling)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def __refill(self) -> None:
+        now: float = time.monotonic()
+        self.__tokens = min(
+            float(self.__burst),
+            self.__tokens + (now - self.__refilled_at) * self.__rate,
+        )
+        self.__refilled_at = now
+
+
+def log_scheduler_stats(scheduler: RequestScheduler) -> None:
+    """
+    Logs how long requests waited on the scheduler and how many it retried.
+    """
+    log.info(
+        "Scheduled {} requests ({} retries, {:.0f} ms mean wait, {:.0f} ms "
+        "max wait, {} max queue depth).".format(
+            scheduler.get_requests(),
+            scheduler.get_retries(),
+            scheduler.get_mean_wait() * 1000,
+            scheduler.get_max_wait() * 1000,
+            scheduler.get_max_queue_depth(),
+        )
+    )
@@ -0,0 +1,308 @@
+# Ricky Galliani
+# Hanna
+# src/session.py
+
+from src.cassette import Cassette, ReplayAdapter
+from src.scheduler import RequestScheduler
+
+from requests.adapters import HTTPAdapter
+from typing import Any, Callable, List, Optional, Tuple
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool
+from urllib3.poolmanager import PoolManager
+
+import logging
+import requests
+import robin_stocks.helper
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# Number of hosts whose connections are pooled (Robinhood's API, plus room
+# for the odd document download)
+POOL_CONNECTIONS: int = 4
+
+# Connections kept open per host, at least as many as the loaders' workers
+# (see FETCH_WORKERS in src/api.py) so none of them waits on another's socket
+POOL_MAXSIZE: int = 16
+
+# Base URL of the broker's API, which robin_stocks has built in
+API_URL: str = "https://api.robinhood.com"
+
+# Seconds to wait for a connection and for a response on it, used for every
+# request that doesn't set its own timeout
+TIMEOUT: Tuple[float, float] = (3.05, 16.0)
+
+
+class CountingHTTPConnection(HTTPConnection):
+    def __init__(
+        self,
+        *args: Any,
+        on_connect: Optional[Callable[[], None]] = None,
+        **kwargs: Any
+    ) -> None:
+        """
+        An HTTPConnection that calls on_connect whenever it opens a socket.
+        """
+        super().__init__(*args, **kwargs)
+        self.__on_connect: Optional[Callable[[], None]] = on_connect
+
+    def connect(self) -> None:
+        super().connect()
+        if self.__on_connect is not None:
+            self.__on_connect()
+
+
+class CountingHTTPSConnection(HTTPSConnection):
+    def __init__(
+        self,
+        *args: Any,
+        on_connect: Optional[Callable[[], None]] = None,
+        **kwargs: Any
+    ) -> None:
+        """
+        An HTTPSConnection that calls on_connect whenever it opens a socket.
+        """
+        super().__init__(*args, **kwargs)
+        self.__on_connect: Optional[Callable[[], None]] = on_connect
+
+    def connect(self) -> None:
+        super().connect()
+        if self.__on_connect is not None:
+            self.__on_connect()
+
+
+class CountingPoolManager(PoolManager):
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        """
+        A PoolManager that counts the sockets its connections open and
+        remembers every connection pool it creates, so connections opened
+        and requests made can be summed across hosts.
+        """
+        super().__init__(*args, **kwargs)
+        self.__created: List[HTTPConnectionPool] = []
+        self.__opened: int = 0
+        self.__lock: threading.Lock = threading.Lock()
+
+    def get_created_pools(self) -> List[HTTPConnectionPool]:
+        return self.__created
+
+    def get_opened(self) -> int:
+        return self.__opened
+
+    def _new_pool(
+        self,
+        scheme: str,
+        host: str,
+        port: int,
+        request_context: Optional[Any] = None,
+    ) -> HTTPConnectionPool:
+        pool: HTTPConnectionPool = super()._new_pool(
+            scheme, host, port, request_context
+        )
+        pool.ConnectionCls = (
+            CountingHTTPSConnection
+            if scheme == "https"
+            else CountingHTTPConnection
+        )
+        pool.conn_kw["on_connect"] = self.__connected
+        self.__created.append(pool)
+        return pool
+
+    def __connected(self) -> None:
+        with self.__lock:
+            self.__opened += 1
+
+
+class PooledAdapter(HTTPAdapter):
+    def __init__(
+        self,
+        pool_connections: int = POOL_CONNECTIONS,
+        pool_maxsize: int = POOL_MAXSIZE,
+        timeout: Tuple[float, float] = TIMEOUT,
+        scheduler: Optional[RequestScheduler] = None,
+        base_url: Optional[str] = None,
+        cassette: Optional[Cassette] = None,
+    ) -> None:
+        """
+        An HTTPAdapter keeping up to pool_maxsize keep-alive connections open
+        to each of pool_connections hosts, applying timeout to requests that
+        don't set one and counting connections opened and reused. With a
+        scheduler, every request waits its turn on it and throttled or failed
+        requests are retried after backing off. With a base_url, requests to
+        the broker's API (API_URL) are sent there instead, e.g. to a
+        FakeBroker. With a cassette, every response is recorded to it.
+        """
+        self.__timeout: Tuple[float, float] = timeout
+        self.__scheduler: Optional[RequestScheduler] = scheduler
+        self.__base_url: Optional[str] = base_url
+        self.__cassette: Optional[Cassette] = cassette
+        super().__init__(
+            pool_connections=pool_connections, pool_maxsize=pool_maxsize
+        )
+
+    def get_timeout(self) -> Tuple[float, float]:
+        return self.__timeout
+
+    def get_scheduler(self) -> Optional[RequestScheduler]:
+        return self.__scheduler
+
+    def get_base_url(self) -> Optional[str]:
+        return self.__base_url
+
+    def get_cassette(self) -> Optional[Cassette]:
+        return self.__cassette
+
+    def init_poolmanager(
+        self, connections: int, maxsize: int, block: bool = False, **kwargs
+    ) -> None:
+        super().init_poolmanager(connections, maxsize, block, **kwargs)
+        self.__counting: CountingPoolManager = CountingPoolManager(
+            num_pools=connections, maxsize=maxsize, block=block, **kwargs
+        )
+        self.poolmanager = self.__counting
+
+    def send(self, request: Any, *args: Any, **kwargs: Any) -> Any:
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.get_timeout()
+        # Recorded as robin_stocks asked for it, whatever it's sent to
+        url: str = request.url
+        base_url: Optional[str] = self.get_base_url()
+        if base_url is not None and request.url.startswith(API_URL):
+            request = request.copy()
+            request.url = request.url.replace(API_URL, base_url.rstrip("/"), 1)
+        scheduler: Optional[RequestScheduler] = self.get_scheduler()
+        attempt: int = 0
+        s: float = 0.0
+        while True:
+            if scheduler is not None:
+                scheduler.acquire()
+            if attempt == 0:
+                s = time.monotonic()
+            resp = super().send(request, *args, **kwargs)
+            if scheduler is None or not scheduler.should_retry(
+                request.method, resp.status_code, attempt
+            ):
+                break
+            delay: float = scheduler.backoff(attempt, retry_after(resp))
+            log.warning(
+                "{} {} returned {}, retrying in {:.2f} s.".format(
+                    request.method, request.url, resp.status_code, delay
+                )
+            )
+            # Read the body so the connection goes back to the pool
+            resp.content
+            time.sleep(delay)
+            attempt += 1
+        # Only the response robin_stocks sees is recorded (taking as long as
+        # all its attempts did), since a replay doesn't retry
+        cassette: Optional[Cassette] = self.get_cassette()
+        if cassette is not None:
+            cassette.record(
+                request.method,
+                url,
+                resp.status_code,
+                resp.content,
+                (time.monotonic() - s) * 1000,
+            )
+        return resp
+
+    def get_requests(self) -> int:
+        """
+        Returns the number of requests sent through this adapter.
+        """
+        return sum(
+            [p.num_requests for p in self.__counting.get_created_pools()]
+        )
+
+    def get_connections_opened(self) -> int:
+        """
+        Returns the number of connections this adapter has opened.
+        """
+        return self.__counting.get_opened()
+
+    def get_connections_reused(self) -> int:
+        """
+        Returns the number of requests sent over an already open
+        connection.
+        """
+        return max(self.get_requests() - self.get_connections_opened(), 0)
+
+
+def configure_session(
+    session: Optional[requests.Session] = None,
+    pool_connections: int = POOL_CONNECTIONS,
+    pool_maxsize: int = POOL_MAXSIZE,
+    timeout: Tuple[float, float] = TIMEOUT,
+    keep_alive: bool = True,
+    scheduler: Optional[RequestScheduler] = None,
+    base_url: Optional[str] = None,
+    cassette: Optional[Cassette] = None,
+) -> PooledAdapter:
+    """
+    Mounts a PooledAdapter for both http and https on the session, by
+    default robin_stocks' shared session that every loader in src/api.py
+    goes through, and returns it (for its connection counts). Without
+    keep_alive every request asks the server to close its connection. With
+    a scheduler, requests are rate limited, prioritized and retried by it.
+    With a base_url, requests to the broker's API are sent there instead.
+    With a cassette, the final response to every request (after any
+    retries) is recorded to it (see Cassette).
+    """
+    if session is None:
+        session = robin_stocks.helper.Session
+    adapter: PooledAdapter = PooledAdapter(
+        pool_connections,
+        pool_maxsize,
+        timeout,
+        scheduler,
+        base_url,
+        cassette,
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["Connection"] = "keep-alive" if keep_alive else "close"
+    return adapter
+
+
+def configure_replay(
+    cassette: Cassette,
+    session: Optional[requests.Session] = None,
+    speed: float = 1.0,
+) -> ReplayAdapter:
+    """
+    Mounts a ReplayAdapter for both http and https on the session (by
+    default robin_stocks' shared one), so requests are answered from the
+    cassette at speed times their recorded pace, and returns it.
+    """
+    if session is None:
+        session = robin_stocks.helper.Session
+    adapter: ReplayAdapter = ReplayAdapter(cassette, speed)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return adapter
+
+
+def retry_after(resp: Any) -> Optional[float]:
+    """
+    Returns the seconds the server asked to wait before retrying, if it gave
+    them in a Retry-After header.
+    """
+    try:
+        return float(resp.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
+
+
+def log_session_stats(adapter: PooledAdapter) -> None:
+    """
+    Logs how many connections the adapter opened for the requests it sent.
+    """
+    log.info(
+        "Sent {} requests over {} connections ({} reused).".format(
+            adapter.get_requests(),
+            adapter.get_connections_opened(),
+            adapter.get_connections_reused(),
+        )
+    )
@@ -0,0 +1,734 @@
+# Ricky Galliani
+# Hanna
+# src/snapshot_store.py
+
+from src.util import latest_ds
+
+from datetime import datetime
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+import gzip
+import io
+import itertools
+import json
+import logging
+import lzma
+import os
+import sqlite3
+
+log = logging.getLogger(__name__)
+
+# Name of the snapshot database kept in a data directory
+SNAPSHOT_DB: str = "snapshots.db"
+
+# Kinds of snapshot written by the loaders in src/api.py
+SNAPSHOT_KINDS: List[str] = [
+    "account_profile",
+    "holdings",
+    "securities",
+    "dividends",
+]
+
+# Manifest entry for the latest bundle, the snapshots of every kind written
+# together by one refresh
+BUNDLE: str = "bundle"
+
+# Encodings of snapshots in the store: JSON text, or JSON lines compressed
+# with gzip or xz (see encode())
+SNAPSHOT_CODECS: List[str] = ["json", "gzip", "xz"]
+
+# Encoding of the snapshots written to the store
+SNAPSHOT_CODEC: str = "gzip"
+
+# gzip compression level, which past 6 costs much more time than it saves
+# space on snapshots
+GZIP_LEVEL: int = 6
+
+# Snapshots SnapshotStore.put_many() encodes and inserts at a time, so a
+# long history (as migrate_tree() copies) is never held in memory at once
+PUT_BATCH_SIZE: int = 64
+
+# Decompressed bytes of a snapshot parsed at a time by read_lines()
+READ_SIZE: int = 1 << 18
+
+# First bytes of gzip and xz data
+GZIP_MAGIC: bytes = b"\x1f\x8b"
+XZ_MAGIC: bytes = b"\xfd7zXZ\x00"
+
+# Format of the snapshot times stored in the database, which sorts in time
+# order, to the second like the directory tree it replaces
+SNAPSHOT_TIME_FORMAT: str = "%Y-%m-%d %H:%M:%S"
+
+# Format of the files of the old snapshot tree, kept as
+# data_dir/<kind>/YYYY/MM/DD/HH/MM/SS/YYYY_MM_DD_HH_MM_SS.json
+TREE_FILE_FORMAT: str = "%Y_%m_%d_%H_%M_%S.json"
+
+# An encoded snapshot, as text for JSON or bytes for the compressed codecs
+Payload = Union[str, bytes]
+
+
+class SnapshotBundle:
+    def __init__(
+        self,
+        t: datetime,
+        snapshots: Optional[Dict[str, Any]] = None,
+        payloads: Optional[Dict[str, Payload]] = None,
+    ) -> None:
+        """
+        The snapshots of every kind taken by one refresh at t, which are
+        written to the store and read back together, so they always match.
+        Snapshots read from the store are kept encoded in payloads until
+        they're asked for, with get() or, one record at a time, records().
+        """
+        self.__t: datetime = t
+        self.__snapshots: Dict[str, Any] = {}
+        if snapshots is not None:
+            self.__snapshots = snapshots
+        self.__payloads: Dict[str, Payload] = {}
+        if payloads is not None:
+            self.__payloads = payloads
+
+    def get_time(self) -> datetime:
+        return self.__t
+
+    def get_snapshots(self) -> Dict[str, Any]:
+        for kind in list(self.__payloads.keys()):
+            self.get(kind)
+        return self.__snapshots
+
+    def get(self, kind: str) -> Any:
+        if kind in self.__payloads:
+            self.__snapshots[kind] = decode(self.__payloads.pop(kind))
+        if kind not in self.__snapshots:
+            raise Exception("get(): Bundle has no {} snapshot".format(kind))
+        return self.__snapshots[kind]
+
+    def records(self, kind: str) -> Iterator[Any]:
+        """
+        Returns an iterator over the records of the snapshot of the given
+        kind (see iter_records()), decoded as they're reached.
+        """
+        if kind in self.__payloads:
+            return iter_records(self.__payloads[kind])
+        return resp_records(self.get(kind))
+
+    def put(self, kind: str, resp: Any) -> None:
+        self.__snapshots[kind] = resp
+
+
+class SnapshotStore:
+    def __init__(
+        self,
+        path: str = os.path.join("data", SNAPSHOT_DB),
+        readonly: bool = False,
+        codec: str = SNAPSHOT_CODEC,
+    ) -> None:
+        """
+        Keeps the snapshots of every kind in the SQLite database at path,
+        which is created if it doesn't exist. Snapshots are indexed by kind
+        and time, so looking one up is a B-tree search rather than a walk of
+        the file system, and each write is a single synchronous commit.
+
+        Snapshots are written encoded with codec (one of SNAPSHOT_CODECS),
+        and read whatever they were written with.
+
+        With readonly set, the database (which must exist) is only read, and
+        opening it costs no writes.
+        """
+        if codec not in SNAPSHOT_CODECS:
+            raise Exception("SnapshotStore(): Unknown codec {}".format(codec))
+        self.__path: str = path
+        self.__codec: str = codec
+        if readonly:
+            self.__conn: sqlite3.Connection = sqlite3.connect(
+                "file:{}?mode=ro".format(path), timeout=30.0, uri=True
+            )
+            return
+        store_dir: str = os.path.dirname(path)
+        if store_dir != "" and not os.path.exists(store_dir):
+            os.makedirs(store_dir)
+        self.__conn = sqlite3.connect(path, timeout=30.0)
+        # Commits append to the write-ahead log and are fsync'd before they
+        # return, so a crash loses no acknowledged snapshot
+        self.__conn.execute("PRAGMA journal_mode=WAL")
+        self.__conn.execute("PRAGMA synchronous=FULL")
+        with self.__conn:
+            self.__conn.execute(
+                "CREATE TABLE IF NOT EXISTS snapshots ("
+                "kind TEXT NOT NULL, "
+                "t TEXT NOT NULL, "
+                "payload TEXT NOT NULL, "
+                "PRIMARY KEY (kind, t))"
+            )
+            # The manifest: when the latest snapshot of each kind was taken
+            self.__conn.execute(
+                "CREATE TABLE IF NOT EXISTS latest ("
+                "kind TEXT PRIMARY KEY, "
+                "t TEXT NOT NULL)"
+            )
+            # When each bundle was taken
+            self.__conn.execute(
+                "CREATE TABLE IF NOT EXISTS bundles (t TEXT PRIMARY KEY)"
+            )
+
+    def __enter__(self) -> "SnapshotStore":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        row: Tuple[int] = self.__conn.execute(
+            "SELECT COUNT(*) FROM snapshots"
+        ).fetchone()
+        return row[0]
+
+    def get_path(self) -> str:
+        return self.__path
+
+    def get_codec(self) -> str:
+        return self.__codec
+
+    def close(self) -> None:
+        self.__conn.close()
+
+    def put(self, kind: str, t: datetime, resp: Any) -> None:
+        """
+        Writes the snapshot of the given kind taken at t, replacing any
+        snapshot of that kind taken in the same second.
+        """
+        self.put_many(kind, [(t, resp)])
+
+    def put_many(
+        self, kind: str, snapshots: Iterable[Tuple[datetime, Any]]
+    ) -> int:
+        """
+        Writes the snapshots of the given kind (pairs of when each was taken
+        and its data) in a single commit, which also moves the manifest on to
+        the latest of them once they are all in. They are read, encoded and
+        inserted PUT_BATCH_SIZE at a time. Returns how many were written.
+        """
+        it: Iterator[Tuple[datetime, Any]] = iter(snapshots)
+        count: int = 0
+        latest: Optional[str] = None
+        with self.__conn:
+            while True:
+                rows: List[Tuple[str, str, Payload]] = [
+                    (
+                        kind,
+                        t.strftime(SNAPSHOT_TIME_FORMAT),
+                        encode(resp, self.get_codec()),
+                    )
+                    for (t, resp) in itertools.islice(it, PUT_BATCH_SIZE)
+                ]
+                if len(rows) == 0:
+                    break
+                self.__insert(rows)
+                count += len(rows)
+                batch_latest: str = max([row[1] for row in rows])
+                if latest is None or batch_latest > latest:
+                    latest = batch_latest
+            if latest is not None:
+                self.__advance([(kind, latest)])
+        return count
+
+    def put_bundle(self, bundle: SnapshotBundle) -> None:
+        """
+        Writes the snapshot of every kind in the bundle, taken at the same
+        time, in a single commit, which also indexes the bundle by its time.
+        """
+        missing: List[str] = [
+            kind
+            for kind in SNAPSHOT_KINDS
+            if kind not in bundle.get_snapshots()
+        ]
+        if len(missing) > 0:
+            raise Exception(
+                "put_bundle(): Bundle has no {} snapshot".format(
+                    ", ".join(missing)
+                )
+            )
+        t: str = bundle.get_time().strftime(SNAPSHOT_TIME_FORMAT)
+        self.__write(
+            [
+                (kind, t, encode(bundle.get(kind), self.get_codec()))
+                for kind in SNAPSHOT_KINDS
+            ],
+            [(kind, t) for kind in SNAPSHOT_KINDS + [BUNDLE]],
+            t,
+        )
+
+    def index_bundles(self) -> int:
+        """
+        Indexes as bundles the snapshots of every kind taken at the same
+        time that aren't already, as written by refreshes before bundles
+        were, or migrated from the directory tree. Returns how many bundles
+        were indexed.
+        """
+        with self.__conn:
+            indexed: int = self.__conn.execute(
+                "INSERT OR IGNORE INTO bundles SELECT t FROM snapshots "
+                "WHERE kind IN ({}) GROUP BY t HAVING COUNT(*) = ?".format(
+                    ", ".join(["?"] * len(SNAPSHOT_KINDS))
+                ),
+                SNAPSHOT_KINDS + [len(SNAPSHOT_KINDS)],
+            ).rowcount
+            row: Optional[Tuple[str]] = self.__conn.execute(
+                "SELECT MAX(t) FROM bundles"
+            ).fetchone()
+            if row is not None and row[0] is not None:
+                self.__conn.execute(
+                    "INSERT INTO latest VALUES (?, ?) ON CONFLICT (kind) "
+                    "DO UPDATE SET t = MAX(t, excluded.t)",
+                    (BUNDLE, row[0]),
+                )
+        return indexed
+
+    def recode(self) -> int:
+        """
+        Rewrites the snapshots written with another codec with this store's,
+        in a single commit, and then gives the space they freed back to the
+        file system. Returns how many snapshots were rewritten.
+        """
+        keys: List[Tuple[str, str]] = self.__conn.execute(
+            "SELECT kind, t FROM snapshots"
+        ).fetchall()
+        recoded: int = 0
+        with self.__conn:
+            for (kind, t) in keys:
+                row: Tuple[Payload] = self.__conn.execute(
+                    "SELECT payload FROM snapshots WHERE kind = ? AND t = ?",
+                    (kind, t),
+                ).fetchone()
+                if codec_of(row[0]) == self.get_codec():
+                    continue
+                self.__conn.execute(
+                    "UPDATE snapshots SET payload = ? "
+                    "WHERE kind = ? AND t = ?",
+                    (encode(decode(row[0]), self.get_codec()), kind, t),
+                )
+                recoded += 1
+        self.__conn.execute("VACUUM")
+        return recoded
+
+    def get(self, kind: str, t: datetime) -> Optional[Any]:
+        """
+        Returns the snapshot of the given kind taken at t, or None if there
+        isn't one.
+        """
+        row: Optional[Tuple[Payload]] = self.__conn.execute(
+            "SELECT payload FROM snapshots WHERE kind = ? AND t = ?",
+            (kind, t.strftime(SNAPSHOT_TIME_FORMAT)),
+        ).fetchone()
+        return None if row is None else decode(row[0])
+
+    def latest(self, kind: str) -> Optional[Tuple[datetime, Any]]:
+        """
+        Returns when the latest snapshot of the given kind was taken along
+        with the snapshot, or None if there are no snapshots of that kind.
+        """
+        latest: Optional[Tuple[datetime, Payload]] = self.latest_payload(kind)
+        if latest is None:
+            return None
+        return (latest[0], decode(latest[1]))
+
+    def latest_payload(self, kind: str) -> Optional[Tuple[datetime, Payload]]:
+        """
+        Returns when the latest snapshot of the given kind was taken along
+        with the snapshot still encoded, or None if there are no snapshots of
+        that kind. The snapshot the manifest points to is read directly, and
+        the snapshots are only searched if the manifest is missing or stale.
+        """
+        row: Optional[Tuple[str, Payload]] = None
+        try:
+            row = self.__conn.execute(
+                "SELECT s.t, s.payload FROM latest l JOIN snapshots s "
+                "ON s.kind = l.kind AND s.t = l.t WHERE l.kind = ?",
+                (kind,),
+            ).fetchone()
+        except sqlite3.OperationalError:
+            # A store written before the manifest was kept
+            pass
+        if row is None:
+            row = self.__conn.execute(
+                "SELECT t, payload FROM snapshots WHERE kind = ? "
+                "ORDER BY t DESC LIMIT 1",
+                (kind,),
+            ).fetchone()
+        if row is None:
+            return None
+        return (datetime.strptime(row[0], SNAPSHOT_TIME_FORMAT), row[1])
+
+    def get_times(self, kind: str) -> List[datetime]:
+        """
+        Returns when each snapshot of the given kind was taken, oldest first.
+        """
+        return [
+            datetime.strptime(row[0], SNAPSHOT_TIME_FORMAT)
+            for row in self.__conn.execute(
+                "SELECT t FROM snapshots WHERE kind = ? ORDER BY t", (kind,)
+            )
+        ]
+
+    def latest_bundle(self) -> Optional[SnapshotBundle]:
+        """
+        Returns the latest bundle, read in one query, or None if no bundle
+        has been written.
+        """
+        rows: List[Tuple[str, str, Payload]] = []
+        try:
+            rows = self.__conn.execute(
+                "SELECT l.t, s.kind, s.payload FROM latest l JOIN snapshots s "
+                "ON s.t = l.t WHERE l.kind = ? AND s.kind IN ({})".format(
+                    ", ".join(["?"] * len(SNAPSHOT_KINDS))
+                ),
+                [BUNDLE] + SNAPSHOT_KINDS,
+            ).fetchall()
+        except sqlite3.OperationalError:
+            # A store written before the manifest was kept
+            pass
+        if len(rows) < len(SNAPSHOT_KINDS):
+            return None
+        return SnapshotBundle(
+            datetime.strptime(rows[0][0], SNAPSHOT_TIME_FORMAT),
+            payloads=dict([(kind, payload) for (_, kind, payload) in rows]),
+        )
+
+    def bundle_at(self, t: datetime) -> Optional[SnapshotBundle]:
+        """
+        Returns the latest bundle taken at or before t, found by searching
+        the bundle index and read in one query, or None if there isn't one.
+        """
+        rows: List[Tuple[str, str, Payload]] = []
+        try:
+            rows = self.__conn.execute(
+                "SELECT s.t, s.kind, s.payload FROM snapshots s "
+                "WHERE s.t = (SELECT MAX(t) FROM bundles WHERE t <= ?) "
+                "AND s.kind IN ({})".format(
+                    ", ".join(["?"] * len(SNAPSHOT_KINDS))
+                ),
+                [t.strftime(SNAPSHOT_TIME_FORMAT)] + SNAPSHOT_KINDS,
+            ).fetchall()
+        except sqlite3.OperationalError:
+            # A store written before bundles were indexed
+            pass
+        if len(rows) < len(SNAPSHOT_KINDS):
+            return None
+        return SnapshotBundle(
+            datetime.strptime(rows[0][0], SNAPSHOT_TIME_FORMAT),
+            payloads=dict([(kind, payload) for (_, kind, payload) in rows]),
+        )
+
+    def get_bundle_times(
+        self, start: datetime, end: datetime
+    ) -> List[datetime]:
+        """
+        Returns when each bundle taken between start and end (inclusive) was
+        taken, oldest first.
+        """
+        try:
+            return [
+                datetime.strptime(row[0], SNAPSHOT_TIME_FORMAT)
+                for row in self.__conn.execute(
+                    "SELECT t FROM bundles WHERE t BETWEEN ? AND ? "
+                    "ORDER BY t",
+                    (
+                        start.strftime(SNAPSHOT_TIME_FORMAT),
+                        end.strftime(SNAPSHOT_TIME_FORMAT),
+                    ),
+                )
+            ]
+        except sqlite3.OperationalError:
+            # A store written before bundles were indexed
+            return []
+
+    def __write(
+        self,
+        rows: List[Tuple[str, str, Payload]],
+        manifest: List[Tuple[str, str]],
+        bundle: Optional[str] = None,
+    ) -> None:
+        with self.__conn:
+            self.__insert(rows)
+            self.__advance(manifest, bundle)
+
+    def __insert(self, rows: List[Tuple[str, str, Payload]]) -> None:
+        self.__conn.executemany(
+            "INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?)", rows
+        )
+
+    def __advance(
+        self, manifest: List[Tuple[str, str]], bundle: Optional[str] = None
+    ) -> None:
+        self.__conn.executemany(
+            "INSERT INTO latest VALUES (?, ?) ON CONFLICT (kind) "
+            "DO UPDATE SET t = MAX(t, excluded.t)",
+            manifest,
+        )
+        if bundle is not None:
+            self.__conn.execute(
+                "INSERT OR IGNORE INTO bundles VALUES (?)", (bundle,)
+            )
+
+
+def encode(resp: Any, codec: str = SNAPSHOT_CODEC) -> Payload:
+    """
+    Returns the snapshot encoded with the given codec, as JSON text or as
+    JSON lines compressed with gzip or xz. The first line says whether the
+    snapshot is a "list" (followed by a line per item), a "dict" (a line
+    per [key, value] pair) or any other "value" (on the next line), so the
+    records can be read back one at a time (see iter_records()).
+    """
+    if codec == "json":
+        return json.dumps(resp)
+    lines: List[str] = []
+    if isinstance(resp, list):
+        lines = [json.dumps("list")] + [json.dumps(item) for item in resp]
+    elif isinstance(resp, dict):
+        lines = [json.dumps("dict")] + [
+            json.dumps([k, v]) for (k, v) in resp.items()
+        ]
+    else:
+        lines = [json.dumps("value"), json.dumps(resp)]
+    data: bytes = "\n".join(lines).encode("utf-8")
+    if codec == "gzip":
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    if codec == "xz":
+        return lzma.compress(data)
+    raise Exception("encode(): Unknown codec {}".format(codec))
+
+
+def codec_of(payload: Payload) -> str:
+    """
+    Returns the codec the snapshot was encoded with.
+    """
+    if isinstance(payload, str):
+        return "json"
+    if payload.startswith(GZIP_MAGIC):
+        return "gzip"
+    if payload.startswith(XZ_MAGIC):
+        return "xz"
+    raise Exception("codec_of(): Payload isn't JSON, gzip or xz")
+
+
+def decode(payload: Payload) -> Any:
+    """
+    Returns the snapshot encoded in the payload (see encode()).
+    """
+    if isinstance(payload, str):
+        return json.loads(payload)
+    lines: Iterator[Any] = read_lines(payload)
+    shape: str = next(lines)
+    if shape == "list":
+        return list(lines)
+    if shape == "dict":
+        return dict(lines)
+    return next(lines)
+
+
+def iter_records(payload: Payload) -> Iterator[Any]:
+    """
+    Yields the records of the snapshot encoded in the payload: the items of
+    a list, the (key, value) pairs of a dict, or else the snapshot itself.
+    Compressed snapshots are decompressed and parsed a line at a time, so
+    the whole snapshot is never held decoded.
+    """
+    if isinstance(payload, str):
+        yield from resp_records(json.loads(payload))
+        return
+    lines: Iterator[Any] = read_lines(payload)
+    next(lines)
+    yield from lines
+
+
+def resp_records(resp: Any) -> Iterator[Any]:
+    """
+    Returns an iterator over the records of the snapshot (see
+    iter_records()).
+    """
+    if isinstance(resp, list):
+        return iter(resp)
+    if isinstance(resp, dict):
+        return iter(resp.items())
+    return iter([resp])
+
+
+def read_lines(payload: bytes) -> Iterator[Any]:
+    """
+    Yields the shape of the compressed snapshot (see encode()) and then its
+    records, decompressing READ_SIZE bytes at a time and parsing the whole
+    lines among them in one go, which is much faster than a line at a time.
+    """
+    stream: Union[gzip.GzipFile, lzma.LZMAFile] = (
+        gzip.GzipFile(fileobj=io.BytesIO(payload))
+        if codec_of(payload) == "gzip"
+        else lzma.LZMAFile(io.BytesIO(payload))
+    )
+    with stream:
+        shape: str = json.loads(stream.readline())
+        yield shape
+        # The last line read so far, which may be cut off
+        tail: bytes = b""
+        chunk: bytes = stream.read(READ_SIZE)
+        while len(chunk) > 0:
+            lines: List[bytes] = (tail + chunk).split(b"\n")
+            tail = lines.pop()
+            for record in json.loads(b"[" + b",".join(lines) + b"]"):
+                yield tuple(record) if shape == "dict" else record
+            chunk = stream.read(READ_SIZE)
+        if len(tail) > 0:
+            record = json.loads(tail)
+            yield tuple(record) if shape == "dict" else record
+
+
+def save_snapshot(
+    data_dir: str,
+    kind: str,
+    t: datetime,
+    resp: Any,
+    codec: str = SNAPSHOT_CODEC,
+) -> None:
+    """
+    Writes the snapshot of the given kind taken at t to the store in
+    data_dir, encoded with codec.
+    """
+    with SnapshotStore(
+        os.path.join(data_dir, SNAPSHOT_DB), codec=codec
+    ) as store:
+        store.put(kind, t, resp)
+
+
+def read_snapshot(data_dir: str, kind: str) -> Payload:
+    """
+    Returns the latest snapshot of the given kind in data_dir still encoded,
+    from the store or, if it has none, from the old directory tree.
+    """
+    store_path: str = os.path.join(data_dir, SNAPSHOT_DB)
+    if os.path.exists(store_path):
+        with SnapshotStore(store_path, readonly=True) as store:
+            latest: Optional[Tuple[datetime, Payload]] = store.latest_payload(
+                kind
+            )
+        if latest is not None:
+            return latest[1]
+    tree_dir: str = os.path.join(data_dir, kind)
+    if os.path.isdir(tree_dir):
+        # The file is named after its directories, YYYY_MM_DD_HH_MM_SS.json
+        ds: str = latest_ds(tree_dir)
+        with open(
+            os.path.join(
+                tree_dir, ds, "{}.json".format(ds.replace(os.sep, "_"))
+            ),
+            "r",
+        ) as f:
+            return f.read()
+    raise Exception(
+        "read_snapshot(): No {} snapshots in {}".format(kind, data_dir)
+    )
+
+
+def load_snapshot(data_dir: str, kind: str) -> Any:
+    """
+    Returns the latest snapshot of the given kind in data_dir (see
+    read_snapshot()).
+    """
+    return decode(read_snapshot(data_dir, kind))
+
+
+def iter_snapshot(data_dir: str, kind: str) -> Iterator[Any]:
+    """
+    Returns an iterator over the records of the latest snapshot of the given
+    kind in data_dir (see read_snapshot() and iter_records()).
+    """
+    return iter_records(read_snapshot(data_dir, kind))
+
+
+def save_bundle(
+    data_dir: str, bundle: SnapshotBundle, codec: str = SNAPSHOT_CODEC
+) -> None:
+    """
+    Writes the bundle to the store in data_dir, encoded with codec.
+    """
+    with SnapshotStore(
+        os.path.join(data_dir, SNAPSHOT_DB), codec=codec
+    ) as store:
+        store.put_bundle(bundle)
+
+
+def load_bundle(
+    data_dir: str, as_of: Optional[datetime] = None
+) -> Optional[SnapshotBundle]:
+    """
+    Returns the latest bundle in data_dir, or the latest taken at or before
+    as_of if it's given, or None if there isn't one (as in a store written
+    before bundles were, or the old directory tree).
+    """
+    store_path: str = os.path.join(data_dir, SNAPSHOT_DB)
+    if not os.path.exists(store_path):
+        return None
+    with SnapshotStore(store_path, readonly=True) as store:
+        if as_of is None:
+            return store.latest_bundle()
+        return store.bundle_at(as_of)
+
+
+def bundle_times(
+    data_dir: str, start: datetime, end: datetime
+) -> List[datetime]:
+    """
+    Returns when each bundle in data_dir taken between start and end
+    (inclusive) was taken, oldest first.
+    """
+    store_path: str = os.path.join(data_dir, SNAPSHOT_DB)
+    if not os.path.exists(store_path):
+        return []
+    with SnapshotStore(store_path, readonly=True) as store:
+        return store.get_bundle_times(start, end)
+
+
+def tree_snapshots(data_dir: str, kind: str) -> Iterator[Tuple[datetime, Any]]:
+    """
+    Yields when each snapshot of the given kind in the old directory tree of
+    data_dir was taken along with the snapshot, oldest first. The tree is
+    walked in name order, which is time order, so only one directory is
+    listed in memory at a time.
+    """
+    tree_dir: str = os.path.join(data_dir, kind)
+    for (dir_path, dir_names, file_names) in os.walk(tree_dir):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            try:
+                t: datetime = datetime.strptime(file_name, TREE_FILE_FORMAT)
+            except ValueError:
+                log.warning(
+                    "Skipping {}, which isn't a snapshot.".format(
+                        os.path.join(dir_path, file_name)
+                    )
+                )
+                continue
+            with open(os.path.join(dir_path, file_name), "r") as f:
+                yield (t, json.load(f))
+
+
+def migrate_tree(data_dir: str, store: SnapshotStore) -> int:
+    """
+    Copies every snapshot in the old directory tree of data_dir into the
+    store, one commit per kind, and then indexes the bundles among them (see
+    SnapshotStore.index_bundles()). Returns how many snapshots were copied.
+    """
+    migrated: int = 0
+    for kind in SNAPSHOT_KINDS:
+        count: int = store.put_many(kind, tree_snapshots(data_dir, kind))
+        log.info("Migrated {} {} snapshots.".format(count, kind))
+        migrated += count
+    log.info("Indexed {} bundles.".format(store.index_bundles()))
+    return migrated
@@ -4,6 +4,7 @@
 
 
 from datetime import datetime, timedelta
+from typing import Any, Callable, Tuple
 
 import os
 
@@ -22,6 +23,14 @@ def pct_str(pct: float) -> str:
     return "{:.1%}".format(pct)
 
 
+def shares_str(shares: float) -> str:
+    """
+    Returns the given number of shares formatted as a string, with up to six
+    decimal places for fractional shares.
+    """
+    return "{:,.6f}".format(shares).rstrip("0").rstrip(".")
+
+
 def latency_str(start: datetime, end: datetime) -> str:
     """
     Returns the given latency in milliseconds
@@ -48,6 +57,18 @@ def difference_in_millis(start: datetime, end: datetime) -> float:
     return millis
 
 
+def timed(
+    func: Callable[..., Any], *args: Any, **kwargs: Any
+) -> Tuple[Any, datetime, datetime]:
+    """
+    Calls func with the given arguments and returns its result along with
+    when the call started and ended.
+    """
+    start: datetime = datetime.now()
+    result: Any = func(*args, **kwargs)
+    return (result, start, datetime.now())
+
+
 def latest_ds(base_path: str) -> str:
     """
     Returns the latest date partitioned string under the base path.
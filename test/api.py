@@ -0,0 +1,280 @@
+# Ricky Galliani
+# Hanna
+# test/api.py
+
+from src.api import (
+    HoldingInfo,
+    SecurityInfo,
+    derive_securities,
+    fetch_latest_prices,
+    fetch_positions,
+    fetch_securities,
+    load_holdings,
+    load_securities,
+)
+
+from src.instrument_cache import InstrumentCache
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from unittest.mock import patch
+
+import os
+import tempfile
+import time
+import unittest
+
+# Usage: python3 -m unittest --verbose test.api
+
+
+URL: str = "https://api.robinhood.com"
+
+
+def fake_instrument(url: str) -> Dict[str, Any]:
+    time.sleep(0.05)
+    sec_id: str = url.split("/")[-1]
+    return {"name": "{}_name".format(sec_id), "symbol": sec_id.upper()}
+
+
+def fake_quotes(symbols: List[str]) -> List[Optional[Dict[str, Any]]]:
+    # Like the API, a symbol without a quote gets None
+    return [
+        (
+            {
+                "symbol": sym,
+                "last_trade_price": "{}.0".format(len(sym)),
+                "last_extended_hours_trade_price": (
+                    "{}.5".format(len(sym)) if sym.startswith("EXT") else None
+                ),
+            }
+            if sym != "MISSING"
+            else None
+        )
+        for sym in symbols
+    ]
+
+
+def fake_positions() -> List[Optional[Dict[str, Any]]]:
+    return [
+        {
+            "instrument": "{}/instruments/{}/".format(URL, sec_id),
+            "quantity": quantity,
+            "average_buy_price": average_buy_price,
+        }
+        for (sec_id, quantity, average_buy_price) in [
+            ("aa", "2.00000000", "1.0000"),
+            ("bbbb", "1.50000000", "0.0000"),
+            ("missing", "1.00000000", "1.0000"),
+        ]
+    ] + [None]
+
+
+@patch("src.api.r.get_quotes", side_effect=fake_quotes)
+@patch("src.api.r.get_instrument_by_url", side_effect=fake_instrument)
+class ApiTest(unittest.TestCase):
+    def test_fetch_securities(self, _, __):
+        resp: Dict[str, Any] = fetch_securities(["b", "aa"])
+        self.assertEqual(list(resp.keys()), ["b", "aa"])
+        self.assertEqual(
+            resp["aa"], {"name": "aa_name", "symbol": "AA", "price": ["2.0"]}
+        )
+
+    def test_fetch_securities_concurrently(self, instrument, _):
+        sec_ids: List[str] = ["sec{}".format(i) for i in range(16)]
+        s: datetime = datetime.now()
+        fetch_securities(sec_ids, 8)
+        # 16 requests of 50 ms each take 0.8 s one at a time
+        self.assertTrue((datetime.now() - s).total_seconds() < 0.4)
+        self.assertEqual(instrument.call_count, 16)
+
+    def test_fetch_securities_batches_quotes(self, _, quotes):
+        sec_ids: List[str] = ["sec{}".format(i) for i in range(16)]
+        resp: Dict[str, Any] = fetch_securities(sec_ids)
+        self.assertEqual(quotes.call_count, 1)
+        self.assertEqual(resp["sec12"]["price"], ["5.0"])
+
+    def test_fetch_latest_prices(self, _, quotes):
+        symbols: List[str] = ["S{}".format(i) for i in range(120)]
+        prices: Dict[str, str] = fetch_latest_prices(symbols + ["S0"], 50)
+        self.assertEqual(quotes.call_count, 3)
+        self.assertEqual(len(prices), 120)
+        self.assertEqual(prices["S100"], "4.0")
+
+    def test_fetch_latest_prices_extended_hours(self, _, __):
+        self.assertEqual(
+            fetch_latest_prices(["EXT", "AB"]), {"EXT": "3.5", "AB": "2.0"}
+        )
+
+    def test_fetch_latest_prices_missing(self, _, __):
+        self.assertEqual(fetch_latest_prices(["MISSING", "A"]), {"A": "1.0"})
+
+    def test_fetch_latest_prices_chunk_missing(self, _, quotes):
+        # The only symbol of the second chunk has no quote
+        prices: Dict[str, str] = fetch_latest_prices(["A", "MISSING"], 1)
+        self.assertEqual(prices, {"A": "1.0"})
+        self.assertEqual(quotes.call_count, 2)
+
+    def test_fetch_latest_prices_none(self, _, quotes):
+        self.assertEqual(fetch_latest_prices([]), {})
+        self.assertEqual(quotes.call_count, 0)
+
+    def test_fetch_securities_cache(self, instrument, _):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache: InstrumentCache = InstrumentCache(
+                os.path.join(cache_dir, "instruments.json")
+            )
+            cache.put("sec1", "Cached Name", "SEC1")
+            resp: Dict[str, Any] = fetch_securities(
+                ["sec1", "sec2"], cache=cache
+            )
+            self.assertEqual(list(resp.keys()), ["sec1", "sec2"])
+            self.assertEqual(resp["sec1"]["name"], "Cached Name")
+            self.assertEqual(resp["sec1"]["price"], ["4.0"])
+            self.assertEqual(instrument.call_count, 1)
+            self.assertEqual(cache.get_hits(), 1)
+            self.assertEqual(cache.get_misses(), 1)
+            fetch_securities(["sec1", "sec2"], cache=cache)
+            self.assertEqual(instrument.call_count, 1)
+            self.assertEqual(cache.get_hits(), 3)
+
+    def test_load_securities_online(self, instrument, _):
+        with tempfile.TemporaryDirectory() as data_dir:
+            securities: Dict[str, SecurityInfo] = load_securities(
+                ["sec1", "sec22"], datetime.now(), True, False, data_dir
+            )
+            self.assertEqual(securities["sec22"].get_name(), "sec22_name")
+            self.assertEqual(securities["sec22"].get_symbol(), "SEC22")
+            self.assertEqual(securities["sec22"].get_price(), 5.0)
+            self.assertEqual(securities["sec1"].get_price(), 4.0)
+            # A warm refresh only fetches prices
+            load_securities(
+                ["sec1", "sec22"], datetime.now(), True, False, data_dir
+            )
+            self.assertEqual(instrument.call_count, 2)
+
+    def test_load_securities_missing_quote(self, _, __):
+        with tempfile.TemporaryDirectory() as data_dir:
+            securities: Dict[str, SecurityInfo] = load_securities(
+                ["sec1", "missing"], datetime.now(), True, True, data_dir
+            )
+            self.assertEqual(list(securities.keys()), ["sec1"])
+            # The snapshot keeps it, so offline loads leave it out too
+            securities = load_securities(
+                ["sec1", "missing"], datetime.now(), False, False, data_dir
+            )
+            self.assertEqual(list(securities.keys()), ["sec1"])
+
+    def test_derive_securities(self, _, __):
+        holdings: Dict[str, HoldingInfo] = {
+            "sec1": HoldingInfo(
+                "sec1", "Sec 1", 10.5, 1, 10.0, 10.5, 50.0, 0.0, 0.0, "SEC1"
+            ),
+            "sec2": HoldingInfo(
+                "sec2", "Sec 2", 20.0, 1, 20.0, 20.0, 50.0, 0.0, 0.0
+            ),
+        }
+        self.assertEqual(
+            derive_securities(holdings),
+            {"sec1": {"name": "Sec 1", "symbol": "SEC1", "price": ["10.5"]}},
+        )
+
+    def test_load_holdings_keeps_symbol(self, _, __):
+        holding: Dict[str, str] = {
+            "id": "sec1",
+            "name": "Sec 1",
+            "price": "10.5",
+            "quantity": "2.5",
+            "average_buy_price": "10.0",
+            "equity": "26.25",
+            "percentage": "100.0",
+            "percent_change": "5.0",
+            "equity_change": "1.25",
+        }
+        with patch(
+            "src.api.r.build_holdings", return_value={"SEC1": holding}
+        ):
+            holdings: Dict[str, HoldingInfo] = load_holdings(
+                datetime.now(), True, False
+            )
+        self.assertEqual(holdings["sec1"].get_symbol(), "SEC1")
+        self.assertEqual(holdings["sec1"].get_quantity(), 2.5)
+
+    def test_load_securities_derived(self, instrument, quotes):
+        derived: Dict[str, Any] = {
+            "sec1": {"name": "Sec 1", "symbol": "SEC1", "price": ["10.5"]}
+        }
+        with tempfile.TemporaryDirectory() as data_dir:
+            securities: Dict[str, SecurityInfo] = load_securities(
+                ["sec1", "sec22"],
+                datetime.now(),
+                True,
+                False,
+                data_dir,
+                None,
+                derived,
+            )
+        self.assertEqual(list(securities.keys()), ["sec1", "sec22"])
+        self.assertEqual(securities["sec1"].get_price(), 10.5)
+        self.assertEqual(securities["sec22"].get_price(), 5.0)
+        self.assertEqual(instrument.call_count, 1)
+        self.assertEqual(quotes.call_args[0][0], ["SEC22"])
+
+    def test_fetch_positions(self, instrument, quotes):
+        with patch(
+            "src.api.r.get_current_positions", side_effect=fake_positions
+        ):
+            resp: List[Dict[str, Any]] = fetch_positions()
+        self.assertEqual([h["id"] for h in resp], ["aa", "bbbb"])
+        self.assertEqual(
+            resp[0],
+            {
+                "id": "aa",
+                "name": "aa_name",
+                "symbol": "AA",
+                "price": "2.0",
+                "quantity": "2.00000000",
+                "average_buy_price": "1.0000",
+                "equity": "4.00",
+                "percentage": "40.00",
+                "percent_change": "100.00",
+                "equity_change": "2.00",
+            },
+        )
+        self.assertEqual(resp[1]["percentage"], "60.00")
+        self.assertEqual(resp[1]["percent_change"], "0.00")
+        self.assertEqual(instrument.call_count, 3)
+        self.assertEqual(quotes.call_count, 1)
+
+    def test_fetch_positions_cached_instruments(self, instrument, quotes):
+        with tempfile.TemporaryDirectory() as data_dir:
+            cache: InstrumentCache = InstrumentCache(
+                os.path.join(data_dir, "instruments.json")
+            )
+            with patch(
+                "src.api.r.get_current_positions", side_effect=fake_positions
+            ):
+                fetch_positions(cache)
+                fetch_positions(cache)
+            self.assertTrue(
+                os.path.exists(os.path.join(data_dir, "instruments.json"))
+            )
+        self.assertEqual(instrument.call_count, 3)
+        self.assertEqual(quotes.call_count, 2)
+
+    def test_load_holdings_from_positions(self, _, __):
+        with tempfile.TemporaryDirectory() as data_dir:
+            with patch(
+                "src.api.r.get_current_positions", side_effect=fake_positions
+            ):
+                holdings: Dict[str, HoldingInfo] = load_holdings(
+                    datetime.now(), True, False, data_dir, True
+                )
+        self.assertEqual(list(holdings.keys()), ["aa", "bbbb"])
+        self.assertEqual(holdings["aa"].get_symbol(), "AA")
+        self.assertEqual(holdings["aa"].get_equity(), 4.0)
+        self.assertEqual(holdings["bbbb"].get_quantity(), 1.5)
+        self.assertEqual(holdings["bbbb"].get_percentage(), 60.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,10 +4,11 @@
 
 from src.asset_class import AssetClass
 from src.holding import Holding
+from src.knapsack import KnapsackTable
 from src.purchase import Purchase
 from src.security import Security
 
-from typing import List
+from typing import Dict, List
 
 import unittest
 
@@ -255,6 +256,142 @@ class AssetClassTest(unittest.TestCase):
         self.assertEqual(len(purchases), 1)
         self.assertEqual(purchases["sec1"], p1)
 
+    def test_plan_purchases_numpy_engine(self):
+        ac: AssetClass = AssetClass("ac", target_percentage=1.0)
+        sec1: Security = Security("sec1", "SEC1", price=33.0, buy_restricted=0)
+        sec2: Security = Security("sec2", "SEC2", price=49.0, buy_restricted=0)
+        ac.add_security(sec1)
+        ac.add_security(sec2)
+        for budget in [100, 98.5, 0, 2500.75]:
+            self.assertEqual(
+                ac.plan_purchases(budget, "numpy"), ac.plan_purchases(budget)
+            )
+
+    def test_plan_purchases_bitset_engine(self):
+        ac: AssetClass = AssetClass("ac", target_percentage=1.0)
+        sec1: Security = Security("sec1", "SEC1", price=33.0, buy_restricted=0)
+        sec2: Security = Security("sec2", "SEC2", price=49.0, buy_restricted=0)
+        ac.add_security(sec1)
+        ac.add_security(sec2)
+        self.assertEqual(
+            ac.plan_purchases(100, "bitset"), {"sec1": Purchase(sec1, 3)}
+        )
+        self.assertEqual(
+            ac.plan_purchases(98.5, "bitset"), {"sec2": Purchase(sec2, 2)}
+        )
+
+    def test_plan_purchases_granularity(self):
+        ac: AssetClass = AssetClass("ac", target_percentage=1.0)
+        sec1: Security = Security("sec1", "SEC1", price=33.5, buy_restricted=0)
+        sec2: Security = Security("sec2", "SEC2", price=49.0, buy_restricted=0)
+        ac.add_security(sec1)
+        ac.add_security(sec2)
+        # sec1 is planned at $34, so 3 shares no longer fit into $100.50,
+        # and the $2.50 left over buys nothing more
+        purchases = ac.plan_purchases(100.5, granularity=1.0)
+        self.assertEqual(purchases, {"sec2": Purchase(sec2, 2)})
+        self.assertEqual(ac.get_leftover_bound(100.5, 1.0), 33.49)
+
+    def test_plan_purchases_large_budget(self):
+        ac: AssetClass = AssetClass("ac", target_percentage=1.0)
+        sec1: Security = Security("sec1", "SEC1", price=33.0, buy_restricted=0)
+        sec2: Security = Security("sec2", "SEC2", price=49.0, buy_restricted=0)
+        ac.add_security(sec1)
+        ac.add_security(sec2)
+        purchases = ac.plan_purchases(10000000.0, large_budget=1000.0)
+        total: float = sum([p.get_cost() for p in purchases.values()])
+        self.assertTrue(abs(total - 10000000.0) < 1e-3)
+
+    def test_plan_purchases_table(self):
+        ac: AssetClass = AssetClass("ac", target_percentage=1.0)
+        sec1: Security = Security("sec1", "SEC1", price=33.0, buy_restricted=0)
+        sec2: Security = Security("sec2", "SEC2", price=49.0, buy_restricted=0)
+        ac.add_security(sec1)
+        ac.add_security(sec2)
+        table: KnapsackTable = ac.build_purchase_table(1000.0)
+        for budget in [100, 98.5, 0, 999.99]:
+            self.assertEqual(
+                ac.plan_purchases(budget, table=table),
+                ac.plan_purchases(budget),
+            )
+
+    def test_plan_purchases_stale_table(self):
+        ac: AssetClass = AssetClass("ac", target_percentage=1.0)
+        sec1: Security = Security("sec1", "SEC1", price=33.0, buy_restricted=0)
+        ac.add_security(sec1)
+        table: KnapsackTable = ac.build_purchase_table(1000.0)
+        sec1.set_price(50.0)
+        self.assertEqual(
+            ac.plan_purchases(100, table=table), {"sec1": Purchase(sec1, 2)}
+        )
+
+    def test_plan_purchases_cache(self):
+        ac: AssetClass = AssetClass("ac", target_percentage=1.0)
+        sec1: Security = Security("sec1", "SEC1", price=33.0, buy_restricted=0)
+        sec2: Security = Security("sec2", "SEC2", price=49.0, buy_restricted=0)
+        ac.add_security(sec1)
+        ac.add_security(sec2)
+        first = ac.plan_purchases(100)
+        self.assertEqual(ac.plan_purchases(100), first)
+        self.assertEqual(ac.get_plan_cache_hits(), 1)
+        self.assertEqual(ac.get_plan_cache_misses(), 1)
+        sec1.set_price(34.0)
+        self.assertEqual(ac.plan_purchases(100), {"sec2": Purchase(sec2, 2)})
+        sec2.restrict_buy()
+        self.assertEqual(ac.plan_purchases(100), {"sec1": Purchase(sec1, 2)})
+        self.assertEqual(ac.get_plan_cache_hits(), 1)
+        self.assertEqual(ac.get_plan_cache_misses(), 3)
+
+    def test_plan_fractional_purchases(self):
+        ac: AssetClass = AssetClass("ac", target_percentage=1.0)
+        sec1: Security = Security("sec1", "SEC1", price=33.0, buy_restricted=0)
+        sec2: Security = Security("sec2", "SEC2", price=49.0, buy_restricted=0)
+        sec3: Security = Security("sec3", "SEC3", price=20.0, buy_restricted=1)
+        ac.add_security(sec1)
+        ac.add_security(sec2)
+        ac.add_security(sec3)
+        purchases: Dict[str, Purchase] = ac.plan_fractional_purchases(100)
+        self.assertEqual(
+            purchases,
+            {
+                "sec1": Purchase(sec1, 1.515151),
+                "sec2": Purchase(sec2, 1.020408),
+            },
+        )
+        total: float = sum([p.get_cost() for p in purchases.values()])
+        self.assertTrue(100 - total < 0.0001)
+
+    def test_plan_fractional_purchases_no_budget(self):
+        ac: AssetClass = AssetClass("ac", target_percentage=1.0)
+        ac.add_security(Security("sec", "SEC", price=33.0, buy_restricted=0))
+        self.assertEqual(ac.plan_fractional_purchases(0), {})
+
+    def test_buy_fractional(self):
+        ac: AssetClass = AssetClass("ac", target_percentage=1.0)
+        sec: Security = Security("sec", "SEC", price=4.0)
+        ac.add_security(sec)
+        ac.buy(sec, 2.5, False)
+        ac.buy(sec, 0.25, False)
+        self.assertEqual(ac.get_holding("sec"), Holding(sec, 2.75, 4.0))
+        self.assertEqual(ac.get_value(), 11.0)
+
+    def test_plan_purchases_does_not_overspend(self):
+        ac: AssetClass = AssetClass("ac", target_percentage=1.0)
+        # 1.15 * 100 is just under 115 in floating point
+        sec: Security = Security("sec", "SEC", price=1.15, buy_restricted=0)
+        ac.add_security(sec)
+        self.assertEqual(ac.plan_purchases(3.44), {"sec": Purchase(sec, 2)})
+
+    def test_plan_purchases_sub_cent_price(self):
+        ac: AssetClass = AssetClass("ac", target_percentage=1.0)
+        # A share at 12.3449 costs more than 12.34
+        sec: Security = Security(
+            "sec", "SEC", price=12.3449, buy_restricted=0
+        )
+        ac.add_security(sec)
+        self.assertEqual(ac.plan_purchases(12.34), {})
+        self.assertEqual(ac.plan_purchases(12.35), {"sec": Purchase(sec, 1)})
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,122 @@
+# Ricky Galliani
+# Hanna
+# test/batch.py
+
+from batch import load_accounts, plan_account, plan_accounts
+
+from typing import Any, Dict, List
+
+import json
+import os
+import tempfile
+import unittest
+
+# Usage: python3 -m unittest --verbose test.batch
+
+
+def write_snapshot(data_dir: str, kind: str, resp: Any) -> None:
+    snapshot_dir: str = os.path.join(
+        data_dir, kind, "2019", "01", "01", "00", "00", "00"
+    )
+    os.makedirs(snapshot_dir)
+    with open(
+        os.path.join(snapshot_dir, "2019_01_01_00_00_00.json"), "w"
+    ) as f:
+        f.write(json.dumps(resp))
+
+
+def write_account(base_dir: str, name: str, cash: float) -> Dict[str, Any]:
+    config_file: str = os.path.join(base_dir, "{}.json".format(name))
+    with open(config_file, "w") as f:
+        f.write(
+            json.dumps(
+                [
+                    {
+                        "name": "ac",
+                        "target_percentage": 1.0,
+                        "securities": ["sec1", "sec2"],
+                        "buy_restrictions": [],
+                    }
+                ]
+            )
+        )
+    data_dir: str = os.path.join(base_dir, name)
+    write_snapshot(
+        data_dir,
+        "account_profile",
+        {"margin_balances": {"unallocated_margin_cash": str(cash)}},
+    )
+    holdings: List[Dict[str, Any]] = [
+        {
+            "id": sec_id,
+            "name": sec_id,
+            "price": price,
+            "quantity": "1.0",
+            "average_buy_price": price,
+            "equity": price,
+            "percentage": "50.0",
+            "percent_change": "0.0",
+            "equity_change": "0.0",
+        }
+        for (sec_id, price) in [("sec1", "33.0"), ("sec2", "49.0")]
+    ]
+    write_snapshot(data_dir, "holdings", holdings)
+    write_snapshot(
+        data_dir,
+        "securities",
+        {
+            "sec1": {"name": "sec1", "symbol": "SEC1", "price": ["33.0"]},
+            "sec2": {"name": "sec2", "symbol": "SEC2", "price": ["49.0"]},
+        },
+    )
+    write_snapshot(data_dir, "dividends", [])
+    return {"name": name, "config": config_file, "data": data_dir}
+
+
+class BatchTest(unittest.TestCase):
+    def test_load_accounts(self):
+        with tempfile.TemporaryDirectory() as base_dir:
+            accounts_file: str = os.path.join(base_dir, "accounts.json")
+            with open(accounts_file, "w") as f:
+                f.write(
+                    json.dumps([{"name": "a", "config": "c", "data": "d"}])
+                )
+            self.assertEqual(
+                load_accounts(accounts_file),
+                [{"name": "a", "config": "c", "data": "d"}],
+            )
+
+    def test_plan_account(self):
+        with tempfile.TemporaryDirectory() as base_dir:
+            a: Dict[str, Any] = write_account(base_dir, "a", 100.0)
+            (name, deposit, latency) = plan_account(
+                a["name"], a["config"], a["data"]
+            )
+            self.assertEqual(name, "a")
+            self.assertEqual(deposit.get_total(), 99.0)
+            self.assertTrue(latency >= 0)
+
+    def test_plan_accounts(self):
+        with tempfile.TemporaryDirectory() as base_dir:
+            accounts: List[Dict[str, Any]] = [
+                write_account(base_dir, "a", 100.0),
+                write_account(base_dir, "b", 98.5),
+            ]
+            accounts[1]["amount"] = 50.0
+            (deposits, latencies) = plan_accounts(accounts, 2)
+            self.assertEqual(sorted(deposits.keys()), ["a", "b"])
+            self.assertEqual(sorted(latencies.keys()), ["a", "b"])
+            self.assertEqual(deposits["a"].get_total(), 99.0)
+            self.assertEqual(deposits["b"].get_total(), 49.0)
+            self.assertEqual(deposits["b"].get_num_shares(), 1)
+
+    def test_plan_accounts_matches_plan_account(self):
+        with tempfile.TemporaryDirectory() as base_dir:
+            a: Dict[str, Any] = write_account(base_dir, "a", 1000.0)
+            (deposits, _) = plan_accounts([a])
+            (_, deposit, _) = plan_account(a["name"], a["config"], a["data"])
+            self.assertEqual(deposits["a"], deposit)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+# Ricky Galliani
+# Hanna
+# test/benchmark.py
+
+from benchmark import (
+    NUM_ASSET_CLASSES,
+    PRICE_SPREADS,
+    SNAPSHOT_LAYOUTS,
+    SOLVERS,
+    benchmark_refresh,
+    benchmark_snapshots,
+    compare_results,
+    make_asset_class,
+    make_portfolio,
+    run_suite,
+    too_large,
+)
+from fake_broker import FakeBroker, make_account
+
+from src.asset_class import AssetClass
+from src.cassette import Cassette
+from src.portfolio import Portfolio
+from src.session import configure_session
+
+from typing import Any, Dict, List
+from unittest.mock import patch
+
+import os
+import requests
+import robin_stocks as r
+import robin_stocks.helper
+import tempfile
+import unittest
+
+# Usage: python3 -m unittest --verbose test.benchmark
+
+
+class BenchmarkTest(unittest.TestCase):
+    def test_make_asset_class(self):
+        ac: AssetClass = make_asset_class(5, PRICE_SPREADS["cheap"], 0)
+        self.assertEqual(len(ac.get_securities()), 5)
+        for sec in ac.get_securities():
+            self.assertTrue(1.0 <= sec.get_price() <= 50.0)
+        self.assertEqual(
+            make_asset_class(5, PRICE_SPREADS["cheap"], 0).to_dict(),
+            ac.to_dict(),
+        )
+
+    def test_make_portfolio(self):
+        p: Portfolio = make_portfolio(3, PRICE_SPREADS["expensive"], 0, 10.0)
+        self.assertEqual(len(p.get_asset_classes()), NUM_ASSET_CLASSES)
+        self.assertEqual(p.get_cash(), 10.0)
+
+    def test_too_large(self):
+        self.assertFalse(too_large("dp", 1000.0))
+        self.assertTrue(too_large("dp", 100000.0))
+        self.assertTrue(too_large("auto", 100000.0))
+        self.assertFalse(too_large("auto", 1000000.0))
+        self.assertFalse(too_large("bnb", 1000000.0))
+
+    def test_run_suite(self):
+        results: List[Dict[str, Any]] = run_suite([2], [10.0, 100000.0])
+        self.assertEqual(
+            len(results), 2 * 2 * len(PRICE_SPREADS) * len(SOLVERS)
+        )
+        for result in results:
+            if result["skipped"]:
+                self.assertTrue(result["solver"] in ["dp", "auto"])
+                continue
+            self.assertTrue(result["millis"] >= 0)
+            self.assertTrue(result["peak_bytes"] > 0)
+            self.assertTrue(result["leftover"] >= 0)
+            if result["solver"] == "fractional":
+                self.assertTrue(result["leftover"] < 0.01 * 2 * 4)
+
+    def test_compare_results(self):
+        old: Dict[str, Any] = {
+            "benchmark": "asset_class",
+            "securities": 1,
+            "budget": 10.0,
+            "spread": "cheap",
+            "solver": "dp",
+            "skipped": False,
+            "millis": 10.0,
+            "peak_bytes": 100,
+            "leftover": 1.0,
+        }
+        slower: Dict[str, Any] = dict(old, millis=20.0)
+        noisy: Dict[str, Any] = dict(old, millis=0.1)
+        self.assertEqual(compare_results([old], [old]), [])
+        self.assertEqual(compare_results([old], [slower]), [slower])
+        self.assertEqual(
+            compare_results([noisy], [dict(noisy, millis=0.5)]), []
+        )
+        more_left: Dict[str, Any] = dict(old, leftover=2.0)
+        self.assertEqual(compare_results([old], [more_left]), [more_left])
+
+    def test_benchmark_refresh(self):
+        config: List[Dict[str, Any]] = [
+            {
+                "name": "ac",
+                "target_percentage": 1.0,
+                "securities": ["sec1", "sec2", "sec3"],
+                "buy_restrictions": [],
+            }
+        ]
+        broker: FakeBroker = FakeBroker(
+            make_account(2, 0, ["sec1", "sec2"]), latency=0.02
+        )
+        cassette: Cassette = Cassette(os.devnull, fresh=True)
+        with patch.object(robin_stocks.helper, "Session", requests.Session()):
+            configure_session(base_url=broker.start(), cassette=cassette)
+            r.login("fake", "fake")
+            p: Portfolio = Portfolio()
+            p.load_configuration(config)
+            with tempfile.TemporaryDirectory() as data_dir:
+                p.refresh(True, False, data_dir, False, True)
+            broker.stop()
+        with patch.object(robin_stocks.helper, "Session", requests.Session()):
+            result: Dict[str, Any] = benchmark_refresh(
+                cassette, config, 1.0, True
+            )
+            fast: Dict[str, Any] = benchmark_refresh(
+                cassette, config, 0.0, True
+            )
+        robin_stocks.helper.set_login_state(False)
+        self.assertEqual(result["responses"], len(cassette) - 1)
+        self.assertEqual(fast["responses"], len(cassette) - 1)
+        self.assertEqual(
+            sorted(result["stages"].keys()),
+            ["account profile", "dividends", "holdings", "securities"],
+        )
+        self.assertTrue(result["millis"] >= 40)
+        self.assertTrue(fast["millis"] < result["millis"])
+        self.assertEqual(result["critical_path"], ["holdings", "securities"])
+
+    def test_benchmark_snapshots(self):
+        results: List[Dict[str, Any]] = benchmark_snapshots(5, 200)
+        self.assertEqual(
+            [result["layout"] for result in results], SNAPSHOT_LAYOUTS
+        )
+        sizes: Dict[str, int] = dict(
+            [(result["layout"], result["bytes"]) for result in results]
+        )
+        self.assertTrue(sizes["gzip"] < sizes["json"])
+        for result in results:
+            self.assertTrue(result["dividends_millis"] > 0)
+            self.assertTrue(result["holdings_peak"] > 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,195 @@
+# Ricky Galliani
+# Hanna
+# test/cassette.py
+
+from fake_broker import FakeBroker, make_account
+from src.api import (
+    HoldingInfo,
+    SecurityInfo,
+    fetch_latest_prices,
+    load_account_profile,
+    load_holdings,
+    load_securities,
+)
+from src.cassette import Cassette, redact
+from src.instrument_cache import InstrumentCache
+from src.scheduler import RequestScheduler
+from src.session import configure_replay, configure_session
+
+from datetime import datetime
+from typing import Any, Dict, List
+from unittest.mock import patch
+
+import json
+import os
+import requests
+import robin_stocks as r
+import robin_stocks.helper
+import tempfile
+import time
+import unittest
+
+# Usage: python3 -m unittest --verbose test.cassette
+
+URL: str = "https://api.robinhood.com/quotes/?symbols=SEC1"
+
+
+class CassetteTest(unittest.TestCase):
+    def test_redact(self):
+        self.assertEqual(
+            redact({"access_token": "secret", "results": [{"a": 1}]}),
+            {"access_token": "REDACTED", "results": [{"a": 1}]},
+        )
+
+    def test_record_and_play(self):
+        cassette: Cassette = Cassette(os.devnull, fresh=True)
+        cassette.record("GET", URL, 200, b'{"price": "1.0"}', 10.0)
+        cassette.record("GET", URL, 200, b'{"price": "2.0"}', 20.0)
+        self.assertEqual(len(cassette), 2)
+        self.assertEqual(cassette.play("GET", URL)["latency"], 10.0)
+        self.assertEqual(cassette.play("GET", URL)["latency"], 20.0)
+        # The last response is played again once they've all been played
+        self.assertEqual(cassette.play("GET", URL)["latency"], 20.0)
+        self.assertEqual(cassette.play("POST", URL), None)
+        self.assertEqual(cassette.get_played(), 3)
+        cassette.rewind()
+        self.assertEqual(cassette.play("GET", URL)["latency"], 10.0)
+
+    def test_save(self):
+        with tempfile.TemporaryDirectory() as cassette_dir:
+            path: str = os.path.join(cassette_dir, "c", "cassette.json")
+            cassette: Cassette = Cassette(path)
+            cassette.record("POST", URL, 200, b'{"access_token": "x"}', 1.0)
+            cassette.record("GET", URL, 500, b"not json", 2.0)
+            cassette.save()
+            loaded: Cassette = Cassette(path)
+            self.assertEqual(
+                loaded.get_interactions(), cassette.get_interactions()
+            )
+            self.assertEqual(
+                json.loads(loaded.play("POST", URL)["content"]),
+                {"access_token": "REDACTED"},
+            )
+            self.assertEqual(loaded.play("GET", URL)["content"], "not json")
+            self.assertEqual(len(Cassette(path, fresh=True)), 0)
+
+    def test_replay(self):
+        cassette: Cassette = Cassette(os.devnull, fresh=True)
+        cassette.record("GET", URL, 404, b'{"detail": "Not found."}', 100.0)
+        session: requests.Session = requests.Session()
+        configure_replay(cassette, session, 2.0)
+        s: float = time.monotonic()
+        resp = session.get(URL)
+        self.assertTrue(time.monotonic() - s >= 0.05)
+        self.assertEqual(resp.status_code, 404)
+        self.assertEqual(resp.json(), {"detail": "Not found."})
+        self.assertRaises(Exception, session.get, URL + ",SEC2")
+
+    def test_record_then_replay_loaders(self):
+        account: Dict[str, Any] = make_account(6, seed=2)
+        broker: FakeBroker = FakeBroker(account, latency=0.01, page_size=4)
+        cassette: Cassette = Cassette(os.devnull, fresh=True)
+        recorded: Dict[str, HoldingInfo] = {}
+        replayed: Dict[str, HoldingInfo] = {}
+        with tempfile.TemporaryDirectory() as data_dir:
+            with patch.object(
+                robin_stocks.helper, "Session", requests.Session()
+            ):
+                configure_session(base_url=broker.start(), cassette=cassette)
+                r.login("fake", "fake")
+                recorded = load_holdings(
+                    datetime.now(), True, False, data_dir, True
+                )
+                load_account_profile(datetime.now(), True, False)
+                broker.stop()
+            self.assertTrue(
+                all([i["latency"] >= 10 for i in cassette.get_interactions()])
+            )
+            os.remove(os.path.join(data_dir, "instruments.json"))
+            with patch.object(
+                robin_stocks.helper, "Session", requests.Session()
+            ):
+                configure_replay(cassette, speed=0)
+                replayed = load_holdings(
+                    datetime.now(), True, False, data_dir, True
+                )
+                self.assertEqual(
+                    load_account_profile(
+                        datetime.now(), True, False
+                    ).get_buying_power(),
+                    1000.0,
+                )
+            robin_stocks.helper.set_login_state(False)
+        self.assertEqual(sorted(recorded.keys()), sorted(replayed.keys()))
+        for (sec_id, hol) in recorded.items():
+            self.assertEqual(hol.get_equity(), replayed[sec_id].get_equity())
+        self.assertEqual(cassette.get_played(), len(cassette) - 1)
+
+    def test_record_final_responses(self):
+        account: Dict[str, Any] = make_account(6, seed=2)
+        broker: FakeBroker = FakeBroker(
+            account, error_rate=0.3, error_status=429
+        )
+        cassette: Cassette = Cassette(os.devnull, fresh=True)
+        symbols: List[str] = ["FAKE{}".format(i) for i in range(6)]
+        prices: Dict[str, str] = {}
+        with patch.object(robin_stocks.helper, "Session", requests.Session()):
+            configure_session(
+                base_url=broker.start(),
+                scheduler=RequestScheduler(rate=1000, backoff_base=0.001),
+                cassette=cassette,
+            )
+            r.login("fake", "fake")
+            prices = fetch_latest_prices(symbols, 1)
+            broker.stop()
+        # Throttled attempts were retried, but only what robin_stocks saw
+        # was recorded
+        self.assertTrue(sum(broker.get_requests().values()) > len(cassette))
+        self.assertEqual(
+            [i["status"] for i in cassette.get_interactions()],
+            [200] * len(cassette),
+        )
+        with patch.object(robin_stocks.helper, "Session", requests.Session()):
+            configure_replay(cassette, speed=0)
+            self.assertEqual(fetch_latest_prices(symbols, 1), prices)
+        robin_stocks.helper.set_login_state(False)
+
+    def test_record_without_instrument_cache(self):
+        account: Dict[str, Any] = make_account(3, seed=2)
+        sec_ids: List[str] = list(account["instruments"].keys())
+        broker: FakeBroker = FakeBroker(account)
+        cassette: Cassette = Cassette(os.devnull, fresh=True)
+        with tempfile.TemporaryDirectory() as data_dir:
+            path: str = os.path.join(data_dir, "instruments.json")
+            warm: InstrumentCache = InstrumentCache(path)
+            for sec_id in sec_ids:
+                warm.put(sec_id, "Cached", "CACHED")
+            warm.save()
+            with patch.object(
+                robin_stocks.helper, "Session", requests.Session()
+            ):
+                configure_session(base_url=broker.start(), cassette=cassette)
+                r.login("fake", "fake")
+                # As main.py does before recording
+                recording: InstrumentCache = InstrumentCache(path)
+                recording.invalidate()
+                recording.save()
+                load_securities(sec_ids, datetime.now(), True, False, data_dir)
+                broker.stop()
+            self.assertEqual(len(InstrumentCache(path)), 3)
+        # A replay into a cold cache finds every instrument in the cassette
+        with tempfile.TemporaryDirectory() as replay_dir:
+            with patch.object(
+                robin_stocks.helper, "Session", requests.Session()
+            ):
+                configure_replay(cassette, speed=0)
+                securities: Dict[str, SecurityInfo] = load_securities(
+                    sec_ids, datetime.now(), True, False, replay_dir
+                )
+            robin_stocks.helper.set_login_state(False)
+        self.assertEqual(sorted(securities.keys()), sorted(sec_ids))
+        self.assertEqual(securities[sec_ids[0]].get_name(), "Fake 0")
+
+
+if __name__ == "__main__":
+    unittest.main()
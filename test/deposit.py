@@ -69,6 +69,25 @@ class DepositTest(unittest.TestCase):
         d.add_purchase("ac", Purchase(sec2, 10))
         self.assertEqual(d.get_asset_class_expenditures("ac"), 100.0)
 
+    def test_for_display_fractional(self):
+        d: Deposit = Deposit()
+        sec: Security = Security(
+            "sec", "SEC", price=10.0, buy_restricted=False
+        )
+        d.add_purchase("ac", Purchase(sec, 1.25))
+        self.assertEqual(d.get_num_shares(), 1.25)
+        self.assertIn("1.25", d.for_display())
+
+    def test_is_fractional(self):
+        d: Deposit = Deposit()
+        sec: Security = Security(
+            "sec", "SEC", price=10.0, buy_restricted=False
+        )
+        d.add_purchase("ac", Purchase(sec, 2))
+        self.assertFalse(d.is_fractional())
+        d.add_purchase("ac", Purchase(sec, 0.5))
+        self.assertTrue(d.is_fractional())
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,174 @@
+# Ricky Galliani
+# Hanna
+# test/fake_broker.py
+
+from fake_broker import FakeBroker, load_recorded, make_account
+from src.api import (
+    HoldingInfo,
+    SecurityInfo,
+    fetch_latest_prices,
+    load_account_profile,
+    load_dividends,
+    load_holdings,
+    load_securities,
+)
+from src.asset_class import AssetClass
+from src.scheduler import RequestScheduler
+from src.security import Security
+from src.session import API_URL, configure_session
+
+from datetime import datetime
+from typing import Any, Dict
+from unittest.mock import patch
+
+import requests
+import robin_stocks as r
+import robin_stocks.helper
+import tempfile
+import time
+import unittest
+
+# Usage: python3 -m unittest --verbose test.fake_broker
+
+
+class FakeBrokerTest(unittest.TestCase):
+    def setUp(self):
+        self.account: Dict[str, Any] = make_account(12, seed=1)
+        self.session: requests.Session = requests.Session()
+        self.patcher = patch.object(
+            robin_stocks.helper, "Session", self.session
+        )
+        self.patcher.start()
+
+    def tearDown(self):
+        robin_stocks.helper.set_login_state(False)
+        self.patcher.stop()
+        self.session.close()
+
+    def start(self, broker: FakeBroker, **kwargs: Any) -> FakeBroker:
+        configure_session(self.session, base_url=broker.start(), **kwargs)
+        self.addCleanup(broker.stop)
+        r.login("fake", "fake")
+        return broker
+
+    def test_make_account(self):
+        self.assertEqual(make_account(12, seed=1), self.account)
+        self.assertEqual(len(self.account["positions"]), 12)
+        account: Dict[str, Any] = make_account(3, 0, ["sec1", "sec2"])
+        self.assertEqual(
+            list(account["instruments"].keys())[:2], ["sec1", "sec2"]
+        )
+
+    def test_pagination(self):
+        broker: FakeBroker = FakeBroker(self.account, page_size=5)
+        (status, resp) = broker.handle("GET", "/positions/?nonzero=true", {})
+        self.assertEqual(status, 200)
+        self.assertEqual(len(resp["results"]), 5)
+        self.assertEqual(resp["next"], API_URL + "/positions/?cursor=5")
+        (_, resp) = broker.handle("GET", "/positions/?cursor=10", {})
+        self.assertEqual(len(resp["results"]), 2)
+        self.assertEqual(resp["next"], None)
+
+    def test_unknown(self):
+        broker: FakeBroker = FakeBroker(self.account)
+        self.assertEqual(broker.handle("GET", "/nope/", {})[0], 404)
+        self.assertEqual(broker.handle("GET", "/instruments/x/", {})[0], 404)
+        (_, resp) = broker.handle("GET", "/quotes/?symbols=FAKE0,NOPE", {})
+        self.assertEqual(resp["results"][1], None)
+
+    def test_missing_quote(self):
+        # An instrument the broker has no quote for
+        sec_id: str = list(self.account["instruments"].keys())[0]
+        del self.account["quotes"]["FAKE0"]
+        self.start(FakeBroker(self.account))
+        self.assertEqual(fetch_latest_prices(["FAKE0"]), {})
+        with tempfile.TemporaryDirectory() as data_dir:
+            securities: Dict[str, SecurityInfo] = load_securities(
+                list(self.account["instruments"].keys()),
+                datetime.now(),
+                True,
+                False,
+                data_dir,
+            )
+        self.assertEqual(len(securities), 11)
+        self.assertTrue(sec_id not in securities)
+
+    def test_loaders(self):
+        self.start(FakeBroker(self.account, page_size=5))
+        with tempfile.TemporaryDirectory() as data_dir:
+            t: datetime = datetime.now()
+            self.assertEqual(
+                load_account_profile(t, True, False).get_buying_power(),
+                1000.0,
+            )
+            built: Dict[str, HoldingInfo] = load_holdings(t, True, False)
+            positions: Dict[str, HoldingInfo] = load_holdings(
+                t, True, False, data_dir, True
+            )
+        self.assertEqual(len(built), 12)
+        self.assertEqual(sorted(built.keys()), sorted(positions.keys()))
+        for (sec_id, hol) in built.items():
+            self.assertEqual(hol.get_symbol(), positions[sec_id].get_symbol())
+            self.assertEqual(hol.get_equity(), positions[sec_id].get_equity())
+        dividends = load_dividends(list(built.keys()), t, True, False)
+        self.assertEqual(
+            round(sum([d.get_amount() for d in dividends.values()]), 2),
+            round(
+                sum([float(d["amount"]) for d in self.account["dividends"]]),
+                2,
+            ),
+        )
+
+    def test_failures_retried(self):
+        broker: FakeBroker = FakeBroker(self.account, error_rate=0.3)
+        self.start(
+            broker,
+            scheduler=RequestScheduler(rate=1000, backoff_base=0.001),
+        )
+        symbols = ["FAKE{}".format(i) for i in range(12)]
+        self.assertEqual(
+            sorted(fetch_latest_prices(symbols, 1).keys()), sorted(symbols)
+        )
+        self.assertTrue(broker.get_requests()["GET quotes"] > 12)
+
+    def test_latency(self):
+        broker: FakeBroker = self.start(FakeBroker(self.account, latency=0.1))
+        s: float = time.monotonic()
+        fetch_latest_prices(["FAKE0"])
+        self.assertTrue(time.monotonic() - s >= 0.1)
+        self.assertEqual(broker.get_requests()["GET quotes"], 1)
+
+    def test_order(self):
+        broker: FakeBroker = self.start(FakeBroker(self.account))
+        sec_id: str = list(self.account["instruments"].keys())[0]
+        quantity: float = float(self.account["positions"][0]["quantity"])
+        sec: Security = Security(sec_id, "FAKE0", "Fake 0", 10.0, False)
+        ac: AssetClass = AssetClass("ac", 1.0)
+        ac.add_security(sec)
+        with patch("builtins.input", return_value="y"):
+            state: str = ac.buy(sec, 2, True)
+        self.assertEqual(state, "confirmed")
+        self.assertEqual(len(broker.get_orders()), 1)
+        self.assertEqual(broker.get_orders()[0]["symbol"], "FAKE0")
+        with tempfile.TemporaryDirectory() as data_dir:
+            holdings: Dict[str, HoldingInfo] = load_holdings(
+                datetime.now(), True, False, data_dir, True
+            )
+        self.assertEqual(holdings[sec_id].get_quantity(), quantity + 2)
+
+    def test_load_recorded(self):
+        with tempfile.TemporaryDirectory() as data_dir:
+            t: datetime = datetime(2019, 1, 1)
+            self.start(FakeBroker(self.account))
+            load_account_profile(t, True, True, data_dir)
+            holdings = load_holdings(t, True, True, data_dir)
+            load_securities(list(holdings.keys()), t, True, True, data_dir)
+            load_dividends(list(holdings.keys()), t, True, True, data_dir)
+            account: Dict[str, Any] = load_recorded(data_dir)
+        self.assertEqual(account["positions"], self.account["positions"])
+        self.assertEqual(account["quotes"], self.account["quotes"])
+        self.assertEqual(account["dividends"], self.account["dividends"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+# Ricky Galliani
+# Hanna
+# test/instrument_cache.py
+
+from src.instrument_cache import InstrumentCache
+
+from datetime import datetime, timedelta
+
+import os
+import tempfile
+import unittest
+
+# Usage: python3 -m unittest --verbose test.instrument_cache
+
+
+class InstrumentCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "data", "instruments.json")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_get_missing(self):
+        cache: InstrumentCache = InstrumentCache(self.path)
+        self.assertIsNone(cache.get("sec"))
+        self.assertEqual(cache.get_hits(), 0)
+        self.assertEqual(cache.get_misses(), 1)
+
+    def test_put_get(self):
+        cache: InstrumentCache = InstrumentCache(self.path)
+        cache.put("sec", "Sec Name", "SEC")
+        self.assertEqual(
+            cache.get("sec"), {"name": "Sec Name", "symbol": "SEC"}
+        )
+        self.assertEqual(cache.get_hits(), 1)
+        self.assertEqual(cache.get_misses(), 0)
+
+    def test_get_by_symbol(self):
+        cache: InstrumentCache = InstrumentCache(self.path)
+        cache.put("sec", "Sec Name", "SEC")
+        self.assertEqual(
+            cache.get_by_symbol("SEC"), {"id": "sec", "name": "Sec Name"}
+        )
+        self.assertIsNone(cache.get_by_symbol("OTHER"))
+
+    def test_expired(self):
+        cache: InstrumentCache = InstrumentCache(self.path, timedelta(days=1))
+        fetched_at: datetime = datetime(2019, 1, 1)
+        cache.put("sec", "Sec Name", "SEC", fetched_at)
+        self.assertIsNotNone(
+            cache.get("sec", fetched_at + timedelta(hours=23))
+        )
+        self.assertIsNone(cache.get("sec", fetched_at + timedelta(hours=25)))
+        self.assertIsNone(
+            cache.get_by_symbol("SEC", fetched_at + timedelta(hours=25))
+        )
+
+    def test_invalidate(self):
+        cache: InstrumentCache = InstrumentCache(self.path)
+        cache.put("sec1", "Sec 1", "SEC1")
+        cache.put("sec2", "Sec 2", "SEC2")
+        cache.invalidate(["sec1"])
+        self.assertIsNone(cache.get("sec1"))
+        self.assertIsNotNone(cache.get("sec2"))
+        cache.invalidate()
+        self.assertEqual(len(cache), 0)
+
+    def test_save_load(self):
+        cache: InstrumentCache = InstrumentCache(self.path)
+        cache.put("sec", "Sec Name", "SEC")
+        cache.save()
+        loaded: InstrumentCache = InstrumentCache(self.path)
+        self.assertEqual(len(loaded), 1)
+        self.assertEqual(
+            loaded.get("sec"), {"name": "Sec Name", "symbol": "SEC"}
+        )
+        self.assertFalse(os.path.exists("{}.tmp".format(self.path)))
+
+
+if __name__ == "__main__":
+    unittest.main()
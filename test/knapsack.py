@@ -0,0 +1,211 @@
+# Ricky Galliani
+# Hanna
+# test/knapsack.py
+
+from src.knapsack import (
+    KnapsackTable,
+    backtrack,
+    backtrack_bitset,
+    backtrack_numpy,
+    build_bitset,
+    build_table,
+    build_table_numpy,
+    grid_prices,
+    leftover_bound,
+    residual_bound,
+    optimality_gap,
+    solve,
+    solve_bnb,
+)
+
+from typing import List
+
+import random
+import unittest
+
+# Usage: python3 -m unittest --verbose test.knapsack
+
+
+class KnapsackTest(unittest.TestCase):
+    def test_build_table(self):
+        self.assertEqual(build_table([3, 5], 8), [0, 0, 0, 3, 3, 5, 6, 6, 8])
+
+    def test_build_table_numpy(self):
+        T = build_table_numpy([3, 5], 8)
+        self.assertEqual(list(T), [0, 0, 0, 3, 3, 5, 6, 6, 8])
+
+    def test_build_table_numpy_matches(self):
+        rng = random.Random(0)
+        for _ in range(50):
+            prices: List[int] = [rng.randint(1, 60) for x in range(4)]
+            budget: int = rng.randint(0, 500)
+            self.assertEqual(
+                list(build_table_numpy(prices, budget)),
+                build_table(prices, budget),
+            )
+
+    def test_backtrack(self):
+        T: List[int] = build_table([3300, 4900], 10000)
+        self.assertEqual(backtrack(T, [3300, 4900], 10000), [3, 0])
+
+    def test_backtrack_does_not_overspend(self):
+        T: List[int] = build_table([2, 3], 5)
+        counts: List[int] = backtrack(T, [2, 3], 5)
+        self.assertEqual(counts[0] * 2 + counts[1] * 3, 5)
+
+    def test_backtrack_numpy_matches(self):
+        rng = random.Random(1)
+        for _ in range(50):
+            prices: List[int] = [rng.randint(1, 60) for x in range(4)]
+            budget: int = rng.randint(0, 500)
+            self.assertEqual(
+                backtrack_numpy(
+                    build_table_numpy(prices, budget), prices, budget
+                ),
+                backtrack(build_table(prices, budget), prices, budget),
+            )
+
+    def test_solve_negative_budget(self):
+        self.assertEqual(solve([10, 20], -5), [0, 0])
+
+    def test_solve_no_prices(self):
+        self.assertEqual(solve([], 100, "numpy"), [])
+
+    def test_solve_unknown_engine(self):
+        self.assertRaises(Exception, solve, [10], 100, "nope")
+
+    def test_build_bitset(self):
+        stages: List[int] = build_bitset([3, 5], 8)
+        self.assertEqual(stages[0], 1)
+        self.assertEqual(stages[1], 0b001001001)
+        self.assertEqual(stages[2], 0b101101001)
+
+    def test_backtrack_bitset(self):
+        stages: List[int] = build_bitset([3300, 4900], 9850)
+        self.assertEqual(backtrack_bitset(stages, [3300, 4900], 9850), [0, 2])
+
+    def test_bitset_spends_optimally(self):
+        rng = random.Random(2)
+        for _ in range(50):
+            prices: List[int] = [rng.randint(1, 60) for x in range(4)]
+            budget: int = rng.randint(0, 500)
+            counts: List[int] = solve(prices, budget, "bitset")
+            spent: int = sum([c * p for (c, p) in zip(counts, prices)])
+            self.assertEqual(spent, build_table(prices, budget)[budget])
+
+    def test_grid_prices(self):
+        self.assertEqual(grid_prices([3300, 4950], 100), [33, 50])
+
+    def test_solve_gcd_is_exact(self):
+        rng = random.Random(3)
+        for _ in range(50):
+            g: int = rng.randint(1, 10)
+            prices: List[int] = [g * rng.randint(1, 30) for x in range(4)]
+            budget: int = rng.randint(0, 1000)
+            T: List[int] = build_table(prices, budget)
+            self.assertEqual(
+                solve(prices, budget), backtrack(T, prices, budget)
+            )
+
+    def test_solve_granularity_within_bound(self):
+        rng = random.Random(4)
+        for _ in range(50):
+            prices: List[int] = [rng.randint(100, 6000) for x in range(4)]
+            budget: int = rng.randint(0, 50000)
+            granularity: int = rng.choice([1, 100, 500])
+            counts: List[int] = solve(prices, budget, "dp", granularity)
+            spent: int = sum([c * p for (c, p) in zip(counts, prices)])
+            self.assertTrue(spent <= budget)
+            self.assertTrue(
+                budget - spent <= leftover_bound(prices, budget, granularity)
+            )
+
+    def test_solve_granularity_residual(self):
+        # 6 units at the rounded up 1500, then 3 more on the exact grid
+        self.assertEqual(solve([1025], 10000, "dp", 500), [9])
+        self.assertEqual(leftover_bound([1025], 10000, 500), 1024)
+
+    def test_table_granularity_residual(self):
+        rng = random.Random(5)
+        prices: List[int] = [rng.randint(100, 6000) for x in range(4)]
+        table: KnapsackTable = KnapsackTable(prices, 50000, "numpy", 500)
+        for budget in range(0, 50001, 250):
+            counts: List[int] = table.solve(budget)
+            spent: int = sum([c * p for (c, p) in zip(counts, prices)])
+            self.assertTrue(spent <= budget)
+            self.assertTrue(budget - spent < min(prices))
+
+    def test_residual_bound(self):
+        self.assertEqual(residual_bound([1025], 10000, 500), 3000)
+        self.assertEqual(residual_bound([1025], 100, 500), 100)
+        self.assertEqual(residual_bound([1025], 10000, 1000), 4000)
+
+    def test_table_granularity_cheap_security(self):
+        # A cheap security is bought so often its rounding would otherwise
+        # make the residual table grow with the budget
+        prices: List[int] = [101, 5003, 7001]
+        exact: KnapsackTable = KnapsackTable(prices, 2000000, "dp")
+        coarse: KnapsackTable = KnapsackTable(prices, 2000000, "dp", 100)
+        self.assertEqual(exact.get_size(), 2000001)
+        self.assertTrue(coarse.get_size() < exact.get_size() // 50)
+        for budget in [0, 99, 150000, 1999999, 2000000]:
+            counts: List[int] = coarse.solve(budget)
+            spent: int = sum([c * p for (c, p) in zip(counts, prices)])
+            self.assertTrue(0 <= budget - spent < 101)
+
+    def test_leftover_bound_exact(self):
+        self.assertEqual(leftover_bound([3300, 4900], 10000), 3299)
+
+    def test_leftover_bound_no_prices(self):
+        self.assertEqual(leftover_bound([], 10000, 100), 10000)
+
+    def test_solve_bad_granularity(self):
+        self.assertRaises(Exception, solve, [10], 100, "dp", 0)
+
+    def test_solve_bnb(self):
+        self.assertEqual(solve_bnb([3300, 4900], 10000), [3, 0])
+        self.assertEqual(solve_bnb([3300, 4900], 9850), [0, 2])
+
+    def test_solve_bnb_large_budget(self):
+        prices: List[int] = [5123, 8711, 20345, 3307, 12099, 7850]
+        budget: int = 100000000000
+        counts: List[int] = solve_bnb(prices, budget)
+        spent: int = sum([c * p for (c, p) in zip(counts, prices)])
+        self.assertTrue(spent <= budget)
+        self.assertEqual(optimality_gap(prices, budget, counts), 0)
+
+    def test_solve_bnb_within_gap(self):
+        rng = random.Random(5)
+        for _ in range(50):
+            prices: List[int] = [rng.randint(100, 6000) for x in range(4)]
+            budget: int = rng.randint(0, 100000)
+            counts: List[int] = solve_bnb(prices, budget)
+            spent: int = sum([c * p for (c, p) in zip(counts, prices)])
+            optimal: int = build_table(prices, budget)[budget]
+            self.assertTrue(spent <= optimal)
+            gap: int = optimality_gap(prices, budget, counts)
+            self.assertTrue(optimal - spent <= gap)
+
+    def test_solve_auto_uses_bnb(self):
+        prices: List[int] = [3300, 4900]
+        self.assertEqual(
+            solve(prices, 100000, "auto", 1, 50000),
+            solve_bnb(prices, 100000),
+        )
+
+    def test_knapsack_table_smaller_budgets(self):
+        prices: List[int] = [3300, 4900, 1250]
+        for engine in ["dp", "numpy", "bitset", "bnb"]:
+            table: KnapsackTable = KnapsackTable(prices, 20000, engine)
+            for budget in [0, 999, 9850, 10000, 20000]:
+                self.assertEqual(
+                    table.solve(budget), solve(prices, budget, engine)
+                )
+
+    def test_knapsack_table_budget_too_large(self):
+        table: KnapsackTable = KnapsackTable([3300, 4900], 10000)
+        self.assertRaises(Exception, table.solve, 10001)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -6,21 +6,44 @@ from onboard import (
     ask_allow_purchase,
     ask_asset_class_name,
     ask_confirm_security,
+    ask_security,
     ask_target_pct,
 )
 
+from src.instrument_cache import InstrumentCache
+
 from unittest.mock import patch
 
+import os
+import tempfile
 import unittest
 
 # Usage: python3 -m unittest --verbose test.onboard
 
 
 class OnboardTest(unittest.TestCase):
-    @patch("onboard.ask_user_input", return_value="y")
-    def test_ask_security(self, _):
-        # TODO: can't call get_instruments_by_symbol() offline
-        pass
+    @patch(
+        "onboard.r.get_instruments_by_symbols",
+        return_value=[{"id": "sec", "name": "Sec Name", "symbol": "SEC"}],
+    )
+    @patch("onboard.ask_user_input", return_value="SEC")
+    def test_ask_security(self, _, __):
+        self.assertEqual(ask_security("ac"), ("sec", "Sec Name"))
+
+    @patch(
+        "onboard.r.get_instruments_by_symbols",
+        return_value=[{"id": "sec", "name": "Sec Name", "symbol": "SEC"}],
+    )
+    @patch("onboard.ask_user_input", return_value="SEC")
+    def test_ask_security_cache(self, _, instruments):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache: InstrumentCache = InstrumentCache(
+                os.path.join(cache_dir, "instruments.json")
+            )
+            self.assertEqual(ask_security("ac", cache), ("sec", "Sec Name"))
+            self.assertEqual(ask_security("ac", cache), ("sec", "Sec Name"))
+            self.assertEqual(instruments.call_count, 1)
+            self.assertEqual(cache.get_hits(), 1)
 
     @patch("onboard.ask_user_input", return_value="y")
     def test_ask_confirm_security_y(self, _):
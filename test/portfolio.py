@@ -10,11 +10,52 @@ from src.portfolio import Portfolio
 from src.purchase import Purchase
 from src.security import Security
 
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+from unittest.mock import patch
+
+import time
 import unittest
 
 # Usage: python3 -m unittest --verbose test.portfolio
 
 
+def fake_load_profile(*args: Any, **kwargs: Any) -> AccountProfile:
+    time.sleep(0.05)
+    return AccountProfile(78.68)
+
+
+def fake_load_holdings(*args: Any, **kwargs: Any) -> Dict[str, HoldingInfo]:
+    time.sleep(0.1)
+    return {
+        "sec1": HoldingInfo(
+            "sec1", "sec1_name", 10.0, 1, 10.0, 10.0, 0.33, 0.0, 0.0, "SEC1"
+        ),
+        "sec2": HoldingInfo(
+            "sec2", "sec2_name", 20.0, 1, 20.0, 20.0, 0.66, 0.0, 0.0, "SEC2"
+        ),
+    }
+
+
+def fake_load_securities(
+    security_ids: List[str], *args: Any, **kwargs: Any
+) -> Dict[str, SecurityInfo]:
+    time.sleep(0.1)
+    return dict(
+        [
+            (sec_id, SecurityInfo(sec_id, sec_id.upper(), price))
+            for (sec_id, price) in zip(security_ids, [10.0, 20.0])
+        ]
+    )
+
+
+def fake_load_dividends(
+    security_ids: List[str], *args: Any, **kwargs: Any
+) -> Dict[str, DividendInfo]:
+    time.sleep(0.15)
+    return {"sec1": DividendInfo("sec1", 10.0)}
+
+
 class PortfolioTest(unittest.TestCase):
     def test_add_asset_class(self):
         p: Portfolio = Portfolio()
@@ -429,6 +470,242 @@ class PortfolioTest(unittest.TestCase):
         self.assertEqual(p.get_value(), 24.0)
         self.assertEqual(p.get_num_shares(), 2)
 
+    @patch("src.asset_class.r.order_buy_limit")
+    def test_make_deposit_fractional(self, order):
+        p: Portfolio = Portfolio()
+        sec: Security = Security("sec", "SEC", "sec_name", 10.0, False)
+        ac: AssetClass = AssetClass("ac", 1.0)
+        ac.add_security(sec)
+        p.add_asset_class(ac)
+        p.set_cash(25.0)
+        deposit: Deposit = p.plan_deposit(25.0, fractional=True)
+        self.assertTrue(deposit.is_fractional())
+        self.assertRaises(Exception, p.make_deposit, deposit, True)
+        self.assertEqual(order.call_count, 0)
+        self.assertEqual(p.get_cash(), 25.0)
+        # Offline, the fractional shares are only recorded
+        p.make_deposit(deposit, False)
+        self.assertEqual(p.get_num_shares(), deposit.get_num_shares())
+
+    def test_plan_deposit_numpy_engine(self):
+        p: Portfolio = Portfolio()
+        sec1: Security = Security("sec1", "SEC1", "sec1_name", 10.0, False)
+        sec2: Security = Security("sec2", "SEC2", "sec2_name", 20.0, False)
+        ac1: AssetClass = AssetClass("ac1", 0.4)
+        ac2: AssetClass = AssetClass("ac2", 0.6)
+        ac1.add_security(sec1)
+        ac2.add_security(sec2)
+        ac1.add_holding(Holding(sec1, 3, 10.0))
+        ac2.add_holding(Holding(sec2, 2, 20.0))
+        p.add_asset_class(ac1)
+        p.add_asset_class(ac2)
+        p.set_cash(35.0)
+        self.assertEqual(p.plan_deposit(35.0, "numpy"), p.plan_deposit(35.0))
+
+    def test_plan_deposit_granularity(self):
+        p: Portfolio = Portfolio()
+        sec: Security = Security("sec1", "SEC1", "sec1_name", 10.25, False)
+        ac: AssetClass = AssetClass("ac", 1.0)
+        ac.add_security(sec)
+        p.add_asset_class(ac)
+        p.set_cash(1000.0)
+        # $10.25 is planned as $15, so 6 shares fit, and the $38.50 left
+        # over buys 3 more on the exact grid
+        deposit: Deposit = p.plan_deposit(100.0, granularity=5.0)
+        self.assertEqual(deposit.get_total(), 92.25)
+        p_exact: Deposit = p.plan_deposit(100.0)
+        self.assertEqual(p_exact.get_total(), 92.25)
+
+    def test_plan_deposit_joint(self):
+        p: Portfolio = Portfolio()
+        sec1: Security = Security("sec1", "SEC1", "sec1_name", 32.0, False)
+        sec2: Security = Security("sec2", "SEC2", "sec2_name", 22.0, False)
+        sec3: Security = Security("sec3", "SEC3", "sec3_name", 58.0, False)
+        ac1: AssetClass = AssetClass("ac1", 0.4)
+        ac2: AssetClass = AssetClass("ac2", 0.3)
+        ac3: AssetClass = AssetClass("ac3", 0.3)
+        ac1.add_security(sec1)
+        ac2.add_security(sec2)
+        ac3.add_security(sec3)
+        ac1.add_holding(Holding(sec1, 4, 32.0))
+        ac2.add_holding(Holding(sec2, 2, 22.0))
+        ac3.add_holding(Holding(sec3, 7, 58.0))
+        p.add_asset_class(ac1)
+        p.add_asset_class(ac2)
+        p.add_asset_class(ac3)
+        p.set_cash(108.0)
+        sequential: Deposit = p.plan_deposit(108.0)
+        self.assertEqual(sequential.get_total(), 88.0)
+        joint: Deposit = p.plan_deposit(108.0, joint=True)
+        self.assertEqual(joint.get_total(), 98.0)
+        self.assertEqual(
+            joint.get_purchases_for_asset_class("ac1"), [Purchase(sec1, 1)]
+        )
+        self.assertEqual(
+            joint.get_purchases_for_asset_class("ac2"), [Purchase(sec2, 3)]
+        )
+
+    def test_plan_deposit_joint_no_time(self):
+        p: Portfolio = Portfolio()
+        sec1: Security = Security("sec1", "SEC1", "sec1_name", 24.0, False)
+        sec2: Security = Security("sec2", "SEC2", "sec2_name", 26.0, False)
+        ac1: AssetClass = AssetClass("ac1", 0.5)
+        ac2: AssetClass = AssetClass("ac2", 0.5)
+        ac1.add_security(sec1)
+        ac2.add_security(sec2)
+        ac1.add_holding(Holding(sec1, 7, 24.0))
+        ac2.add_holding(Holding(sec2, 7, 26.0))
+        p.add_asset_class(ac1)
+        p.add_asset_class(ac2)
+        p.set_cash(68.0)
+        sequential: Deposit = p.plan_deposit(68.0)
+        joint: Deposit = p.plan_deposit(68.0, joint=True, time_budget=0.0)
+        self.assertEqual(joint, sequential)
+
+    def test_plan_deposit_sweep(self):
+        p: Portfolio = Portfolio()
+        sec1: Security = Security("sec1", "SEC1", "sec1_name", 10.0, False)
+        sec2: Security = Security("sec2", "SEC2", "sec2_name", 20.0, False)
+        ac1: AssetClass = AssetClass("ac1", 0.4)
+        ac2: AssetClass = AssetClass("ac2", 0.6)
+        ac1.add_security(sec1)
+        ac2.add_security(sec2)
+        ac1.add_holding(Holding(sec1, 3, 10.0))
+        ac2.add_holding(Holding(sec2, 2, 20.0))
+        p.add_asset_class(ac1)
+        p.add_asset_class(ac2)
+        p.set_cash(500.0)
+        amounts: List[float] = [35.0, 100.0, 250.0, 1000.0]
+        deposits: List[Deposit] = p.plan_deposit_sweep(amounts)
+        self.assertEqual(len(deposits), len(amounts))
+        for (amount, deposit) in zip(amounts, deposits):
+            self.assertEqual(deposit, p.plan_deposit(amount))
+
+    def test_plan_deposit_cache(self):
+        p: Portfolio = Portfolio()
+        sec1: Security = Security("sec1", "SEC1", "sec1_name", 10.0, False)
+        sec2: Security = Security("sec2", "SEC2", "sec2_name", 20.0, False)
+        ac1: AssetClass = AssetClass("ac1", 0.4)
+        ac2: AssetClass = AssetClass("ac2", 0.6)
+        ac1.add_security(sec1)
+        ac2.add_security(sec2)
+        p.add_asset_class(ac1)
+        p.add_asset_class(ac2)
+        account_profile = AccountProfile(100.0)
+        security_info = {
+            "sec1": SecurityInfo("sec1_name", "SEC1", 10.0),
+            "sec2": SecurityInfo("sec2_name", "SEC2", 20.0),
+        }
+        holding_info = {
+            "sec1": HoldingInfo(
+                "sec1", "sec1_name", 10.0, 3, 10.0, 30.0, 0.4, 0.0, 0.0
+            ),
+            "sec2": HoldingInfo(
+                "sec2", "sec2_name", 20.0, 2, 20.0, 40.0, 0.6, 0.0, 0.0
+            ),
+        }
+        dividend_info = {
+            "sec1": DividendInfo("sec1", 0.0),
+            "sec2": DividendInfo("sec2", 0.0),
+        }
+        p.update(account_profile, security_info, holding_info, dividend_info)
+        first: Deposit = p.plan_deposit(100.0)
+        self.assertEqual(p.get_plan_cache_hits(), 0)
+        misses: int = p.get_plan_cache_misses()
+        p.update(account_profile, security_info, holding_info, dividend_info)
+        self.assertEqual(p.plan_deposit(100.0), first)
+        self.assertEqual(p.get_plan_cache_hits(), misses)
+        self.assertEqual(p.get_plan_cache_misses(), misses)
+
+    def test_plan_deposit_fractional(self):
+        p: Portfolio = Portfolio()
+        sec1: Security = Security("sec1", "SEC1", "sec1_name", 33.0, False)
+        sec2: Security = Security("sec2", "SEC2", "sec2_name", 49.0, False)
+        ac1: AssetClass = AssetClass("ac1", 0.5)
+        ac2: AssetClass = AssetClass("ac2", 0.5)
+        ac1.add_security(sec1)
+        ac2.add_security(sec2)
+        p.add_asset_class(ac1)
+        p.add_asset_class(ac2)
+        p.set_cash(100.0)
+        deposit: Deposit = p.plan_deposit(100.0, fractional=True)
+        self.assertTrue(100.0 - deposit.get_total() < 0.0001)
+        self.assertEqual(deposit.get_num_shares(), 3.030303)
+        self.assertEqual(p.get_plan_cache_misses(), 0)
+        self.assertEqual(
+            p.plan_deposit(100.0, joint=True, fractional=True), deposit
+        )
+
+    @patch("src.portfolio.load_dividends", side_effect=fake_load_dividends)
+    @patch("src.portfolio.load_securities", side_effect=fake_load_securities)
+    @patch("src.portfolio.load_holdings", side_effect=fake_load_holdings)
+    @patch("src.portfolio.load_account_profile", side_effect=fake_load_profile)
+    def test_refresh_pipeline(self, _, __, ___, ____):
+        p: Portfolio = Portfolio()
+        ac: AssetClass = AssetClass("ac", 1.0)
+        ac.add_security(Security("sec1"))
+        ac.add_security(Security("sec2"))
+        p.add_asset_class(ac)
+        s: datetime = datetime.now()
+        p.refresh(False, False)
+        # The stages take 0.4 s one after another
+        self.assertTrue((datetime.now() - s).total_seconds() < 0.3)
+        self.assertEqual(p.get_cash(), 78.68)
+        self.assertEqual(p.get_value(), 108.68)
+        self.assertEqual(p.get_dividends(), 10.0)
+        timings: Dict[str, Tuple[float, float]] = p.get_refresh_timings()
+        self.assertEqual(
+            sorted(timings.keys()),
+            ["account profile", "dividends", "holdings", "securities"],
+        )
+        self.assertTrue(timings["securities"][0] >= timings["holdings"][1])
+        self.assertTrue(timings["dividends"][0] < timings["holdings"][1])
+        self.assertEqual(
+            p.get_refresh_critical_path(), ["holdings", "securities"]
+        )
+
+    def test_refresh_critical_path_empty(self):
+        self.assertEqual(Portfolio().get_refresh_critical_path(), [])
+
+    @patch("src.portfolio.load_dividends", side_effect=fake_load_dividends)
+    @patch("src.portfolio.load_securities", side_effect=fake_load_securities)
+    @patch("src.portfolio.load_holdings", side_effect=fake_load_holdings)
+    @patch("src.portfolio.load_account_profile", side_effect=fake_load_profile)
+    def test_refresh_from_holdings(self, _, __, securities, ___):
+        p: Portfolio = Portfolio()
+        ac: AssetClass = AssetClass("ac", 1.0)
+        for sec_id in ["sec1", "sec2", "sec3"]:
+            ac.add_security(Security(sec_id))
+        p.add_asset_class(ac)
+        p.refresh(False, False, "data", True)
+        (security_ids, *_, derived) = securities.call_args[0]
+        self.assertEqual(security_ids, ["sec1", "sec2", "sec3"])
+        self.assertEqual(sorted(derived.keys()), ["sec1", "sec2"])
+        self.assertEqual(derived["sec2"]["price"], ["20.0"])
+
+    def test_update_unheld_securities(self):
+        p: Portfolio = Portfolio()
+        ac: AssetClass = AssetClass("ac", 1.0)
+        ac.add_security(Security("sec1"))
+        ac.add_security(Security("sec2"))
+        p.add_asset_class(ac)
+        security_info = {
+            "sec1": SecurityInfo("sec1_name", "SEC1", 10.0),
+            "sec2": SecurityInfo("sec2_name", "SEC2", 20.0),
+        }
+        holding_info = {
+            "sec1": HoldingInfo(
+                "sec1", "sec1_name", 10.0, 1, 10.0, 10.0, 1.0, 0.0, 0.0
+            )
+        }
+        dividend_info = {"sec1": DividendInfo("sec1", 0.0)}
+        account_profile = AccountProfile(5.0)
+        p.update(account_profile, security_info, holding_info, dividend_info)
+        self.assertEqual(ac.get_security("sec2").get_price(), 20.0)
+        self.assertEqual(ac.get_security("sec2").get_symbol(), "SEC2")
+        self.assertFalse(ac.contains_holding("sec2"))
+        self.assertEqual(p.get_configured_security_ids(), ["sec1", "sec2"])
+
 
 if __name__ == "__main__":
     unittest.main()
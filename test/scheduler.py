@@ -0,0 +1,101 @@
+# Ricky Galliani
+# Hanna
+# test/scheduler.py
+
+from src.scheduler import (
+    BACKGROUND_PRIORITY,
+    DEFAULT_PRIORITY,
+    ORDER_PRIORITY,
+    RequestScheduler,
+    get_priority,
+    priority,
+)
+
+from typing import List
+
+import threading
+import time
+import unittest
+
+# Usage: python3 -m unittest --verbose test.scheduler
+
+
+class SchedulerTest(unittest.TestCase):
+    def test_priority(self):
+        self.assertEqual(get_priority(), DEFAULT_PRIORITY)
+        with priority(ORDER_PRIORITY):
+            self.assertEqual(get_priority(), ORDER_PRIORITY)
+            with priority(BACKGROUND_PRIORITY):
+                self.assertEqual(get_priority(), BACKGROUND_PRIORITY)
+            self.assertEqual(get_priority(), ORDER_PRIORITY)
+        self.assertEqual(get_priority(), DEFAULT_PRIORITY)
+
+    def test_priority_is_per_thread(self):
+        seen: List[int] = []
+        with priority(ORDER_PRIORITY):
+            t = threading.Thread(target=lambda: seen.append(get_priority()))
+            t.start()
+            t.join()
+        self.assertEqual(seen, [DEFAULT_PRIORITY])
+
+    def test_burst(self):
+        scheduler: RequestScheduler = RequestScheduler(rate=1.0, burst=5)
+        for _ in range(5):
+            self.assertTrue(scheduler.acquire() < 0.05)
+        self.assertEqual(scheduler.get_requests(), 5)
+        self.assertEqual(scheduler.get_queue_depth(), 0)
+
+    def test_rate(self):
+        scheduler: RequestScheduler = RequestScheduler(rate=20.0, burst=1)
+        s: float = time.monotonic()
+        for _ in range(5):
+            scheduler.acquire()
+        # The first request spends the burst, the other 4 wait 0.05 s each
+        self.assertTrue(time.monotonic() - s >= 0.19)
+        self.assertTrue(scheduler.get_max_wait() >= 0.04)
+        self.assertTrue(scheduler.get_total_wait() >= 0.19)
+
+    def test_orders_go_first(self):
+        scheduler: RequestScheduler = RequestScheduler(rate=5.0, burst=1)
+        scheduler.acquire()
+        sent: List[str] = []
+
+        def send(name: str, level: int) -> None:
+            scheduler.acquire(level)
+            sent.append(name)
+
+        background = threading.Thread(
+            target=send, args=("quotes", BACKGROUND_PRIORITY)
+        )
+        background.start()
+        while scheduler.get_queue_depth() < 1:
+            time.sleep(0.001)
+        order = threading.Thread(target=send, args=("order", ORDER_PRIORITY))
+        order.start()
+        background.join()
+        order.join()
+        self.assertEqual(sent, ["order", "quotes"])
+        self.assertEqual(scheduler.get_max_queue_depth(), 2)
+
+    def test_should_retry(self):
+        scheduler: RequestScheduler = RequestScheduler(max_retries=2)
+        self.assertTrue(scheduler.should_retry("GET", 429, 0))
+        self.assertTrue(scheduler.should_retry("GET", 503, 1))
+        self.assertFalse(scheduler.should_retry("GET", 503, 2))
+        self.assertFalse(scheduler.should_retry("GET", 404, 0))
+        self.assertTrue(scheduler.should_retry("POST", 429, 0))
+        self.assertFalse(scheduler.should_retry("POST", 500, 0))
+
+    def test_backoff(self):
+        scheduler: RequestScheduler = RequestScheduler(
+            backoff_base=0.5, backoff_cap=3.0
+        )
+        for attempt in range(6):
+            delay: float = scheduler.backoff(attempt)
+            self.assertTrue(0 <= delay <= min(3.0, 0.5 * (2 ** attempt)))
+        self.assertTrue(scheduler.backoff(0, 2.0) >= 2.0)
+        self.assertEqual(scheduler.get_retries(), 7)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,178 @@
+# Ricky Galliani
+# Hanna
+# test/session.py
+
+from src.scheduler import RequestScheduler
+from src.session import PooledAdapter, configure_session
+
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from unittest.mock import patch
+
+import json
+import requests
+import robin_stocks.helper
+import threading
+import time
+import unittest
+
+# Usage: python3 -m unittest --verbose test.session
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    # Keep connections open between requests, like the real API
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    # Requests seen per path
+    hits: Dict[str, int] = {}
+
+    def do_GET(self):
+        hits: int = StandInHandler.hits.get(self.path, 0) + 1
+        StandInHandler.hits[self.path] = hits
+        if self.path.startswith("/slow/"):
+            time.sleep(0.5)
+        status: int = 200
+        if self.path.startswith("/fail/"):
+            # /fail/<status>/<times>/... fails the first <times> requests
+            (_, _, code, times) = self.path.split("/")[:4]
+            if hits <= int(times):
+                status = int(code)
+        body: bytes = json.dumps(
+            {"path": self.path, "connection": self.headers["Connection"]}
+        ).encode()
+        try:
+            self.send_response(status)
+            if status == 429:
+                self.send_header("Retry-After", "0")
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client timed out before the response was ready
+            pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.do_GET()
+
+    def log_message(self, *args):
+        pass
+
+
+class SessionTest(unittest.TestCase):
+    def setUp(self):
+        StandInHandler.hits = {}
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+        self.url = "http://127.0.0.1:{}".format(self.server.server_port)
+        threading.Thread(
+            target=self.server.serve_forever, args=(0.05,)
+        ).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connections_reused(self):
+        session: requests.Session = requests.Session()
+        adapter: PooledAdapter = configure_session(session)
+        for i in range(5):
+            resp = session.get("{}/{}".format(self.url, i))
+            self.assertEqual(resp.json()["path"], "/{}".format(i))
+        self.assertEqual(adapter.get_requests(), 5)
+        self.assertEqual(adapter.get_connections_opened(), 1)
+        self.assertEqual(adapter.get_connections_reused(), 4)
+        session.close()
+
+    def test_no_keep_alive(self):
+        session: requests.Session = requests.Session()
+        adapter: PooledAdapter = configure_session(session, keep_alive=False)
+        for i in range(3):
+            resp = session.get("{}/{}".format(self.url, i))
+            self.assertEqual(resp.json()["connection"], "close")
+        self.assertEqual(adapter.get_connections_opened(), 3)
+        self.assertEqual(adapter.get_connections_reused(), 0)
+        session.close()
+
+    def test_pool_size(self):
+        session: requests.Session = requests.Session()
+        adapter: PooledAdapter = configure_session(session, pool_maxsize=4)
+        urls: List[str] = ["{}/{}".format(self.url, i) for i in range(4)]
+        for _ in range(3):
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                list(pool.map(session.get, urls))
+        self.assertEqual(adapter.get_requests(), 12)
+        self.assertTrue(adapter.get_connections_opened() <= 4)
+        session.close()
+
+    def test_default_timeout(self):
+        session: requests.Session = requests.Session()
+        configure_session(session, timeout=(1.0, 0.1))
+        self.assertRaises(
+            requests.exceptions.Timeout,
+            session.get,
+            "{}/slow/1".format(self.url),
+        )
+        resp = session.get("{}/slow/2".format(self.url), timeout=2.0)
+        self.assertEqual(resp.status_code, 200)
+        session.close()
+
+    def test_robin_stocks_uses_session(self):
+        session: requests.Session = requests.Session()
+        adapter: PooledAdapter = configure_session(session)
+        with patch.object(robin_stocks.helper, "Session", session):
+            for i in range(3):
+                data = robin_stocks.helper.request_get(
+                    "{}/{}".format(self.url, i)
+                )
+                self.assertEqual(data["path"], "/{}".format(i))
+        self.assertEqual(adapter.get_requests(), 3)
+        self.assertEqual(adapter.get_connections_opened(), 1)
+        session.close()
+
+    def test_throttled_requests_retried(self):
+        session: requests.Session = requests.Session()
+        scheduler: RequestScheduler = RequestScheduler(backoff_base=0.01)
+        adapter: PooledAdapter = configure_session(
+            session, scheduler=scheduler
+        )
+        resp = session.get("{}/fail/429/2/quotes".format(self.url))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(StandInHandler.hits["/fail/429/2/quotes"], 3)
+        self.assertEqual(scheduler.get_requests(), 3)
+        self.assertEqual(scheduler.get_retries(), 2)
+        self.assertEqual(adapter.get_connections_opened(), 1)
+        session.close()
+
+    def test_retries_give_up(self):
+        session: requests.Session = requests.Session()
+        scheduler: RequestScheduler = RequestScheduler(
+            max_retries=1, backoff_base=0.01
+        )
+        configure_session(session, scheduler=scheduler)
+        resp = session.get("{}/fail/503/5/quotes".format(self.url))
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(StandInHandler.hits["/fail/503/5/quotes"], 2)
+        session.close()
+
+    def test_failed_orders_not_retried(self):
+        session: requests.Session = requests.Session()
+        scheduler: RequestScheduler = RequestScheduler(backoff_base=0.01)
+        configure_session(session, scheduler=scheduler)
+        resp = session.post(
+            "{}/fail/500/1/orders".format(self.url), data={"side": "buy"}
+        )
+        self.assertEqual(resp.status_code, 500)
+        self.assertEqual(StandInHandler.hits["/fail/500/1/orders"], 1)
+        resp = session.post(
+            "{}/fail/429/1/orders".format(self.url), data={"side": "buy"}
+        )
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(StandInHandler.hits["/fail/429/1/orders"], 2)
+        session.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,447 @@
+# Ricky Galliani
+# Hanna
+# test/snapshot_store.py
+
+from fake_broker import FakeBroker, make_account
+from src.api import load_account_profile, load_dividends, load_holdings
+from src.portfolio import Portfolio, iter_history
+from src.session import configure_session
+from src.snapshot_store import (
+    PUT_BATCH_SIZE,
+    READ_SIZE,
+    SNAPSHOT_CODECS,
+    SNAPSHOT_DB,
+    TREE_FILE_FORMAT,
+    Payload,
+    SnapshotBundle,
+    SnapshotStore,
+    bundle_times,
+    codec_of,
+    decode,
+    encode,
+    iter_records,
+    load_bundle,
+    load_snapshot,
+    migrate_tree,
+    save_bundle,
+    save_snapshot,
+    tree_snapshots,
+)
+from test.batch import write_snapshot
+
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from unittest.mock import patch
+
+import itertools
+import json
+import os
+import requests
+import robin_stocks as r
+import robin_stocks.helper
+import sqlite3
+import tempfile
+import unittest
+
+# Usage: python3 -m unittest --verbose test.snapshot_store
+
+CONFIG: List[Dict[str, Any]] = [
+    {
+        "name": "ac",
+        "target_percentage": 1.0,
+        "securities": ["sec1", "sec2"],
+        "buy_restrictions": [],
+    }
+]
+
+
+def make_bundle(t: datetime, day: int) -> SnapshotBundle:
+    """
+    Returns a bundle of a refresh on the given day, with 10 dollars of cash
+    and a share of sec1 more than the day before.
+    """
+    return SnapshotBundle(
+        t,
+        {
+            "account_profile": {
+                "margin_balances": {"unallocated_margin_cash": str(10 * day)}
+            },
+            "holdings": [
+                {
+                    "id": sec_id,
+                    "name": sec_id,
+                    "price": price,
+                    "quantity": str(quantity),
+                    "average_buy_price": price,
+                    "equity": str(quantity * float(price)),
+                    "percentage": "50.0",
+                    "percent_change": "0.0",
+                    "equity_change": "0.0",
+                }
+                for (sec_id, price, quantity) in [
+                    ("sec1", "33.0", day),
+                    ("sec2", "49.0", 1),
+                ]
+            ],
+            "securities": {
+                "sec1": {"name": "sec1", "symbol": "SEC1", "price": ["33.0"]},
+                "sec2": {"name": "sec2", "symbol": "SEC2", "price": ["49.0"]},
+            },
+            "dividends": [],
+        },
+    )
+
+
+class SnapshotStoreTest(unittest.TestCase):
+    def test_put_and_get(self):
+        with tempfile.TemporaryDirectory() as data_dir:
+            path: str = os.path.join(data_dir, "store", SNAPSHOT_DB)
+            with SnapshotStore(path) as store:
+                self.assertEqual(store.latest("holdings"), None)
+                store.put("holdings", datetime(2019, 1, 2), [{"id": "b"}])
+                store.put("holdings", datetime(2019, 1, 1), [{"id": "a"}])
+                store.put("dividends", datetime(2019, 1, 3), [])
+            with SnapshotStore(path) as store:
+                self.assertEqual(len(store), 3)
+                self.assertEqual(
+                    store.get("holdings", datetime(2019, 1, 1)), [{"id": "a"}]
+                )
+                self.assertEqual(
+                    store.get("holdings", datetime(2019, 1, 3)), None
+                )
+                self.assertEqual(
+                    store.latest("holdings"),
+                    (datetime(2019, 1, 2), [{"id": "b"}]),
+                )
+                self.assertEqual(
+                    store.get_times("holdings"),
+                    [datetime(2019, 1, 1), datetime(2019, 1, 2)],
+                )
+
+    def test_put_same_second(self):
+        with tempfile.TemporaryDirectory() as data_dir:
+            t: datetime = datetime(2019, 1, 1, 0, 0, 0, 100)
+            save_snapshot(data_dir, "dividends", t, [{"amount": "1.0"}])
+            save_snapshot(
+                data_dir, "dividends", t.replace(microsecond=900), []
+            )
+            self.assertEqual(load_snapshot(data_dir, "dividends"), [])
+            with SnapshotStore(os.path.join(data_dir, SNAPSHOT_DB)) as store:
+                self.assertEqual(len(store), 1)
+
+    def test_load_snapshot_from_tree(self):
+        with tempfile.TemporaryDirectory() as data_dir:
+            self.assertRaises(
+                Exception, load_snapshot, data_dir, "account_profile"
+            )
+            write_snapshot(
+                data_dir,
+                "account_profile",
+                {"margin_balances": {"unallocated_margin_cash": "5.0"}},
+            )
+            self.assertEqual(
+                load_account_profile(
+                    datetime.now(), False, False, data_dir
+                ).get_buying_power(),
+                5.0,
+            )
+            # Snapshots in the store are newer than any in the tree
+            save_snapshot(
+                data_dir,
+                "account_profile",
+                datetime(2018, 1, 1),
+                {"margin_balances": {"unallocated_margin_cash": "7.0"}},
+            )
+            self.assertEqual(
+                load_account_profile(
+                    datetime.now(), False, False, data_dir
+                ).get_buying_power(),
+                7.0,
+            )
+
+    def test_migrate_tree(self):
+        with tempfile.TemporaryDirectory() as data_dir:
+            write_snapshot(data_dir, "dividends", [{"amount": "1.0"}])
+            write_snapshot(data_dir, "holdings", [])
+            with open(os.path.join(data_dir, "dividends", "notes"), "w") as f:
+                f.write("not a snapshot")
+            with SnapshotStore(os.path.join(data_dir, SNAPSHOT_DB)) as store:
+                self.assertEqual(migrate_tree(data_dir, store), 2)
+                self.assertEqual(
+                    store.latest("dividends"),
+                    (datetime(2019, 1, 1), [{"amount": "1.0"}]),
+                )
+                self.assertEqual(store.get_times("securities"), [])
+
+    def test_put_many_batches(self):
+        def snapshots(n: int) -> Iterator[Tuple[datetime, Any]]:
+            # Newest first, so the latest one is in the first batch
+            for i in range(n):
+                yield (datetime(2019, 1, 1) - timedelta(minutes=i), [i])
+            raise Exception("snapshots(): Failed past the last batch")
+
+        with tempfile.TemporaryDirectory() as data_dir:
+            with SnapshotStore(os.path.join(data_dir, SNAPSHOT_DB)) as store:
+                # Nothing is committed unless every batch is written
+                self.assertRaises(
+                    Exception, store.put_many, "dividends", snapshots(100)
+                )
+                self.assertEqual(len(store), 0)
+                self.assertEqual(store.latest("dividends"), None)
+                n: int = 2 * PUT_BATCH_SIZE + 1
+                self.assertEqual(
+                    store.put_many(
+                        "dividends", itertools.islice(snapshots(n), n)
+                    ),
+                    n,
+                )
+                self.assertEqual(len(store), n)
+                self.assertEqual(
+                    store.latest("dividends"), (datetime(2019, 1, 1), [0])
+                )
+
+    def test_tree_snapshots_order(self):
+        with tempfile.TemporaryDirectory() as data_dir:
+            for day in [3, 10, 1]:
+                t: datetime = datetime(2019, 1, day)
+                tree_dir: str = os.path.join(
+                    data_dir, "holdings", t.strftime("%Y/%m/%d/%H/%M/%S")
+                )
+                os.makedirs(tree_dir)
+                with open(
+                    os.path.join(tree_dir, t.strftime(TREE_FILE_FORMAT)), "w"
+                ) as f:
+                    f.write(json.dumps([day]))
+            self.assertEqual(
+                [resp for (_, resp) in tree_snapshots(data_dir, "holdings")],
+                [[1], [3], [10]],
+            )
+
+    def test_latest_manifest(self):
+        with tempfile.TemporaryDirectory() as data_dir:
+            path: str = os.path.join(data_dir, SNAPSHOT_DB)
+            with SnapshotStore(path) as store:
+                store.put("holdings", datetime(2019, 1, 2), [{"id": "b"}])
+                # An older snapshot doesn't move the manifest back
+                store.put("holdings", datetime(2019, 1, 1), [{"id": "a"}])
+            conn: sqlite3.Connection = sqlite3.connect(path)
+            self.assertEqual(
+                conn.execute("SELECT kind, t FROM latest").fetchall(),
+                [("holdings", "2019-01-02 00:00:00")],
+            )
+            with SnapshotStore(path, readonly=True) as store:
+                self.assertEqual(
+                    store.latest("holdings"),
+                    (datetime(2019, 1, 2), [{"id": "b"}]),
+                )
+            # A stale manifest falls back to searching the snapshots
+            with conn:
+                conn.execute("DELETE FROM snapshots WHERE t > '2019-01-02'")
+            self.assertEqual(
+                load_snapshot(data_dir, "holdings"), [{"id": "a"}]
+            )
+            with conn:
+                conn.execute("DROP TABLE latest")
+            conn.close()
+            self.assertEqual(
+                load_snapshot(data_dir, "holdings"), [{"id": "a"}]
+            )
+
+    def test_bundle(self):
+        with tempfile.TemporaryDirectory() as data_dir:
+            self.assertEqual(load_bundle(data_dir), None)
+            bundle: SnapshotBundle = SnapshotBundle(datetime(2019, 1, 1))
+            bundle.put("holdings", [{"id": "a"}])
+            self.assertRaises(Exception, save_bundle, data_dir, bundle)
+            self.assertRaises(Exception, bundle.get, "dividends")
+            for kind in ["account_profile", "securities", "dividends"]:
+                bundle.put(kind, {})
+            save_bundle(data_dir, bundle)
+            # A later partial write doesn't change the latest bundle
+            save_snapshot(data_dir, "holdings", datetime(2019, 1, 2), [])
+            self.assertEqual(load_snapshot(data_dir, "holdings"), [])
+            loaded: Optional[SnapshotBundle] = load_bundle(data_dir)
+            self.assertEqual(loaded.get_time(), datetime(2019, 1, 1))
+            self.assertEqual(loaded.get_snapshots(), bundle.get_snapshots())
+
+    def test_refresh_bundle(self):
+        account: Dict[str, Any] = make_account(4, seed=3)
+        config: List[Dict[str, Any]] = [
+            {
+                "name": "ac",
+                "target_percentage": 1.0,
+                "securities": list(account["instruments"].keys()),
+                "buy_restrictions": [],
+            }
+        ]
+        p: Portfolio = Portfolio()
+        p.load_configuration(config)
+        broker: FakeBroker = FakeBroker(account)
+        with tempfile.TemporaryDirectory() as data_dir:
+            with patch.object(
+                robin_stocks.helper, "Session", requests.Session()
+            ):
+                configure_session(base_url=broker.start())
+                r.login("fake", "fake")
+                p.refresh(True, True, data_dir)
+                broker.stop()
+            robin_stocks.helper.set_login_state(False)
+            with SnapshotStore(os.path.join(data_dir, SNAPSHOT_DB)) as store:
+                self.assertEqual(len(store), 4)
+            # A later partial write isn't paired with the rest of the bundle
+            save_snapshot(
+                data_dir, "holdings", datetime.now() + timedelta(seconds=1), []
+            )
+            offline: Portfolio = Portfolio()
+            offline.load_configuration(config)
+            offline.refresh(False, False, data_dir)
+        self.assertEqual(offline.get_value(), p.get_value())
+        self.assertEqual(offline.get_cash(), 1000.0)
+
+    def test_bundle_at(self):
+        with tempfile.TemporaryDirectory() as data_dir:
+            for day in [1, 3]:
+                save_bundle(data_dir, make_bundle(datetime(2019, 1, day), day))
+            self.assertEqual(load_bundle(data_dir, datetime(2018, 1, 1)), None)
+            for (as_of, day) in [
+                (datetime(2019, 1, 1), 1),
+                (datetime(2019, 1, 2, 23, 59), 1),
+                (datetime(2019, 1, 3), 3),
+                (datetime(2020, 1, 1), 3),
+            ]:
+                bundle: Optional[SnapshotBundle] = load_bundle(data_dir, as_of)
+                self.assertEqual(bundle.get_time(), datetime(2019, 1, day))
+            self.assertEqual(
+                bundle_times(
+                    data_dir, datetime(2019, 1, 1), datetime(2019, 1, 2)
+                ),
+                [datetime(2019, 1, 1)],
+            )
+
+    def test_index_bundles(self):
+        with tempfile.TemporaryDirectory() as data_dir:
+            for (kind, resp) in make_bundle(
+                datetime(2019, 1, 1), 1
+            ).get_snapshots().items():
+                write_snapshot(data_dir, kind, resp)
+            # Not a bundle, since the other kinds weren't taken then
+            save_snapshot(data_dir, "holdings", datetime(2019, 1, 2), [])
+            with SnapshotStore(os.path.join(data_dir, SNAPSHOT_DB)) as store:
+                self.assertEqual(migrate_tree(data_dir, store), 4)
+                self.assertEqual(store.index_bundles(), 0)
+            self.assertEqual(
+                load_bundle(data_dir).get_time(), datetime(2019, 1, 1)
+            )
+
+    def test_refresh_as_of(self):
+        with tempfile.TemporaryDirectory() as data_dir:
+            for day in [1, 2, 3]:
+                save_bundle(data_dir, make_bundle(datetime(2019, 1, day), day))
+            p: Portfolio = Portfolio()
+            p.load_configuration(CONFIG)
+            p.refresh(False, False, data_dir, as_of=datetime(2019, 1, 2, 12))
+            self.assertEqual(p.get_cash(), 20.0)
+            self.assertEqual(p.get_value(), 20.0 + 2 * 33.0 + 49.0)
+            self.assertRaises(
+                Exception,
+                p.refresh,
+                False,
+                False,
+                data_dir,
+                as_of=datetime(2018, 1, 1),
+            )
+            self.assertRaises(
+                Exception, p.refresh, True, False, as_of=datetime(2019, 1, 1)
+            )
+            history: Iterator[Tuple[datetime, Portfolio]] = iter_history(
+                CONFIG, datetime(2019, 1, 2), datetime(2019, 1, 3), data_dir
+            )
+            (t, first) = next(history)
+            self.assertEqual(t, datetime(2019, 1, 2))
+            self.assertEqual(first.get_cash(), 20.0)
+            self.assertEqual(
+                [(t, p.get_cash()) for (t, p) in history],
+                [(datetime(2019, 1, 3), 30.0)],
+            )
+
+    def test_encode(self):
+        for resp in [[{"a": 1}, None, "b"], {"x": [1, 2], "y": {}}, 3.5, []]:
+            for codec in SNAPSHOT_CODECS:
+                payload: Payload = encode(resp, codec)
+                self.assertEqual(codec_of(payload), codec)
+                self.assertEqual(decode(payload), resp)
+        self.assertEqual(
+            list(iter_records(encode({"x": [1], "y": 2}, "gzip"))),
+            [("x", [1]), ("y", 2)],
+        )
+        self.assertEqual(list(iter_records(encode(3.5, "xz"))), [3.5])
+        self.assertEqual(
+            list(iter_records(encode({"x": 1}, "json"))), [("x", 1)]
+        )
+        self.assertRaises(Exception, encode, [], "zip")
+        self.assertRaises(Exception, codec_of, b"PK")
+
+    def test_iter_records_streams(self):
+        # Records cut across the chunks read_lines() decompresses
+        resp: List[Dict[str, Any]] = [
+            {"id": i, "name": "x" * (i % 97)} for i in range(30000)
+        ]
+        payload: Payload = encode(resp, "gzip")
+        self.assertTrue(len(json.dumps(resp)) > 2 * READ_SIZE)
+        records: Iterator[Any] = iter_records(payload)
+        self.assertEqual(next(records), resp[0])
+        self.assertEqual(list(records), resp[1:])
+        self.assertEqual(list(iter_records(encode(resp, "xz"))), resp)
+
+    def test_codecs(self):
+        with tempfile.TemporaryDirectory() as data_dir:
+            path: str = os.path.join(data_dir, SNAPSHOT_DB)
+            self.assertRaises(Exception, SnapshotStore, path, codec="zip")
+            save_snapshot(
+                data_dir, "holdings", datetime(2019, 1, 1), [], "json"
+            )
+            save_bundle(data_dir, make_bundle(datetime(2019, 1, 2), 2), "xz")
+            save_snapshot(
+                data_dir,
+                "dividends",
+                datetime(2019, 1, 3),
+                [{"instrument": "https://x/instruments/sec1/", "amount": "2"}],
+            )
+            self.assertEqual(
+                load_dividends(
+                    ["sec2"], datetime.now(), False, False, data_dir
+                )["sec1"].get_amount(),
+                2.0,
+            )
+            self.assertEqual(
+                load_holdings(datetime.now(), False, False, data_dir)[
+                    "sec1"
+                ].get_quantity(),
+                2.0,
+            )
+            bundle: Optional[SnapshotBundle] = load_bundle(data_dir)
+            self.assertEqual(
+                [h["id"] for h in bundle.records("holdings")], ["sec1", "sec2"]
+            )
+            self.assertEqual(
+                bundle.get_snapshots(),
+                make_bundle(datetime(2019, 1, 2), 2).get_snapshots(),
+            )
+            with SnapshotStore(path, codec="gzip") as store:
+                self.assertEqual(store.recode(), 5)
+                self.assertEqual(store.recode(), 0)
+                self.assertEqual(
+                    store.get("holdings", datetime(2019, 1, 1)), []
+                )
+            conn: sqlite3.Connection = sqlite3.connect(path)
+            payloads: List[Payload] = [
+                row[0] for row in conn.execute("SELECT payload FROM snapshots")
+            ]
+            self.assertEqual(
+                set([codec_of(payload) for payload in payloads]), set(["gzip"])
+            )
+            conn.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,7 +2,14 @@
 # Hanna
 # test/util.py
 
-from src.util import dollar_str, difference_in_millis, latency_str, pct_str
+from src.util import (
+    dollar_str,
+    difference_in_millis,
+    latency_str,
+    pct_str,
+    shares_str,
+    timed,
+)
 
 from datetime import datetime, timedelta
 
@@ -27,3 +34,14 @@ class UtilTest(unittest.TestCase):
         start = datetime(2019, 1, 1)
         end = start + timedelta(milliseconds=1000)
         self.assertEqual(latency_str(start, end), "1000 ms")
+
+    def test_shares_str(self):
+        self.assertEqual(shares_str(3), "3")
+        self.assertEqual(shares_str(1200), "1,200")
+        self.assertEqual(shares_str(1.5151516), "1.515152")
+        self.assertEqual(shares_str(0.25), "0.25")
+
+    def test_timed(self):
+        (result, start, end) = timed(max, 3, 5)
+        self.assertEqual(result, 5)
+        self.assertTrue(start <= end)